@@ -1,16 +1,202 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Path, Query, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List, Optional
-from datetime import datetime
+from typing import Dict, List, Optional, Tuple, Union
+import broadcast
 import crud
+import export
+import ingest
 import schemas
 import models
+import pagination
+import reports
+import responses
+from cache import TodayState
 from database import get_db
 
 router = APIRouter(prefix="/api/attendance", tags=["attendance"])
 
 
-@router.post("/check-in", response_model=schemas.AttendanceRecord, status_code=status.HTTP_201_CREATED)
+# 签到/签退与员工当前状态冲突时的错误信息
+TRANSITION_ERRORS = {
+    models.AttendanceTypeEnum.CHECK_IN: "Already checked in today. Please check out first.",
+    models.AttendanceTypeEnum.CHECK_OUT: "Please check in first before checking out.",
+}
+
+
+def _ensure_active(state: Optional[TodayState]):
+    if state is None:
+        raise HTTPException(status_code=404, detail="Employee not found")
+    
+    if not state.is_active:
+        raise HTTPException(status_code=400, detail="Employee is not active")
+
+
+def ensure_can_check_in(state: Optional[TodayState]):
+    """校验员工可以签到（员工存在、在职、今天未处于签到状态）"""
+    _ensure_active(state)
+    
+    # 检查今天是否已经签到
+    if state.attendance_type == models.AttendanceTypeEnum.CHECK_IN:
+        raise HTTPException(status_code=400, detail=TRANSITION_ERRORS[models.AttendanceTypeEnum.CHECK_IN])
+
+
+def ensure_can_check_out(state: Optional[TodayState]):
+    """校验员工可以签退（员工存在、在职、今天已签到）"""
+    _ensure_active(state)
+    
+    # 检查今天是否已经签到
+    if state.attendance_type != models.AttendanceTypeEnum.CHECK_IN:
+        raise HTTPException(status_code=400, detail=TRANSITION_ERRORS[models.AttendanceTypeEnum.CHECK_OUT])
+
+
+def status_response(employee_id: int, state: Optional[TodayState]) -> dict:
+    """构造今日考勤状态响应"""
+    if state is None:
+        raise HTTPException(status_code=404, detail="Employee not found")
+    
+    if state.attendance_type is None:
+        return {
+            "employee_id": employee_id,
+            "status": "not_checked_in",
+            "last_action": None,
+            "last_timestamp": None
+        }
+    
+    return {
+        "employee_id": employee_id,
+        "status": "checked_in" if state.attendance_type == models.AttendanceTypeEnum.CHECK_IN else "checked_out",
+        "last_action": state.attendance_type,
+        "last_timestamp": state.timestamp
+    }
+
+
+def queued_response(event: dict) -> JSONResponse:
+    """缓冲写入模式下的响应（202，事件已写入本地日志，稍后批量写库）"""
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content=jsonable_encoder(schemas.AttendanceQueued(**event))
+    )
+
+
+def validate_compact_records(
+    records: List[models.AttendanceRecord]
+) -> Tuple[List[schemas.AttendanceRecord], Dict[int, schemas.Employee]]:
+    """校验考勤记录和记录涉及的员工：每个员工只校验一次（邮箱校验开销较大）"""
+    employees: Dict[int, schemas.Employee] = {}
+    result = []
+    for record in records:
+        if record.employee_id not in employees:
+            employees[record.employee_id] = schemas.Employee.model_validate(record.employee)
+        result.append(schemas.AttendanceRecord.model_validate(record))
+    return result, employees
+
+
+def monthly_stats_response(
+    counts: Dict[models.AttendanceTypeEnum, int],
+    records: List[models.AttendanceRecord],
+    compact: bool
+) -> Response:
+    """月度统计响应（记录已校验，直接编码返回，跳过 response_model 的二次校验）"""
+    validated, employees = validate_compact_records(records)
+    stats = {
+        "total_records": sum(counts.values()),
+        "check_in_count": counts[models.AttendanceTypeEnum.CHECK_IN],
+        "check_out_count": counts[models.AttendanceTypeEnum.CHECK_OUT],
+    }
+    if compact:
+        return responses.json_response(
+            schemas.AttendanceStatsCompactResponse(**stats, records=validated, employees=employees)
+        )
+    
+    # 两部分都已校验，直接组装，同一员工的记录共享员工对象
+    records_with_employee = [
+        schemas.AttendanceRecordWithEmployee.model_construct(**record.__dict__, employee=employees[record.employee_id])
+        for record in validated
+    ]
+    return responses.json_response(schemas.AttendanceStatsResponse(**stats, records=records_with_employee))
+
+
+def evaluate_batch(
+    events: List[schemas.AttendanceRecordCreate],
+    employees: Dict[int, models.Employee],
+    last_types: Dict[int, models.AttendanceTypeEnum]
+) -> Tuple[List[schemas.AttendanceBatchResult], List[Tuple[int, schemas.AttendanceRecordCreate]]]:
+    """按顺序校验批量事件，返回 (每个事件的结果, 通过校验的 (序号, 事件))，last_types 会随之更新"""
+    results = []
+    accepted = []
+    for index, event in enumerate(events):
+        employee = employees.get(event.employee_id)
+        last_type = last_types.get(event.employee_id)
+        detail = None
+        if not employee:
+            detail = "Employee not found"
+        elif not employee.is_active:
+            detail = "Employee is not active"
+        elif event.attendance_type == models.AttendanceTypeEnum.CHECK_IN:
+            if last_type == models.AttendanceTypeEnum.CHECK_IN:
+                detail = TRANSITION_ERRORS[event.attendance_type]
+        elif last_type != models.AttendanceTypeEnum.CHECK_IN:
+            detail = TRANSITION_ERRORS[event.attendance_type]
+        
+        if detail is None:
+            last_types[event.employee_id] = event.attendance_type
+            accepted.append((index, event))
+        results.append(schemas.AttendanceBatchResult(
+            index=index,
+            employee_id=event.employee_id,
+            attendance_type=event.attendance_type,
+            success=detail is None,
+            detail=detail
+        ))
+    return results, accepted
+
+
+def apply_batch_rows(
+    results: List[schemas.AttendanceBatchResult],
+    accepted: List[Tuple[int, schemas.AttendanceRecordCreate]],
+    rows: List[Optional[dict]]
+) -> int:
+    """把写入结果回填到批量结果中（写入时与并发请求冲突的事件改为拒绝），返回写入条数"""
+    written = 0
+    for (index, event), row in zip(accepted, rows):
+        if row is None:
+            results[index].success = False
+            results[index].detail = TRANSITION_ERRORS[event.attendance_type]
+        else:
+            results[index].timestamp = row["timestamp"]
+            written += 1
+    return written
+
+
+def submit_batch(
+    events: List[schemas.AttendanceRecordCreate],
+    employees: Dict[int, models.Employee],
+    last_types: Dict[int, models.AttendanceTypeEnum]
+) -> Tuple[List[schemas.AttendanceBatchResult], int]:
+    """缓冲写入模式下的批量签到/签退：叠加缓冲中尚未写库的事件后校验，通过的事件写入本地日志，
+    返回 (每个事件的结果, 接受条数)"""
+    results = []
+    accepted = []
+    
+    def evaluate(overlaid: Dict[int, models.AttendanceTypeEnum]) -> List[dict]:
+        # 在缓冲锁内执行，期间不会有其他事件插入
+        batch_results, batch_accepted = evaluate_batch(events, employees, overlaid)
+        results.extend(batch_results)
+        accepted.extend(batch_accepted)
+        return [event.model_dump() for _, event in batch_accepted]
+    
+    queued = ingest.ingest_buffer.submit_batch(employees.keys(), last_types, evaluate)
+    return results, apply_batch_rows(results, accepted, queued)
+
+
+@router.post(
+    "/check-in",
+    response_model=schemas.AttendanceRecord,
+    status_code=status.HTTP_201_CREATED,
+    responses={202: {"model": schemas.AttendanceQueued}}
+)
 def check_in(
     employee_id: int,
     latitude: Optional[str] = None,
@@ -19,23 +205,8 @@ def check_in(
     db: Session = Depends(get_db)
 ):
     """员工签到"""
-    # 检查员工是否存在
-    employee = crud.get_employee(db, employee_id=employee_id)
-    if not employee:
-        raise HTTPException(status_code=404, detail="Employee not found")
-    
-    if not employee.is_active:
-        raise HTTPException(status_code=400, detail="Employee is not active")
-    
-    # 检查今天是否已经签到
-    last_record = crud.get_today_last_record(db, employee_id=employee_id)
-    if last_record and last_record.attendance_type == models.AttendanceTypeEnum.CHECK_IN:
-        raise HTTPException(
-            status_code=400,
-            detail="Already checked in today. Please check out first."
-        )
-    
-    # 创建签到记录
+    # 今日状态通常命中缓存，无需查询数据库
+    state = crud.get_today_state(db, employee_id=employee_id)
     record = schemas.AttendanceRecordCreate(
         employee_id=employee_id,
         attendance_type=models.AttendanceTypeEnum.CHECK_IN,
@@ -43,10 +214,25 @@ def check_in(
         longitude=longitude,
         notes=notes
     )
-    return crud.create_attendance_record(db=db, record=record)
+    if ingest.ingest_buffer.enabled:
+        # 叠加尚未写库的事件后校验，写入本地日志即返回
+        return queued_response(ingest.ingest_buffer.submit(state, record.model_dump(), ensure_can_check_in))
+    
+    # 检查员工状态并创建签到记录
+    ensure_can_check_in(state)
+    db_record = crud.create_attendance_record(db=db, record=record)
+    if db_record is None:
+        # 并发请求抢先完成了同一次状态切换
+        raise HTTPException(status_code=400, detail=TRANSITION_ERRORS[models.AttendanceTypeEnum.CHECK_IN])
+    return db_record
 
 
-@router.post("/check-out", response_model=schemas.AttendanceRecord, status_code=status.HTTP_201_CREATED)
+@router.post(
+    "/check-out",
+    response_model=schemas.AttendanceRecord,
+    status_code=status.HTTP_201_CREATED,
+    responses={202: {"model": schemas.AttendanceQueued}}
+)
 def check_out(
     employee_id: int,
     latitude: Optional[str] = None,
@@ -55,23 +241,8 @@ def check_out(
     db: Session = Depends(get_db)
 ):
     """员工签退"""
-    # 检查员工是否存在
-    employee = crud.get_employee(db, employee_id=employee_id)
-    if not employee:
-        raise HTTPException(status_code=404, detail="Employee not found")
-    
-    if not employee.is_active:
-        raise HTTPException(status_code=400, detail="Employee is not active")
-    
-    # 检查今天是否已经签到
-    last_record = crud.get_today_last_record(db, employee_id=employee_id)
-    if not last_record or last_record.attendance_type == models.AttendanceTypeEnum.CHECK_OUT:
-        raise HTTPException(
-            status_code=400,
-            detail="Please check in first before checking out."
-        )
-    
-    # 创建签退记录
+    # 今日状态通常命中缓存，无需查询数据库
+    state = crud.get_today_state(db, employee_id=employee_id)
     record = schemas.AttendanceRecordCreate(
         employee_id=employee_id,
         attendance_type=models.AttendanceTypeEnum.CHECK_OUT,
@@ -79,79 +250,155 @@ def check_out(
         longitude=longitude,
         notes=notes
     )
-    return crud.create_attendance_record(db=db, record=record)
+    if ingest.ingest_buffer.enabled:
+        # 叠加尚未写库的事件后校验，写入本地日志即返回
+        return queued_response(ingest.ingest_buffer.submit(state, record.model_dump(), ensure_can_check_out))
+    
+    # 检查员工状态并创建签退记录
+    ensure_can_check_out(state)
+    db_record = crud.create_attendance_record(db=db, record=record)
+    if db_record is None:
+        # 并发请求抢先完成了同一次状态切换
+        raise HTTPException(status_code=400, detail=TRANSITION_ERRORS[models.AttendanceTypeEnum.CHECK_OUT])
+    return db_record
+
+
+@router.post("/batch", response_model=schemas.AttendanceBatchResponse)
+def batch_attendance(batch: schemas.AttendanceBatchRequest, db: Session = Depends(get_db)):
+    """批量签到/签退（闸机、考勤机批量上报），按顺序逐条校验，合法事件在一个事务内写入（缓冲写入模式下写入本地日志）"""
+    employee_ids = {event.employee_id for event in batch.events}
+    employees = crud.get_employees_by_ids(db, employee_ids)
+    last_types = crud.get_today_last_types(db, employees.keys())
+    if ingest.ingest_buffer.enabled:
+        # 按叠加了缓冲中事件的状态校验，合法事件写入本地日志（数据库中的状态行还没有这些事件）
+        results, written = submit_batch(batch.events, employees, last_types)
+    else:
+        results, accepted = evaluate_batch(batch.events, employees, last_types)
+        rows = crud.create_attendance_records_bulk(db, [event for _, event in accepted])
+        written = apply_batch_rows(results, accepted, rows)
+    
+    return schemas.AttendanceBatchResponse(
+        accepted=written,
+        rejected=len(results) - written,
+        results=results
+    )
 
 
 @router.get("/records", response_model=List[schemas.AttendanceRecord])
 def get_attendance_records(
+    response: Response,
     employee_id: Optional[int] = None,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    """获取考勤记录"""
-    records = crud.get_attendance_records(db, employee_id=employee_id, skip=skip, limit=limit)
-    return records
+    """获取考勤记录（支持 cursor 游标分页，下一页游标通过 X-Next-Cursor 响应头返回）
+    
+    只包含 attendance_records 中的记录，不包含已归档的月份（请使用月度查询或导出接口）。
+    """
+    before = None
+    if cursor:
+        try:
+            before = pagination.decode_record_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    records = crud.get_attendance_records(db, employee_id=employee_id, skip=skip, limit=limit, before=before)
+    if limit > 0 and len(records) == limit:
+        last = records[-1]
+        response.headers["X-Next-Cursor"] = pagination.encode_record_cursor(last.timestamp, last.id)
+    return responses.trusted_list_response(schemas.AttendanceRecord, records, headers=response.headers)
 
 
-@router.get("/monthly/{year}/{month}", response_model=schemas.AttendanceStatsResponse)
+@router.get(
+    "/monthly/{year}/{month}",
+    response_model=Union[schemas.AttendanceStatsResponse, schemas.AttendanceStatsCompactResponse]
+)
 def get_monthly_attendance(
-    year: int,
-    month: int,
+    year: int = Path(..., ge=1, lt=9999),
+    month: int = Path(..., ge=1, le=12),
     employee_id: Optional[int] = None,
+    include_records: bool = True,
+    compact: bool = False,
     db: Session = Depends(get_db)
 ):
-    """获取月度考勤统计"""
-    records = crud.get_monthly_attendance_records(db, year=year, month=month, employee_id=employee_id)
+    """获取月度考勤统计（include_records=false 时只返回统计数字；compact=true 时员工信息单独返回）"""
+    counts = crud.get_monthly_attendance_counts(db, year=year, month=month, employee_id=employee_id)
     
-    check_in_count = sum(1 for r in records if r.attendance_type == models.AttendanceTypeEnum.CHECK_IN)
-    check_out_count = sum(1 for r in records if r.attendance_type == models.AttendanceTypeEnum.CHECK_OUT)
+    records = []
+    if include_records:
+        # 员工信息已随记录一并加载
+        records = crud.get_monthly_attendance_records(db, year=year, month=month, employee_id=employee_id)
+    return monthly_stats_response(counts, records, compact)
+
+
+@router.get("/summary/{year}/{month}", response_model=schemas.MonthlySummaryResponse)
+def get_monthly_summary(
+    year: int = Path(..., ge=1, lt=9999),
+    month: int = Path(..., ge=1, le=12),
+    employee_id: Optional[int] = None,
+    include_days: bool = True,
+    db: Session = Depends(get_db)
+):
+    """获取月度考勤汇总（读取每日汇总表，不扫描原始考勤记录）"""
+    employees = crud.get_employee_monthly_summaries(db, year=year, month=month, employee_id=employee_id)
+    days = crud.get_daily_summaries(db, year=year, month=month, employee_id=employee_id) if include_days else []
+    return responses.json_response(schemas.MonthlySummaryResponse(
+        year=year,
+        month=month,
+        employees=employees,
+        days=days
+    ))
+
+
+@router.get("/report/{year}/{month}", response_model=schemas.WorkReportResponse)
+def get_work_report(
+    year: int = Path(..., ge=1, lt=9999),
+    month: int = Path(..., ge=1, le=12),
+    employee_id: Optional[int] = None,
+    include_days: bool = True,
+    db: Session = Depends(get_db)
+):
+    """获取月度工时和迟到/早退报表（按当前激活的工作时间计算）"""
+    schedule = crud.get_cached_active_work_schedule(db)
+    if schedule is None:
+        raise HTTPException(status_code=404, detail="No active work schedule found")
     
-    # 加载员工信息
-    records_with_employee = []
-    for record in records:
-        employee = crud.get_employee(db, record.employee_id)
-        record_dict = {
-            "id": record.id,
-            "employee_id": record.employee_id,
-            "attendance_type": record.attendance_type,
-            "timestamp": record.timestamp,
-            "latitude": record.latitude,
-            "longitude": record.longitude,
-            "notes": record.notes,
-            "created_at": record.created_at,
-            "employee": employee
-        }
-        records_with_employee.append(schemas.AttendanceRecordWithEmployee(**record_dict))
+    report = reports.monthly_work_report(
+        db, year, month, schedule, employee_id=employee_id, include_days=include_days
+    )
+    return responses.orjson_response(report)
+
+
+@router.get("/monthly/{year}/{month}/export")
+def export_monthly_attendance(
+    year: int = Path(..., ge=1, lt=9999),
+    month: int = Path(..., ge=1, le=12),
+    employee_id: Optional[int] = None,
+    export_format: str = Query("csv", alias="format", pattern="^(csv|ndjson)$"),
+    db: Session = Depends(get_db)
+):
+    """流式导出月度考勤记录（CSV 或 NDJSON）"""
+    rows = crud.iter_monthly_attendance_rows(db, year=year, month=month, employee_id=employee_id)
+    return export.export_response(export.iter_export(rows, export_format), export_format, year, month)
+
+
+@router.get("/stream")
+async def stream_attendance_events(last_event_id: Optional[str] = Header(None)):
+    """订阅考勤事件推送（Server-Sent Events，每次签到/签退推送一条 attendance 事件）
     
-    return schemas.AttendanceStatsResponse(
-        total_records=len(records),
-        check_in_count=check_in_count,
-        check_out_count=check_out_count,
-        records=records_with_employee
+    浏览器断线重连时带 Last-Event-ID，不补发错过的事件，而是先推送 resync 让客户端重新拉取。
+    """
+    return StreamingResponse(
+        broadcast.broadcaster.stream(resync=last_event_id is not None),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
 
 @router.get("/status/{employee_id}")
 def get_attendance_status(employee_id: int, db: Session = Depends(get_db)):
     """获取员工今日考勤状态"""
-    employee = crud.get_employee(db, employee_id=employee_id)
-    if not employee:
-        raise HTTPException(status_code=404, detail="Employee not found")
-    
-    last_record = crud.get_today_last_record(db, employee_id=employee_id)
-    
-    if not last_record:
-        return {
-            "employee_id": employee_id,
-            "status": "not_checked_in",
-            "last_action": None,
-            "last_timestamp": None
-        }
-    
-    return {
-        "employee_id": employee_id,
-        "status": "checked_in" if last_record.attendance_type == models.AttendanceTypeEnum.CHECK_IN else "checked_out",
-        "last_action": last_record.attendance_type,
-        "last_timestamp": last_record.timestamp
-    }
+    state = crud.get_today_state(db, employee_id=employee_id)
+    return status_response(employee_id, ingest.ingest_buffer.overlay(employee_id, state))
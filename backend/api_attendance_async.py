@@ -0,0 +1,231 @@
+"""
+考勤 API（异步版本，ASYNC_DB 模式下使用）
+
+接口与 api_attendance 一致，校验逻辑复用同步路由中的函数。
+"""
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Response, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Union
+import crud_async
+import export
+import ingest
+import schemas
+import models
+import pagination
+import reports
+import responses
+from api_attendance import (
+    TRANSITION_ERRORS, apply_batch_rows, ensure_can_check_in, ensure_can_check_out, evaluate_batch,
+    monthly_stats_response, queued_response, status_response, stream_attendance_events, submit_batch
+)
+from database import get_async_db
+
+router = APIRouter(prefix="/api/attendance", tags=["attendance"])
+
+
+@router.post(
+    "/check-in",
+    response_model=schemas.AttendanceRecord,
+    status_code=status.HTTP_201_CREATED,
+    responses={202: {"model": schemas.AttendanceQueued}}
+)
+async def check_in(
+    employee_id: int,
+    latitude: Optional[str] = None,
+    longitude: Optional[str] = None,
+    notes: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """员工签到"""
+    state = await crud_async.get_today_state(db, employee_id=employee_id)
+    record = schemas.AttendanceRecordCreate(
+        employee_id=employee_id,
+        attendance_type=models.AttendanceTypeEnum.CHECK_IN,
+        latitude=latitude,
+        longitude=longitude,
+        notes=notes
+    )
+    if ingest.ingest_buffer.enabled:
+        # 写日志需要 fsync，放到线程池中执行
+        return queued_response(await run_in_threadpool(
+            ingest.ingest_buffer.submit, state, record.model_dump(), ensure_can_check_in
+        ))
+    
+    ensure_can_check_in(state)
+    db_record = await crud_async.create_attendance_record(db=db, record=record)
+    if db_record is None:
+        # 并发请求抢先完成了同一次状态切换
+        raise HTTPException(status_code=400, detail=TRANSITION_ERRORS[models.AttendanceTypeEnum.CHECK_IN])
+    return db_record
+
+
+@router.post(
+    "/check-out",
+    response_model=schemas.AttendanceRecord,
+    status_code=status.HTTP_201_CREATED,
+    responses={202: {"model": schemas.AttendanceQueued}}
+)
+async def check_out(
+    employee_id: int,
+    latitude: Optional[str] = None,
+    longitude: Optional[str] = None,
+    notes: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """员工签退"""
+    state = await crud_async.get_today_state(db, employee_id=employee_id)
+    record = schemas.AttendanceRecordCreate(
+        employee_id=employee_id,
+        attendance_type=models.AttendanceTypeEnum.CHECK_OUT,
+        latitude=latitude,
+        longitude=longitude,
+        notes=notes
+    )
+    if ingest.ingest_buffer.enabled:
+        # 写日志需要 fsync，放到线程池中执行
+        return queued_response(await run_in_threadpool(
+            ingest.ingest_buffer.submit, state, record.model_dump(), ensure_can_check_out
+        ))
+    
+    ensure_can_check_out(state)
+    db_record = await crud_async.create_attendance_record(db=db, record=record)
+    if db_record is None:
+        # 并发请求抢先完成了同一次状态切换
+        raise HTTPException(status_code=400, detail=TRANSITION_ERRORS[models.AttendanceTypeEnum.CHECK_OUT])
+    return db_record
+
+
+@router.post("/batch", response_model=schemas.AttendanceBatchResponse)
+async def batch_attendance(batch: schemas.AttendanceBatchRequest, db: AsyncSession = Depends(get_async_db)):
+    """批量签到/签退（闸机、考勤机批量上报），按顺序逐条校验，合法事件在一个事务内写入（缓冲写入模式下写入本地日志）"""
+    employee_ids = {event.employee_id for event in batch.events}
+    employees = await crud_async.get_employees_by_ids(db, employee_ids)
+    last_types = await crud_async.get_today_last_types(db, employees.keys())
+    if ingest.ingest_buffer.enabled:
+        # 写日志需要 fsync，放到线程池中执行
+        results, written = await run_in_threadpool(submit_batch, batch.events, employees, last_types)
+    else:
+        results, accepted = evaluate_batch(batch.events, employees, last_types)
+        rows = await crud_async.create_attendance_records_bulk(db, [event for _, event in accepted])
+        written = apply_batch_rows(results, accepted, rows)
+    
+    return schemas.AttendanceBatchResponse(
+        accepted=written,
+        rejected=len(results) - written,
+        results=results
+    )
+
+
+@router.get("/records", response_model=List[schemas.AttendanceRecord])
+async def get_attendance_records(
+    response: Response,
+    employee_id: Optional[int] = None,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """获取考勤记录（支持 cursor 游标分页，下一页游标通过 X-Next-Cursor 响应头返回）
+    
+    只包含 attendance_records 中的记录，不包含已归档的月份（请使用月度查询或导出接口）。
+    """
+    before = None
+    if cursor:
+        try:
+            before = pagination.decode_record_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    records = await crud_async.get_attendance_records(db, employee_id=employee_id, skip=skip, limit=limit, before=before)
+    if limit > 0 and len(records) == limit:
+        last = records[-1]
+        response.headers["X-Next-Cursor"] = pagination.encode_record_cursor(last.timestamp, last.id)
+    return responses.trusted_list_response(schemas.AttendanceRecord, records, headers=response.headers)
+
+
+@router.get(
+    "/monthly/{year}/{month}",
+    response_model=Union[schemas.AttendanceStatsResponse, schemas.AttendanceStatsCompactResponse]
+)
+async def get_monthly_attendance(
+    year: int = Path(..., ge=1, lt=9999),
+    month: int = Path(..., ge=1, le=12),
+    employee_id: Optional[int] = None,
+    include_records: bool = True,
+    compact: bool = False,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """获取月度考勤统计（include_records=false 时只返回统计数字；compact=true 时员工信息单独返回）"""
+    counts = await crud_async.get_monthly_attendance_counts(db, year=year, month=month, employee_id=employee_id)
+    
+    records = []
+    if include_records:
+        records = await crud_async.get_monthly_attendance_records(db, year=year, month=month, employee_id=employee_id)
+    # 校验和序列化整月记录是 CPU 密集操作，放到线程池中执行，不阻塞事件循环
+    return await run_in_threadpool(monthly_stats_response, counts, records, compact)
+
+
+@router.get("/summary/{year}/{month}", response_model=schemas.MonthlySummaryResponse)
+async def get_monthly_summary(
+    year: int = Path(..., ge=1, lt=9999),
+    month: int = Path(..., ge=1, le=12),
+    employee_id: Optional[int] = None,
+    include_days: bool = True,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """获取月度考勤汇总（读取每日汇总表，不扫描原始考勤记录）"""
+    employees = await crud_async.get_employee_monthly_summaries(db, year=year, month=month, employee_id=employee_id)
+    days = await crud_async.get_daily_summaries(db, year=year, month=month, employee_id=employee_id) if include_days else []
+    return responses.json_response(schemas.MonthlySummaryResponse(
+        year=year,
+        month=month,
+        employees=employees,
+        days=days
+    ))
+
+
+@router.get("/report/{year}/{month}", response_model=schemas.WorkReportResponse)
+async def get_work_report(
+    year: int = Path(..., ge=1, lt=9999),
+    month: int = Path(..., ge=1, le=12),
+    employee_id: Optional[int] = None,
+    include_days: bool = True,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """获取月度工时和迟到/早退报表（按当前激活的工作时间计算）"""
+    schedule = await crud_async.get_cached_active_work_schedule(db)
+    if schedule is None:
+        raise HTTPException(status_code=404, detail="No active work schedule found")
+    
+    # 只在 run_sync 中读取汇总列，NumPy 计算和序列化放到线程池中执行
+    daily = await db.run_sync(reports.load_month_summaries, year, month, employee_id=employee_id)
+    return await run_in_threadpool(
+        lambda: responses.orjson_response(reports.build_work_report(daily, year, month, schedule, include_days))
+    )
+
+
+@router.get("/monthly/{year}/{month}/export")
+async def export_monthly_attendance(
+    year: int = Path(..., ge=1, lt=9999),
+    month: int = Path(..., ge=1, le=12),
+    employee_id: Optional[int] = None,
+    export_format: str = Query("csv", alias="format", pattern="^(csv|ndjson)$"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """流式导出月度考勤记录（CSV 或 NDJSON）"""
+    partitions = await crud_async.stream_monthly_attendance_rows(
+        db, year=year, month=month, employee_id=employee_id, batch_size=export.EXPORT_CHUNK_ROWS
+    )
+    return export.export_response(export.aiter_export(partitions, export_format), export_format, year, month)
+
+
+# 推送接口本身不访问数据库，与同步路由共用
+router.add_api_route("/stream", stream_attendance_events, methods=["GET"])
+
+
+@router.get("/status/{employee_id}")
+async def get_attendance_status(employee_id: int, db: AsyncSession = Depends(get_async_db)):
+    """获取员工今日考勤状态"""
+    state = await crud_async.get_today_state(db, employee_id=employee_id)
+    return status_response(employee_id, ingest.ingest_buffer.overlay(employee_id, state))
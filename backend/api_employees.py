@@ -1,8 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 import crud
+import etag
+import responses
 import schemas
+import pagination
 from database import get_db
 
 router = APIRouter(prefix="/api/employees", tags=["employees"])
@@ -31,10 +34,31 @@ def create_employee(employee: schemas.EmployeeCreate, db: Session = Depends(get_
 
 
 @router.get("/", response_model=List[schemas.Employee])
-def read_employees(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    """获取员工列表"""
-    employees = crud.get_employees(db, skip=skip, limit=limit)
-    return employees
+def read_employees(
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """获取员工列表（支持 cursor 游标分页，下一页游标通过 X-Next-Cursor 响应头返回；支持 ETag 条件请求）"""
+    tag = etag.make_etag("employees", *crud.get_employees_version(db), skip, limit, cursor)
+    if etag.is_not_modified(request, tag):
+        return etag.not_modified(tag)
+    etag.set_etag(response, tag)
+    
+    after_id = None
+    if cursor:
+        try:
+            after_id = pagination.decode_employee_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    employees = crud.get_employees(db, skip=skip, limit=limit, after_id=after_id)
+    if limit > 0 and len(employees) == limit:
+        response.headers["X-Next-Cursor"] = pagination.encode_employee_cursor(employees[-1].id)
+    return responses.trusted_list_response(schemas.Employee, employees, headers=response.headers)
 
 
 @router.get("/{employee_id}", response_model=schemas.Employee)
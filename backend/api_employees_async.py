@@ -0,0 +1,86 @@
+"""
+员工 API（异步版本，ASYNC_DB 模式下使用）
+"""
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+import crud_async
+import etag
+import responses
+import schemas
+import pagination
+from database import get_async_db
+
+router = APIRouter(prefix="/api/employees", tags=["employees"])
+
+
+@router.post("/", response_model=schemas.Employee, status_code=status.HTTP_201_CREATED)
+async def create_employee(employee: schemas.EmployeeCreate, db: AsyncSession = Depends(get_async_db)):
+    """创建员工"""
+    # 检查员工编号是否已存在
+    db_employee = await crud_async.get_employee_by_employee_id(db, employee_id=employee.employee_id)
+    if db_employee:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Employee ID already registered"
+        )
+    
+    # 检查邮箱是否已存在
+    db_employee = await crud_async.get_employee_by_email(db, email=employee.email)
+    if db_employee:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email already registered"
+        )
+    
+    return await crud_async.create_employee(db=db, employee=employee)
+
+
+@router.get("/", response_model=List[schemas.Employee])
+async def read_employees(
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """获取员工列表（支持 cursor 游标分页，下一页游标通过 X-Next-Cursor 响应头返回；支持 ETag 条件请求）"""
+    tag = etag.make_etag("employees", *await crud_async.get_employees_version(db), skip, limit, cursor)
+    if etag.is_not_modified(request, tag):
+        return etag.not_modified(tag)
+    etag.set_etag(response, tag)
+    
+    after_id = None
+    if cursor:
+        try:
+            after_id = pagination.decode_employee_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    employees = await crud_async.get_employees(db, skip=skip, limit=limit, after_id=after_id)
+    if limit > 0 and len(employees) == limit:
+        response.headers["X-Next-Cursor"] = pagination.encode_employee_cursor(employees[-1].id)
+    return responses.trusted_list_response(schemas.Employee, employees, headers=response.headers)
+
+
+@router.get("/{employee_id}", response_model=schemas.Employee)
+async def read_employee(employee_id: int, db: AsyncSession = Depends(get_async_db)):
+    """获取单个员工信息"""
+    db_employee = await crud_async.get_employee(db, employee_id=employee_id)
+    if db_employee is None:
+        raise HTTPException(status_code=404, detail="Employee not found")
+    return db_employee
+
+
+@router.put("/{employee_id}", response_model=schemas.Employee)
+async def update_employee(
+    employee_id: int,
+    employee: schemas.EmployeeUpdate,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """更新员工信息"""
+    db_employee = await crud_async.update_employee(db, employee_id=employee_id, employee=employee)
+    if db_employee is None:
+        raise HTTPException(status_code=404, detail="Employee not found")
+    return db_employee
@@ -1,7 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
 from typing import List
 import crud
+import etag
+import responses
 import schemas
 from database import get_db
 
@@ -15,18 +17,38 @@ def create_work_schedule(schedule: schemas.WorkScheduleCreate, db: Session = Dep
 
 
 @router.get("/", response_model=List[schemas.WorkSchedule])
-def read_work_schedules(active_only: bool = True, db: Session = Depends(get_db)):
-    """获取工作时间列表"""
+def read_work_schedules(
+    request: Request,
+    response: Response,
+    active_only: bool = True,
+    db: Session = Depends(get_db)
+):
+    """获取工作时间列表（支持 ETag 条件请求）"""
+    tag = etag.make_etag("schedules", *crud.get_work_schedules_version(db), active_only)
+    if etag.is_not_modified(request, tag):
+        return etag.not_modified(tag)
+    etag.set_etag(response, tag)
+    
     schedules = crud.get_work_schedules(db, active_only=active_only)
-    return schedules
+    return responses.trusted_list_response(schemas.WorkSchedule, schedules, headers=response.headers)
+
+
+def active_schedule_etag(schedule: schemas.WorkSchedule) -> str:
+    """当前工作时间的 ETag（由缓存中的快照计算，不查询数据库）"""
+    return etag.make_etag("active_schedule", schedule.id, schedule.updated_at, schedule.is_active)
 
 
 @router.get("/active", response_model=schemas.WorkSchedule)
-def read_active_schedule(db: Session = Depends(get_db)):
-    """获取当前激活的工作时间"""
-    schedule = crud.get_active_work_schedule(db)
+def read_active_schedule(request: Request, response: Response, db: Session = Depends(get_db)):
+    """获取当前激活的工作时间（支持 ETag 条件请求）"""
+    schedule = crud.get_cached_active_work_schedule(db)
     if schedule is None:
         raise HTTPException(status_code=404, detail="No active work schedule found")
+    
+    tag = active_schedule_etag(schedule)
+    if etag.is_not_modified(request, tag):
+        return etag.not_modified(tag)
+    etag.set_etag(response, tag)
     return schedule
 
 
@@ -55,13 +77,7 @@ def update_work_schedule(
 @router.post("/{schedule_id}/activate", response_model=schemas.WorkSchedule)
 def activate_work_schedule(schedule_id: int, db: Session = Depends(get_db)):
     """激活工作时间安排（停用其他所有安排）"""
-    # 先停用所有安排
-    crud.deactivate_all_schedules(db)
-    
-    # 激活指定安排
-    schedule_update = schemas.WorkScheduleUpdate(is_active=True)
-    db_schedule = crud.update_work_schedule(db, schedule_id=schedule_id, schedule=schedule_update)
-    
+    db_schedule = crud.activate_work_schedule(db, schedule_id=schedule_id)
     if db_schedule is None:
         raise HTTPException(status_code=404, detail="Work schedule not found")
     
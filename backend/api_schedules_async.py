@@ -0,0 +1,83 @@
+"""
+工作时间 API（异步版本，ASYNC_DB 模式下使用）
+"""
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List
+import crud_async
+import etag
+import responses
+import schemas
+from api_schedules import active_schedule_etag
+from database import get_async_db
+
+router = APIRouter(prefix="/api/schedules", tags=["work schedules"])
+
+
+@router.post("/", response_model=schemas.WorkSchedule, status_code=status.HTTP_201_CREATED)
+async def create_work_schedule(schedule: schemas.WorkScheduleCreate, db: AsyncSession = Depends(get_async_db)):
+    """创建工作时间安排"""
+    return await crud_async.create_work_schedule(db=db, schedule=schedule)
+
+
+@router.get("/", response_model=List[schemas.WorkSchedule])
+async def read_work_schedules(
+    request: Request,
+    response: Response,
+    active_only: bool = True,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """获取工作时间列表（支持 ETag 条件请求）"""
+    tag = etag.make_etag("schedules", *await crud_async.get_work_schedules_version(db), active_only)
+    if etag.is_not_modified(request, tag):
+        return etag.not_modified(tag)
+    etag.set_etag(response, tag)
+    
+    schedules = await crud_async.get_work_schedules(db, active_only=active_only)
+    return responses.trusted_list_response(schemas.WorkSchedule, schedules, headers=response.headers)
+
+
+@router.get("/active", response_model=schemas.WorkSchedule)
+async def read_active_schedule(request: Request, response: Response, db: AsyncSession = Depends(get_async_db)):
+    """获取当前激活的工作时间（支持 ETag 条件请求）"""
+    schedule = await crud_async.get_cached_active_work_schedule(db)
+    if schedule is None:
+        raise HTTPException(status_code=404, detail="No active work schedule found")
+    
+    tag = active_schedule_etag(schedule)
+    if etag.is_not_modified(request, tag):
+        return etag.not_modified(tag)
+    etag.set_etag(response, tag)
+    return schedule
+
+
+@router.get("/{schedule_id}", response_model=schemas.WorkSchedule)
+async def read_work_schedule(schedule_id: int, db: AsyncSession = Depends(get_async_db)):
+    """获取单个工作时间安排"""
+    db_schedule = await crud_async.get_work_schedule(db, schedule_id=schedule_id)
+    if db_schedule is None:
+        raise HTTPException(status_code=404, detail="Work schedule not found")
+    return db_schedule
+
+
+@router.put("/{schedule_id}", response_model=schemas.WorkSchedule)
+async def update_work_schedule(
+    schedule_id: int,
+    schedule: schemas.WorkScheduleUpdate,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """更新工作时间安排"""
+    db_schedule = await crud_async.update_work_schedule(db, schedule_id=schedule_id, schedule=schedule)
+    if db_schedule is None:
+        raise HTTPException(status_code=404, detail="Work schedule not found")
+    return db_schedule
+
+
+@router.post("/{schedule_id}/activate", response_model=schemas.WorkSchedule)
+async def activate_work_schedule(schedule_id: int, db: AsyncSession = Depends(get_async_db)):
+    """激活工作时间安排（停用其他所有安排）"""
+    db_schedule = await crud_async.activate_work_schedule(db, schedule_id=schedule_id)
+    if db_schedule is None:
+        raise HTTPException(status_code=404, detail="Work schedule not found")
+    
+    return db_schedule
@@ -0,0 +1,398 @@
+"""
+考勤记录月度归档
+
+已结束的月份可以整月移出 attendance_records，写入 gzip 压缩的列式 JSON 文件
+（每列一个数组），并在 attendance_archives 表中登记，热表只保留近期数据，索引保持小而快。
+crud.get_monthly_attendance_records 等月度查询遇到已归档的月份时自动改读归档文件，调用方无感知；
+每日汇总表不归档，月度汇总照常从汇总表读取。
+
+- 归档后才写入该月的记录（例如写后缓冲跨月才写库的事件、崩溃后重放的日志）由
+  absorb_late_records 并入归档文件（写成新的文件再切换登记），不会在月度查询中消失。
+- GET /api/attendance/records（含游标分页）只读取 attendance_records，不包含已归档的月份，
+  历史月份请使用月度查询或导出接口。
+- 解码后的归档按月缓存，缓存的月数由 ARCHIVE_CACHE_MONTHS 控制（每月约为全部记录的 Python 对象）。
+
+用法:
+    python archive.py list
+    python archive.py archive 2026 3
+    python archive.py archive-closed --keep-months 3
+    python archive.py restore 2026 3
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import uuid
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import and_, insert, select
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+import models
+from config import settings
+
+ARCHIVE_FORMAT_VERSION = 1
+ARCHIVE_COLUMNS = (
+    "id", "employee_id", "attendance_type", "timestamp", "latitude", "longitude", "notes", "created_at", "event_id"
+)
+
+
+def _month_bounds(year: int, month: int) -> Tuple[datetime, datetime]:
+    start = datetime(year, month, 1)
+    end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+    return start, end
+
+
+def is_closed_month(year: int, month: int, today: Optional[date] = None) -> bool:
+    """月份是否已经结束（只有已结束的月份可以归档）"""
+    # 考勤时间以 UTC 存储，按 UTC 日期判断
+    today = today or datetime.utcnow().date()
+    return (year, month) < (today.year, today.month)
+
+
+def archive_path(year: int, month: int, revision: Optional[str] = None) -> str:
+    """归档文件路径；并入迟到记录后以新的 revision 另写文件"""
+    suffix = f".{revision}" if revision is not None else ""
+    return os.path.join(settings.ARCHIVE_DIR, f"attendance_{year:04d}_{month:02d}{suffix}.json.gz")
+
+
+def get_archive(db: Session, year: int, month: int) -> Optional[models.AttendanceArchive]:
+    """获取某月的归档登记，未归档返回 None"""
+    return db.query(models.AttendanceArchive).filter(
+        models.AttendanceArchive.year == year,
+        models.AttendanceArchive.month == month
+    ).first()
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, models.AttendanceTypeEnum):
+        return value.value
+    return value
+
+
+def _write_file(path: str, payload: dict) -> str:
+    """写入归档文件（先写临时文件再原子替换），返回 SHA-256"""
+    data = gzip.compress(json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as temp:
+        temp.write(data)
+        temp.flush()
+        os.fsync(temp.fileno())
+    os.replace(temp_path, path)
+    return hashlib.sha256(data).hexdigest()
+
+
+def _write_rows(path: str, year: int, month: int, rows: List[tuple]) -> str:
+    """把按 ARCHIVE_COLUMNS 排列的行按列写入归档文件，返回 SHA-256"""
+    return _write_file(path, {
+        "format": ARCHIVE_FORMAT_VERSION,
+        "year": year,
+        "month": month,
+        "columns": {
+            name: [_encode_value(row[index]) for row in rows]
+            for index, name in enumerate(ARCHIVE_COLUMNS)
+        },
+    })
+
+
+@lru_cache(maxsize=settings.ARCHIVE_CACHE_MONTHS)
+def _load_columns(path: str, checksum: str) -> Dict[str, tuple]:
+    """读取并解码归档文件（归档文件不可变，按路径和校验和缓存最近读取的几个月）"""
+    with open(path, "rb") as archive_file:
+        data = archive_file.read()
+    if hashlib.sha256(data).hexdigest() != checksum:
+        raise ValueError(f"Archive checksum mismatch: {path}")
+    payload = json.loads(gzip.decompress(data))
+    columns = payload["columns"]
+    return {
+        "id": tuple(columns["id"]),
+        "employee_id": tuple(columns["employee_id"]),
+        "attendance_type": tuple(models.AttendanceTypeEnum(value) for value in columns["attendance_type"]),
+        "timestamp": tuple(datetime.fromisoformat(value) for value in columns["timestamp"]),
+        "latitude": tuple(columns["latitude"]),
+        "longitude": tuple(columns["longitude"]),
+        "notes": tuple(columns["notes"]),
+        "created_at": tuple(
+            datetime.fromisoformat(value) if value is not None else None for value in columns["created_at"]
+        ),
+        # 较早的归档文件没有 event_id 列
+        "event_id": tuple(columns.get("event_id") or [None] * len(columns["id"])),
+    }
+
+
+def read_archive(archived: models.AttendanceArchive) -> Dict[str, tuple]:
+    """读取归档文件的各列（按 timestamp、id 升序）"""
+    return _load_columns(archived.path, archived.checksum)
+
+
+def _indexes(columns: Dict[str, tuple], employee_id: Optional[int]) -> List[int]:
+    if not employee_id:
+        return list(range(len(columns["id"])))
+    return [index for index, value in enumerate(columns["employee_id"]) if value == employee_id]
+
+
+def archived_records(
+    db: Session,
+    archived: models.AttendanceArchive,
+    employee_id: Optional[int] = None
+) -> List[models.AttendanceRecord]:
+    """从归档文件构造月度考勤记录（按时间倒序，附带员工信息，与数据库查询结果一致）"""
+    columns = read_archive(archived)
+    indexes = _indexes(columns, employee_id)
+    employee_ids = {columns["employee_id"][index] for index in indexes}
+    employees = {
+        employee.id: employee
+        for employee in db.query(models.Employee).filter(models.Employee.id.in_(employee_ids))
+    } if employee_ids else {}
+    
+    records = []
+    for index in reversed(indexes):
+        record = models.AttendanceRecord(**{name: columns[name][index] for name in ARCHIVE_COLUMNS})
+        # 不触发反向关系的集合事件，记录不会进入会话
+        set_committed_value(record, "employee", employees.get(record.employee_id))
+        records.append(record)
+    return records
+
+
+def archived_rows(
+    db: Session,
+    archived: models.AttendanceArchive,
+    employee_id: Optional[int] = None
+) -> Iterator[Tuple]:
+    """按导出格式迭代归档月份的记录（含员工编号和姓名，按时间升序）"""
+    columns = read_archive(archived)
+    indexes = _indexes(columns, employee_id)
+    employee_ids = {columns["employee_id"][index] for index in indexes}
+    employees = dict(
+        (row[0], row[1:]) for row in db.query(
+            models.Employee.id, models.Employee.employee_id, models.Employee.name
+        ).filter(models.Employee.id.in_(employee_ids))
+    ) if employee_ids else {}
+    
+    for index in indexes:
+        code, name = employees.get(columns["employee_id"][index], (None, None))
+        yield (
+            columns["id"][index],
+            columns["employee_id"][index],
+            code,
+            name,
+            columns["attendance_type"][index],
+            columns["timestamp"][index],
+            columns["latitude"][index],
+            columns["longitude"][index],
+            columns["notes"][index],
+            columns["created_at"][index],
+        )
+
+
+def archived_events(archived: models.AttendanceArchive) -> Iterator[Tuple]:
+    """按时间顺序迭代归档月份的 (员工ID, 考勤类型, 时间)，用于重建每日汇总"""
+    columns = read_archive(archived)
+    return zip(columns["employee_id"], columns["attendance_type"], columns["timestamp"])
+
+
+def _delete_records(db: Session, ids: List[int], chunk_size: int = 500):
+    """按主键删除已写入归档文件的记录（只删除归档了的记录，期间新写入的记录保留）"""
+    for offset in range(0, len(ids), chunk_size):
+        db.query(models.AttendanceRecord).filter(
+            models.AttendanceRecord.id.in_(ids[offset:offset + chunk_size])
+        ).delete(synchronize_session=False)
+
+
+def _month_rows(db: Session, year: int, month: int) -> List[tuple]:
+    """读取 attendance_records 中某月的记录（按 ARCHIVE_COLUMNS 排列，按 timestamp、id 升序）"""
+    start, end = _month_bounds(year, month)
+    table = models.AttendanceRecord.__table__
+    return [tuple(row) for row in db.execute(
+        select(*(table.c[name] for name in ARCHIVE_COLUMNS))
+        .where(and_(table.c.timestamp >= start, table.c.timestamp < end))
+        .order_by(table.c.timestamp, table.c.id)
+    )]
+
+
+def archive_month(db: Session, year: int, month: int) -> models.AttendanceArchive:
+    """把已结束月份的考勤记录写入归档文件并从 attendance_records 删除"""
+    if not is_closed_month(year, month):
+        raise ValueError(f"{year}-{month:02d} is not closed yet")
+    if get_archive(db, year, month) is not None:
+        raise ValueError(f"{year}-{month:02d} is already archived")
+    
+    rows = _month_rows(db, year, month)
+    path = archive_path(year, month)
+    checksum = _write_rows(path, year, month, rows)
+    
+    # 文件落盘后再登记并删除记录：中途失败时记录仍在数据库中，可以重新归档
+    archived = models.AttendanceArchive(
+        year=year, month=month, path=path, record_count=len(rows), checksum=checksum
+    )
+    db.add(archived)
+    _delete_records(db, [row[0] for row in rows])
+    db.commit()
+    # 读取之后、登记之前提交的记录（例如写后缓冲刚好写入）
+    absorb_late_records(db, year, month)
+    return archived
+
+
+def absorb_candidate(db: Session, year: int, month: int) -> Optional[Tuple[models.AttendanceArchive, List[tuple]]]:
+    """读取最新的归档登记和该月仍在 attendance_records 中的记录，没有需要并入的记录时返回 None"""
+    archived = db.query(models.AttendanceArchive).populate_existing().filter(
+        models.AttendanceArchive.year == year,
+        models.AttendanceArchive.month == month
+    ).first()
+    if archived is None:
+        return None
+    late = _month_rows(db, year, month)
+    return (archived, late) if late else None
+
+
+def write_merged_archive(
+    archived: models.AttendanceArchive,
+    late: List[tuple],
+    year: int,
+    month: int
+) -> Tuple[str, str, int]:
+    """把归档文件中的记录与 late 合并写成新的归档文件（不访问数据库），返回 (路径, 校验和, 记录数)"""
+    columns = read_archive(archived)
+    rows = list(zip(*(columns[name] for name in ARCHIVE_COLUMNS))) + late
+    rows.sort(key=lambda row: (row[3], row[0]))
+    path = archive_path(year, month, f"{len(rows)}-{uuid.uuid4().hex[:8]}")
+    return path, _write_rows(path, year, month, rows), len(rows)
+
+
+def switch_archive(
+    db: Session,
+    archived: models.AttendanceArchive,
+    late: List[tuple],
+    path: str,
+    checksum: str,
+    record_count: int
+) -> bool:
+    """按原校验和把归档登记切换到新文件并删除已并入的记录，成功后删除旧文件；
+    其他请求已经切换过时删除新文件并返回 False"""
+    old_path = archived.path
+    try:
+        switched = db.query(models.AttendanceArchive).filter(
+            models.AttendanceArchive.id == archived.id,
+            models.AttendanceArchive.checksum == archived.checksum
+        ).update({
+            models.AttendanceArchive.path: path,
+            models.AttendanceArchive.record_count: record_count,
+            models.AttendanceArchive.checksum: checksum,
+        }, synchronize_session=False)
+        if switched:
+            _delete_records(db, [row[0] for row in late])
+            db.commit()
+        else:
+            db.rollback()
+    except Exception:
+        db.rollback()
+        os.remove(path)
+        raise
+    if not switched:
+        os.remove(path)
+    elif os.path.exists(old_path):
+        os.remove(old_path)
+    return bool(switched)
+
+
+def absorb_late_records(db: Session, year: int, month: int) -> int:
+    """把归档之后才写入 attendance_records 的该月记录并入归档文件，返回并入的记录数
+    
+    每次写成新文件再按原校验和切换登记：并发并入时只有一方切换成功，另一方重新读取后再并入。
+    读写文件（write_merged_archive）与数据库操作分开，异步路由可以把前者放到线程池中执行。
+    """
+    absorbed = 0
+    while True:
+        candidate = absorb_candidate(db, year, month)
+        if candidate is None:
+            return absorbed
+        archived, late = candidate
+        if switch_archive(db, archived, late, *write_merged_archive(archived, late, year, month)):
+            absorbed += len(late)
+
+
+def restore_month(db: Session, year: int, month: int) -> int:
+    """把归档月份的记录（保留原 ID）写回 attendance_records 并删除归档，返回记录数"""
+    archived = get_archive(db, year, month)
+    if archived is None:
+        raise ValueError(f"{year}-{month:02d} is not archived")
+    
+    columns = read_archive(archived)
+    rows = [
+        {name: columns[name][index] for name in ARCHIVE_COLUMNS}
+        for index in range(len(columns["id"]))
+    ]
+    if rows:
+        db.execute(insert(models.AttendanceRecord), rows)
+    path = archived.path
+    db.delete(archived)
+    db.commit()
+    if os.path.exists(path):
+        os.remove(path)
+    return len(rows)
+
+
+def archive_closed_months(db: Session, keep_months: int, today: Optional[date] = None) -> List[models.AttendanceArchive]:
+    """归档除最近 keep_months 个月（含本月，按 UTC 日期）以外所有仍有记录的月份"""
+    today = today or datetime.utcnow().date()
+    year, month = today.year, today.month - keep_months + 1
+    while month <= 0:
+        year, month = year - 1, month + 12
+    cutoff = datetime(year, month, 1)
+    
+    first = db.query(models.AttendanceRecord.timestamp).filter(
+        models.AttendanceRecord.timestamp < cutoff
+    ).order_by(models.AttendanceRecord.timestamp).first()
+    if first is None:
+        return []
+    
+    archived = []
+    year, month = first.timestamp.year, first.timestamp.month
+    while datetime(year, month, 1) < cutoff:
+        if get_archive(db, year, month) is None:
+            archived.append(archive_month(db, year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return archived
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="考勤记录月度归档")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="列出已归档的月份")
+    for name, description in (("archive", "归档某个已结束的月份"), ("restore", "把归档月份写回数据库")):
+        command = commands.add_parser(name, help=description)
+        command.add_argument("year", type=int)
+        command.add_argument("month", type=int)
+    closed = commands.add_parser("archive-closed", help="归档最近几个月以外的所有月份")
+    closed.add_argument("--keep-months", type=int, default=3, help="保留在数据库中的月数（含本月）")
+    args = parser.parse_args(argv)
+    
+    from database import SessionLocal, init_db
+    init_db()
+    db = SessionLocal()
+    try:
+        if args.command == "list":
+            for archived in db.query(models.AttendanceArchive).order_by(
+                models.AttendanceArchive.year, models.AttendanceArchive.month
+            ):
+                print(f"{archived.year}-{archived.month:02d}  {archived.record_count:>10} 条  {archived.path}")
+        elif args.command == "archive":
+            archived = archive_month(db, args.year, args.month)
+            print(f"✓ 归档 {args.year}-{args.month:02d}：{archived.record_count} 条 -> {archived.path}")
+        elif args.command == "restore":
+            count = restore_month(db, args.year, args.month)
+            print(f"✓ 恢复 {args.year}-{args.month:02d}：{count} 条")
+        else:
+            for archived in archive_closed_months(db, args.keep_months):
+                print(f"✓ 归档 {archived.year}-{archived.month:02d}：{archived.record_count} 条 -> {archived.path}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
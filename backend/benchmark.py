@@ -0,0 +1,323 @@
+"""
+早高峰签到压测
+
+准备数据（员工 + 工作时间），然后按到达时间回放签到风暴：
+并发客户端调用 /api/attendance/check-in 和 /check-out，同时穿插管理后台的 /monthly 查询，
+统计吞吐量和各接口 p50/p95/p99 延迟，结果写入 JSON 文件便于在不同提交之间对比。
+
+默认在进程内通过 ASGI 直接调用应用（真实的 SQLite 文件数据库），
+也可以用 --base-url 压测已启动的服务。
+
+--serialization N 时不回放请求，而是对比列表接口（员工、考勤记录、工作时间）
+各 N 行的两种序列化路径：按 response_model 校验后编码，与可信读取路径（responses.trusted_list_response）。
+
+用法:
+    python benchmark.py --employees 10000 --window 60 --concurrency 50
+    python benchmark.py --async-db --output results_async.json --compare results_sync.json
+    python benchmark.py --serialization 10000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="早高峰签到压测")
+    parser.add_argument("--employees", type=int, default=10000, help="员工数")
+    parser.add_argument("--window", type=float, default=60.0,
+                        help="到达时间窗口（秒），对应真实的 15 分钟早高峰；0 表示不等待、尽快发送")
+    parser.add_argument("--concurrency", type=int, default=50, help="并发客户端数")
+    parser.add_argument("--checkout-ratio", type=float, default=0.1,
+                        help="在窗口内签退的员工比例（如夜班下班）")
+    parser.add_argument("--dashboard-reads", type=int, default=100, help="管理后台 /monthly 查询次数")
+    parser.add_argument("--full-month-ratio", type=float, default=0.1,
+                        help="管理后台查询中下载整月记录（include_records=true）的比例")
+    parser.add_argument("--history-months", type=int, default=0,
+                        help="预先生成最近几个月的历史考勤（见 generate_data.py）")
+    parser.add_argument("--database-url", default="sqlite:///./bench.db",
+                        help="进程内压测使用的数据库（会被清空重建）")
+    parser.add_argument("--async-db", action="store_true", help="进程内压测使用异步路由（ASYNC_DB 模式）")
+    parser.add_argument("--ingest-mode", choices=["direct", "buffered"], default="direct",
+                        help="进程内压测的签到写入方式（INGEST_MODE）")
+    parser.add_argument("--base-url", help="压测已启动的服务（不准备数据，需要已有员工 ID 1..N）")
+    parser.add_argument("--serialization", type=int, default=0,
+                        help="只对比列表接口 N 行的校验/可信读取序列化耗时（0 表示不对比）")
+    parser.add_argument("--repeat", type=int, default=5, help="序列化对比的重复次数（取最快一次）")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--output", default="benchmark_results.json", help="结果文件")
+    parser.add_argument("--compare", help="与之前的结果文件对比")
+    return parser.parse_args(argv)
+
+
+def percentile(sorted_values, p):
+    """最近秩百分位数"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, rejected, elapsed):
+    """按接口汇总延迟（毫秒）"""
+    results = {}
+    for name in sorted(set(latencies) | set(errors)):
+        values = sorted(latencies.get(name, []))
+        results[name] = {
+            "count": len(values),
+            "errors": errors.get(name, 0),
+            "rejected": rejected.get(name, 0),
+            "throughput_rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+            "mean_ms": round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+            "p50_ms": round(percentile(values, 50) * 1000, 3),
+            "p95_ms": round(percentile(values, 95) * 1000, 3),
+            "p99_ms": round(percentile(values, 99) * 1000, 3),
+            "max_ms": round(values[-1] * 1000, 3) if values else 0.0,
+        }
+    return results
+
+
+def build_schedule(args, employee_ids, today):
+    """生成 (发送时间, 方法, 路径, 参数, 接口名) 列表：签到到达时间集中在窗口后段"""
+    rng = random.Random(args.seed)
+    window = args.window
+    events = []
+    for employee_id in employee_ids:
+        arrive = rng.triangular(0, window, window * 0.8) if window else 0.0
+        events.append((arrive, "POST", "/api/attendance/check-in", {"employee_id": employee_id}, "check-in"))
+        if rng.random() < args.checkout_ratio:
+            leave = rng.uniform(arrive, window) if window else 0.0
+            events.append((leave, "POST", "/api/attendance/check-out", {"employee_id": employee_id}, "check-out"))
+    for i in range(args.dashboard_reads):
+        at = window * i / max(args.dashboard_reads, 1) if window else 0.0
+        include_records = rng.random() < args.full_month_ratio
+        name = "monthly-full" if include_records else "monthly-stats"
+        events.append((
+            at, "GET", f"/api/attendance/monthly/{today.year}/{today.month}",
+            {"include_records": str(include_records).lower()}, name
+        ))
+    # 同一员工的签退排在签到之后
+    events.sort(key=lambda event: (event[0], event[4] == "check-out"))
+    return events
+
+
+async def replay(client, events, concurrency, window):
+    """按计划时间回放请求，返回 (各接口延迟, 各接口 5xx/异常数, 各接口 4xx 数, 总耗时)"""
+    queue = asyncio.Queue(maxsize=concurrency * 4)
+    latencies, errors, rejected = {}, {}, {}
+    start = time.perf_counter()
+    
+    async def worker():
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            method, path, params, name = item
+            sent = time.perf_counter()
+            try:
+                response = await client.request(method, path, params=params)
+                ok = response.status_code < 500
+            except Exception:
+                ok = False
+            if ok:
+                latencies.setdefault(name, []).append(time.perf_counter() - sent)
+                if response.status_code >= 400:
+                    rejected[name] = rejected.get(name, 0) + 1
+            else:
+                errors[name] = errors.get(name, 0) + 1
+    
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    for at, method, path, params, name in events:
+        if window:
+            delay = at - (time.perf_counter() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await queue.put((method, path, params, name))
+    for _ in workers:
+        await queue.put(None)
+    await asyncio.gather(*workers)
+    return latencies, errors, rejected, time.perf_counter() - start
+
+
+def seed_database(employee_count, history_months=0):
+    """清空并准备压测数据（可附带历史考勤），返回员工 ID 列表"""
+    from datetime import time as dt_time
+    import generate_data
+    import models
+    from database import SessionLocal, engine
+    
+    options = generate_data.parse_args([
+        "--employees", str(employee_count), "--months", str(history_months), "--prefix", "EMP", "--reset"
+    ])
+    result = generate_data.generate(engine, options, log=lambda message: None)
+    db = SessionLocal()
+    try:
+        db.add(models.WorkSchedule(
+            name="标准工作时间", check_in_time=dt_time(9, 0), check_out_time=dt_time(18, 0), is_active=True
+        ))
+        db.commit()
+    finally:
+        db.close()
+    return result["employee_ids"]
+
+
+def git_commit():
+    """当前提交的短哈希；不在 git 仓库中或没有安装 git 时返回 "unknown"（不向终端输出 git 的报错）"""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_report(report, previous=None):
+    print(f"\n总请求 {report['total_requests']}，耗时 {report['elapsed_s']}s，吞吐量 {report['throughput_rps']} req/s")
+    header = f"{'接口':<16}{'请求数':>8}{'错误':>6}{'4xx':>6}{'rps':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}"
+    print(header)
+    for name, stats in report["results"].items():
+        line = (f"{name:<16}{stats['count']:>8}{stats['errors']:>6}{stats['rejected']:>6}{stats['throughput_rps']:>10}"
+                f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+        old = (previous or {}).get("results", {}).get(name)
+        if old and old["p99_ms"]:
+            line += f"   p99 {(stats['p99_ms'] - old['p99_ms']) / old['p99_ms'] * 100:+.1f}%"
+        print(line)
+
+
+async def run(args):
+    import httpx
+    
+    today = datetime.utcnow()
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=60)
+        employee_ids = list(range(1, args.employees + 1))
+    else:
+        os.environ["DATABASE_URL"] = args.database_url
+        os.environ["ASYNC_DB"] = "true" if args.async_db else "false"
+        os.environ.setdefault("DB_POOL_SIZE", str(args.concurrency))
+        os.environ["INGEST_MODE"] = args.ingest_mode
+        os.environ["INGEST_LOG_PATH"] = "./bench_ingest.log"
+        employee_ids = seed_database(args.employees, args.history_months)
+        from main import app
+        from database import SessionLocal
+        from ingest import ingest_buffer
+        if args.ingest_mode == "buffered":
+            # 数据库已重建，丢弃上次运行残留的日志；ASGITransport 不触发 startup，这里手动启动
+            if os.path.exists(ingest_buffer.log_path):
+                os.remove(ingest_buffer.log_path)
+            ingest_buffer.start(SessionLocal)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark", timeout=60)
+    
+    events = build_schedule(args, employee_ids, today)
+    print(f"回放 {len(events)} 个请求，并发 {args.concurrency}，窗口 {args.window}s ...")
+    async with client:
+        latencies, errors, rejected, elapsed = await replay(client, events, args.concurrency, args.window)
+    if not args.base_url:
+        ingest_buffer.stop()
+    
+    total = sum(len(values) for values in latencies.values())
+    return {
+        "commit": git_commit(),
+        "run_at": datetime.now().isoformat(timespec="seconds"),
+        "params": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "elapsed_s": round(elapsed, 3),
+        "total_requests": total,
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "results": summarize(latencies, errors, rejected, elapsed),
+    }
+
+
+def best_of(func, repeat):
+    """重复执行取最快一次的耗时（毫秒）"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return round(min(timings) * 1000, 2)
+
+
+def run_serialization(args):
+    """对比列表接口的两种序列化路径：response_model 校验后编码 / 可信读取"""
+    from datetime import time as dt_time
+    from typing import List
+    from pydantic import TypeAdapter
+    
+    os.environ["DATABASE_URL"] = args.database_url
+    count = args.serialization
+    # 每人一个月约 44 条考勤，足够取出 count 条记录
+    seed_database(count, history_months=1)
+    import crud
+    import models
+    import responses
+    import schemas
+    from database import SessionLocal
+    
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        lists = {
+            "employees": (schemas.Employee, crud.get_employees(db, limit=count)),
+            "records": (schemas.AttendanceRecord, crud.get_attendance_records(db, limit=count)),
+            # 工作时间表通常只有几行，构造同样数量的对象
+            "schedules": (schemas.WorkSchedule, [
+                models.WorkSchedule(
+                    id=index + 1, name=f"班次{index + 1}", check_in_time=dt_time(9, 0), check_out_time=dt_time(18, 0),
+                    is_active=False, created_at=now, updated_at=now
+                )
+                for index in range(count)
+            ]),
+        }
+        results = {}
+        for name, (schema, rows) in lists.items():
+            adapter = TypeAdapter(List[schema])
+            validated = best_of(lambda: adapter.dump_json(adapter.validate_python(rows, from_attributes=True)), args.repeat)
+            trusted = best_of(lambda: responses.trusted_list_response(schema, rows), args.repeat)
+            results[name] = {
+                "rows": len(rows),
+                "validated_ms": validated,
+                "trusted_ms": trusted,
+                "speedup": round(validated / trusted, 2) if trusted else 0.0,
+            }
+    finally:
+        db.close()
+    
+    return {
+        "commit": git_commit(),
+        "run_at": datetime.now().isoformat(timespec="seconds"),
+        "params": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "serialization": results,
+    }
+
+
+def print_serialization_report(report):
+    print(f"\n{'列表':<12}{'行数':>8}{'校验(ms)':>12}{'可信(ms)':>12}{'加速':>8}")
+    for name, stats in report["serialization"].items():
+        print(f"{name:<12}{stats['rows']:>8}{stats['validated_ms']:>12}{stats['trusted_ms']:>12}{stats['speedup']:>7}x")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.serialization:
+        report = run_serialization(args)
+        print_serialization_report(report)
+    else:
+        report = asyncio.run(run(args))
+        previous = None
+        if args.compare:
+            with open(args.compare, encoding="utf-8") as f:
+                previous = json.load(f)
+        print_report(report, previous)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已写入 {args.output}")
+    return report
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
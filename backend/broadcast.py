@@ -0,0 +1,144 @@
+"""
+考勤事件推送（Server-Sent Events）
+
+管理后台通过 GET /api/attendance/stream 订阅，签到/签退写入（含批量接口和写后缓冲模式）后
+立即把事件推送给所有订阅者，不再需要反复拉取整月数据。
+
+- 每条事件只编码一次，按事件循环分组，每个事件循环只调度一次投递，再分发到该循环上的所有订阅队列，
+  数百个订阅者时开销仍然很小；publish() 可以在线程池中的同步路由里调用。
+- 每个订阅者的队列有上限（STREAM_QUEUE_SIZE）。客户端跟不上时丢弃其积压的事件，
+  改为发送一条 resync 事件，客户端收到后重新拉取统计数据。
+- 事件不保留历史，无法按 Last-Event-ID 补发：断线重连（请求带 Last-Event-ID）时先发送一条 resync，
+  客户端重新拉取统计，断线期间错过的事件不会丢失。
+- 推送只在本进程内有效：多 worker 部署时每个 worker 只推送自己处理的事件。
+"""
+import asyncio
+import itertools
+import threading
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, Optional, Set
+import orjson
+import models
+from config import settings
+from metrics import attendance_stream_resyncs_total, attendance_stream_subscribers
+
+# 断线后浏览器自动重连的间隔（毫秒）
+RETRY_MS = 3000
+HEARTBEAT = b": keepalive\n\n"
+RESYNC = b"event: resync\ndata: {}\n\n"
+
+
+def format_message(event_id: int, event_type: str, data: dict) -> bytes:
+    """编码一条 SSE 消息"""
+    return b"id: %d\nevent: %s\ndata: %s\n\n" % (event_id, event_type.encode(), orjson.dumps(data))
+
+
+def attendance_event(
+    employee_id: int,
+    attendance_type: models.AttendanceTypeEnum,
+    timestamp: datetime,
+    record_id: Optional[int] = None
+) -> dict:
+    """考勤事件内容（缓冲写入模式下尚未写库，没有记录 ID）
+    
+    考勤时间以不带时区的 UTC 存储，事件中带上 +00:00，浏览器不会按本地时间解析。
+    """
+    return {
+        "id": record_id,
+        "employee_id": employee_id,
+        "attendance_type": attendance_type,
+        "timestamp": timestamp.replace(tzinfo=timezone.utc),
+        "status": "checked_in" if attendance_type == models.AttendanceTypeEnum.CHECK_IN else "checked_out",
+    }
+
+
+class EventBroadcaster:
+    """把事件广播给订阅者的有界队列"""
+    
+    def __init__(self, queue_size: int = 256, heartbeat: float = 15.0):
+        self.queue_size = queue_size
+        self.heartbeat = heartbeat
+        self._lock = threading.Lock()
+        self._subscribers: Dict[asyncio.AbstractEventLoop, Set[asyncio.Queue]] = {}
+        self._sequence = itertools.count(1)
+    
+    @property
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(queues) for queues in self._subscribers.values())
+    
+    def subscribe(self) -> asyncio.Queue:
+        """订阅事件（在事件循环中调用），返回接收已编码消息的队列"""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(loop, set()).add(queue)
+        attendance_stream_subscribers.inc()
+        return queue
+    
+    def unsubscribe(self, queue: asyncio.Queue):
+        with self._lock:
+            for loop, queues in list(self._subscribers.items()):
+                if queue in queues:
+                    queues.discard(queue)
+                    if not queues:
+                        del self._subscribers[loop]
+                    attendance_stream_subscribers.dec()
+                    return
+    
+    def publish(self, event_type: str, data: dict):
+        """广播事件（线程安全，没有订阅者时不做任何编码）"""
+        with self._lock:
+            if not self._subscribers:
+                return
+            message = format_message(next(self._sequence), event_type, data)
+            targets = [(loop, tuple(queues)) for loop, queues in self._subscribers.items()]
+        for loop, queues in targets:
+            try:
+                loop.call_soon_threadsafe(self._deliver, queues, message)
+            except RuntimeError:
+                # 事件循环已关闭（例如测试客户端退出），丢弃其上的订阅
+                with self._lock:
+                    self._subscribers.pop(loop, None)
+    
+    @staticmethod
+    def _deliver(queues, message: bytes):
+        for queue in queues:
+            if queue.full():
+                # 客户端跟不上：丢弃积压，通知它重新拉取
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(RESYNC)
+                attendance_stream_resyncs_total.inc()
+            else:
+                queue.put_nowait(message)
+    
+    def publish_attendance(
+        self,
+        employee_id: int,
+        attendance_type: models.AttendanceTypeEnum,
+        timestamp: datetime,
+        record_id: Optional[int] = None
+    ):
+        self.publish("attendance", attendance_event(employee_id, attendance_type, timestamp, record_id))
+    
+    async def stream(self, resync: bool = False) -> AsyncIterator[bytes]:
+        """订阅并逐条产出 SSE 消息，空闲时发送心跳；生成器结束（客户端断开）时取消订阅
+        
+        resync=True（断线重连）时先发送 resync，通知客户端重新拉取断线期间的数据。
+        """
+        queue = self.subscribe()
+        try:
+            yield b"retry: %d\n\n" % RETRY_MS
+            if resync:
+                yield RESYNC
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    yield HEARTBEAT
+        finally:
+            self.unsubscribe(queue)
+
+
+broadcaster = EventBroadcaster(queue_size=settings.STREAM_QUEUE_SIZE, heartbeat=settings.STREAM_HEARTBEAT)
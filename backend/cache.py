@@ -0,0 +1,135 @@
+"""
+进程内缓存
+
+TodayStateCache 缓存每个员工当天的考勤状态（是否在职、最后一次签到/签退），
+签到/签退/状态查询命中缓存时无需查询数据库。
+默认容量 10000（TODAY_STATE_CACHE_SIZE，0 表示关闭）。缓存只在本进程内有效，其他进程的写入不会使其失效：
+多 worker 部署时，除非同一员工的请求固定路由到同一进程，否则应设为 0，避免按过期状态拒绝签到/签退
+（写入本身由状态行上的条件 UPDATE 保证一致，冲突时会使缓存失效）。
+
+VersionedCache 缓存单个值（如当前工作时间）并记录数据库中的版本号，
+其他进程修改数据后递增版本号，本进程最多在 ttl 秒后发现并重新加载。
+"""
+from collections import OrderedDict
+from datetime import date, datetime
+from threading import Lock
+from typing import Any, NamedTuple, Optional
+import time
+import models
+from config import settings
+
+
+class TodayState(NamedTuple):
+    """员工当天的考勤状态"""
+    is_active: bool
+    attendance_type: Optional[models.AttendanceTypeEnum]
+    timestamp: Optional[datetime]
+
+
+class TodayStateCache:
+    """按员工缓存当天考勤状态的 LRU 缓存，跨天自动清空"""
+    
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._day = date.today()
+        self._entries: "OrderedDict[int, TodayState]" = OrderedDict()
+        self._lock = Lock()
+    
+    def _check_day(self):
+        today = date.today()
+        if today != self._day:
+            self._day = today
+            self._entries.clear()
+    
+    def get(self, employee_id: int) -> Optional[TodayState]:
+        """获取缓存的状态，未命中返回 None"""
+        with self._lock:
+            self._check_day()
+            state = self._entries.get(employee_id)
+            if state is not None:
+                self._entries.move_to_end(employee_id)
+            return state
+    
+    def set(self, employee_id: int, state: TodayState):
+        """写入状态，超出容量时淘汰最久未使用的员工"""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._check_day()
+            self._entries[employee_id] = state
+            self._entries.move_to_end(employee_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def record(self, employee_id: int, attendance_type: models.AttendanceTypeEnum, timestamp: datetime):
+        """写入考勤记录后更新状态（仅更新已缓存的员工）"""
+        with self._lock:
+            self._check_day()
+            state = self._entries.get(employee_id)
+            if state is None:
+                return
+            if timestamp.date() != self._day:
+                # 跨零点后才写库的事件不属于今天的状态，移除缓存，下次从状态行读取
+                del self._entries[employee_id]
+            else:
+                self._entries[employee_id] = state._replace(attendance_type=attendance_type, timestamp=timestamp)
+    
+    def invalidate(self, employee_id: int):
+        """移除某个员工的缓存"""
+        with self._lock:
+            self._entries.pop(employee_id, None)
+    
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+    
+    def __len__(self):
+        return len(self._entries)
+
+
+class VersionedCache:
+    """带版本号的单值缓存"""
+    
+    def __init__(self, name: str, ttl: float):
+        self.name = name
+        self.ttl = ttl
+        self._loaded = False
+        self._value: Any = None
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+        self._lock = Lock()
+    
+    def get_fresh(self):
+        """ttl 内直接返回 (True, 值)，否则返回 (False, None)，需要检查版本号"""
+        with self._lock:
+            if self._loaded and time.monotonic() - self._checked_at < self.ttl:
+                return True, self._value
+            return False, None
+    
+    def validate(self, version: int):
+        """版本号未变化时续期并返回 (True, 值)，否则返回 (False, None)，需要重新加载"""
+        with self._lock:
+            if self._loaded and self._version == version:
+                self._checked_at = time.monotonic()
+                return True, self._value
+            return False, None
+    
+    def set(self, value: Any, version: int):
+        """写入从数据库加载的值及其版本号"""
+        with self._lock:
+            self._value = value
+            self._version = version
+            self._loaded = True
+            self._checked_at = time.monotonic()
+    
+    def clear(self):
+        """清空缓存，下次读取时重新加载"""
+        with self._lock:
+            self._loaded = False
+            self._value = None
+            self._version = None
+
+
+today_state_cache = TodayStateCache(settings.TODAY_STATE_CACHE_SIZE)
+active_schedule_cache = VersionedCache("active_work_schedule", settings.SCHEDULE_CACHE_TTL)
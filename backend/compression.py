@@ -0,0 +1,143 @@
+"""
+响应压缩
+
+CompressionMiddleware 按请求的 Accept-Encoding 协商压缩方式：安装了 brotli 时优先使用 br，
+否则使用 gzip。小于 COMPRESSION_MIN_SIZE 的响应、已编码的响应、304 以及 SSE 等流式事件不压缩；
+StreamingResponse（如月度导出）逐块压缩并 flush，客户端仍能边下载边处理。
+较大的响应体放到线程池中压缩，不阻塞事件循环。
+"""
+import zlib
+from typing import Optional
+import anyio.to_thread
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # 可选依赖
+    brotli = None
+
+# 不压缩的内容类型（已压缩的格式、需要实时推送的事件流）
+EXCLUDED_CONTENT_TYPES = ("text/event-stream", "application/gzip", "application/zip", "image/", "video/", "audio/")
+# 超过该大小的响应体在线程池中压缩
+THREAD_MIN_SIZE = 256 * 1024
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """根据 Accept-Encoding（含 q 值）选择 br / gzip，均不可用时返回 None"""
+    weights = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name.strip()] = q
+    
+    candidates = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best, best_q = None, 0.0
+    for encoding in candidates:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class _Compressor:
+    """gzip / br 流式压缩器"""
+    
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+        else:
+            # wbits=31：带 gzip 头和 CRC
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+    
+    def compress(self, data: bytes, final: bool) -> bytes:
+        """压缩一块数据；final=False 时 flush 出目前为止的全部输出"""
+        if self.encoding == "br":
+            output = self._brotli.process(data)
+            return output + (self._brotli.finish() if final else self._brotli.flush())
+        output = self._zlib.compress(data)
+        return output + self._zlib.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class CompressionMiddleware:
+    """按 Accept-Encoding 压缩响应体"""
+    
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        
+        start_message = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+        
+        async def compress(data: bytes, final: bool) -> bytes:
+            if len(data) >= THREAD_MIN_SIZE:
+                return await anyio.to_thread.run_sync(compressor.compress, data, final)
+            return compressor.compress(data, final)
+        
+        async def send_compressed(message):
+            nonlocal start_message, compressor, passthrough
+            message_type = message["type"]
+            if message_type == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "").lower()
+                passthrough = (
+                    "content-encoding" in headers
+                    or message["status"] in (204, 206, 304)
+                    or content_type.startswith(EXCLUDED_CONTENT_TYPES)
+                )
+                if passthrough:
+                    await send(message)
+                else:
+                    # 等第一块响应体到达后再决定是否压缩
+                    start_message = message
+                return
+            
+            if message_type != "http.response.body" or passthrough:
+                await send(message)
+                return
+            
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start_message is not None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                headers.add_vary_header("Accept-Encoding")
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                
+                compressor = _Compressor(encoding, self.gzip_level, self.brotli_quality)
+                body = await compress(body, final=not more_body)
+                headers["Content-Encoding"] = encoding
+                if more_body:
+                    del headers["Content-Length"]
+                else:
+                    headers["Content-Length"] = str(len(body))
+                await send(start_message)
+                start_message = None
+            else:
+                body = await compress(body, final=not more_body)
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+        
+        await self.app(scope, receive, send_compressed)
@@ -1,3 +1,4 @@
+from typing import Optional
 from pydantic_settings import BaseSettings
 
 
@@ -5,6 +6,43 @@ class Settings(BaseSettings):
     DATABASE_URL: str
     SECRET_KEY: str = "your-secret-key-change-in-production"
     DEBUG: bool = True
+    # 打印 SQL 语句（与 DEBUG 无关，生产环境保持关闭）
+    DB_ECHO: bool = False
+    # 连接池配置
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30.0  # 连接池耗尽时等待连接的秒数
+    DB_POOL_RECYCLE: int = 1800  # 连接最长存活秒数（需小于 MySQL wait_timeout）
+    DB_POOL_PRE_PING: bool = True
+    # 使用异步数据库会话和异步路由（需要 aiosqlite / aiomysql 等异步驱动）
+    ASYNC_DB: bool = False
+    # 异步数据库连接串，不设置时根据 DATABASE_URL 推断
+    ASYNC_DATABASE_URL: Optional[str] = None
+    # 员工当日考勤状态缓存容量（0 表示关闭）。缓存只在本进程内有效，
+    # 多 worker 部署且同一员工的请求不固定路由到同一进程时应设为 0
+    TODAY_STATE_CACHE_SIZE: int = 10000
+    # 当前工作时间缓存的版本检查间隔（秒），间隔内直接使用本地缓存
+    SCHEDULE_CACHE_TTL: float = 5.0
+    # 签到/签退写入方式：direct 每个请求提交一次事务；buffered 先写本地日志立即返回，后台批量写库
+    INGEST_MODE: str = "direct"
+    INGEST_LOG_PATH: str = "./ingest.log"
+    INGEST_FLUSH_INTERVAL: float = 0.5  # 后台批量写库间隔（秒）
+    INGEST_BATCH_SIZE: int = 1000  # 每批最多写入的事件数
+    INGEST_MAX_RETRIES: int = 3  # 一批连续写库失败的次数上限，超过后逐条写入，仍失败的事件移入死信日志
+    INGEST_DEAD_LETTER_PATH: str = "./ingest.dead.log"
+    # 工作时间（上班/下班时间）所在的时区（IANA 名称，如 Asia/Shanghai）。考勤时间戳按 UTC 存储，
+    # 报表把每天的工作时间换算成 UTC 后再计算迟到/早退
+    TIMEZONE: str = "UTC"
+    # 考勤记录月度归档文件目录（见 archive.py）
+    ARCHIVE_DIR: str = "./archive"
+    ARCHIVE_CACHE_MONTHS: int = 2  # 进程内缓存的已解码归档月数（每月占用与记录数成正比）
+    # 响应压缩：按 Accept-Encoding 使用 br（需安装 brotli）或 gzip，小于该字节数的响应不压缩
+    COMPRESSION_MIN_SIZE: int = 1024
+    GZIP_LEVEL: int = 6
+    BROTLI_QUALITY: int = 4
+    # 考勤事件推送（SSE）：每个订阅者最多积压的消息数（超出后通知其重新拉取），心跳间隔（秒）
+    STREAM_QUEUE_SIZE: int = 256
+    STREAM_HEARTBEAT: float = 15.0
     
     class Config:
         env_file = ".env"
@@ -1,21 +1,39 @@
 import pytest
-from sqlalchemy import create_engine
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from fastapi.testclient import TestClient
-from database import Base, get_db
-from main import app
+from database import Base, get_db, get_async_db
+from cache import today_state_cache, active_schedule_cache
+from instrumentation import instrument_engine, route_db_stats
+from metrics import REGISTRY
+from main import app, create_app
 
 # 使用内存数据库进行测试
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
 
 engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+instrument_engine(engine)
+
+# 异步模式使用同一个数据库文件（aiosqlite）
+async_engine = create_async_engine("sqlite+aiosqlite:///./test.db", poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+instrument_engine(async_engine.sync_engine)
+async_app = create_app(async_db=True)
 
 
 @pytest.fixture(scope="function")
 def db():
     """创建测试数据库会话"""
     Base.metadata.create_all(bind=engine)
+    today_state_cache.clear()
+    active_schedule_cache.clear()
+    route_db_stats.clear()
+    for metric in REGISTRY:
+        metric.clear()
     db = TestingSessionLocal()
     try:
         yield db
@@ -24,16 +42,55 @@ def db():
         Base.metadata.drop_all(bind=engine)
 
 
+@pytest.fixture
+def state_cache(monkeypatch):
+    """开启员工当日状态缓存（不受环境变量 TODAY_STATE_CACHE_SIZE 影响）"""
+    monkeypatch.setattr(today_state_cache, "max_size", 10000)
+    return today_state_cache
+
+
+@pytest.fixture(scope="function", params=["sync", "async"])
+def client(request, db):
+    """创建测试客户端（分别使用同步路由和异步路由）"""
+    if request.param == "sync":
+        def override_get_db():
+            try:
+                yield db
+            finally:
+                pass
+        
+        test_app = app
+        test_app.dependency_overrides[get_db] = override_get_db
+    else:
+        async def override_get_async_db():
+            async with TestingAsyncSessionLocal() as async_db:
+                yield async_db
+        
+        test_app = async_app
+        test_app.dependency_overrides[get_async_db] = override_get_async_db
+    
+    with TestClient(test_app) as test_client:
+        yield test_client
+    test_app.dependency_overrides.clear()
+
+
 @pytest.fixture(scope="function")
-def client(db):
-    """创建测试客户端"""
-    def override_get_db():
+def count_queries():
+    """统计代码块内执行的 SQL 语句"""
+    @contextmanager
+    def counter():
+        statements = []
+        
+        def on_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        
+        engines = [engine, async_engine.sync_engine]
+        for target in engines:
+            event.listen(target, "before_cursor_execute", on_execute)
         try:
-            yield db
+            yield statements
         finally:
-            pass
+            for target in engines:
+                event.remove(target, "before_cursor_execute", on_execute)
     
-    app.dependency_overrides[get_db] = override_get_db
-    with TestClient(app) as test_client:
-        yield test_client
-    app.dependency_overrides.clear()
+    return counter
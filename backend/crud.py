@@ -1,9 +1,30 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, extract
-from datetime import datetime, date
-from typing import List, Optional
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import and_, or_, func, insert, select
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, date, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import uuid
+import archive
 import models
 import schemas
+from broadcast import broadcaster
+from cache import TodayState, today_state_cache, active_schedule_cache
+from metrics import record_attendance_events
+
+
+# 时间范围
+def day_range(day: date) -> Tuple[datetime, datetime]:
+    """返回某一天的半开时间区间 [当天 00:00, 次日 00:00)"""
+    start = datetime(day.year, day.month, day.day)
+    return start, start + timedelta(days=1)
+
+
+def month_range(year: int, month: int) -> Tuple[datetime, datetime]:
+    """返回某个月的半开时间区间 [当月 1 日, 次月 1 日)"""
+    start = datetime(year, month, 1)
+    if month == 12:
+        return start, datetime(year + 1, 1, 1)
+    return start, datetime(year, month + 1, 1)
 
 
 # Employee CRUD
@@ -12,6 +33,15 @@ def get_employee(db: Session, employee_id: int) -> Optional[models.Employee]:
     return db.query(models.Employee).filter(models.Employee.id == employee_id).first()
 
 
+def get_employees_by_ids(db: Session, employee_ids: Iterable[int]) -> Dict[int, models.Employee]:
+    """根据ID批量获取员工，返回 {id: 员工}"""
+    ids = set(employee_ids)
+    if not ids:
+        return {}
+    employees = db.query(models.Employee).filter(models.Employee.id.in_(ids)).all()
+    return {employee.id: employee for employee in employees}
+
+
 def get_employee_by_employee_id(db: Session, employee_id: str) -> Optional[models.Employee]:
     """根据员工编号获取员工"""
     return db.query(models.Employee).filter(models.Employee.employee_id == employee_id).first()
@@ -22,17 +52,34 @@ def get_employee_by_email(db: Session, email: str) -> Optional[models.Employee]:
     return db.query(models.Employee).filter(models.Employee.email == email).first()
 
 
-def get_employees(db: Session, skip: int = 0, limit: int = 100) -> List[models.Employee]:
-    """获取员工列表"""
-    return db.query(models.Employee).offset(skip).limit(limit).all()
+def get_employees(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    after_id: Optional[int] = None
+) -> List[models.Employee]:
+    """获取员工列表（按 id 排序；传入 after_id 时使用游标分页，忽略 skip）"""
+    query = db.query(models.Employee).order_by(models.Employee.id)
+    if after_id is not None:
+        query = query.filter(models.Employee.id > after_id)
+    else:
+        query = query.offset(skip)
+    return query.limit(limit).all()
+
+
+def get_employees_version(db: Session) -> Tuple[int, Optional[datetime]]:
+    """员工表的数据版本 (行数, 最近更新时间)，用于计算列表接口的 ETag"""
+    return tuple(db.query(func.count(models.Employee.id), func.max(models.Employee.updated_at)).one())
 
 
 def create_employee(db: Session, employee: schemas.EmployeeCreate) -> models.Employee:
     """创建员工"""
     db_employee = models.Employee(**employee.model_dump())
     db.add(db_employee)
+    db.flush()
+    # 同时创建状态行，首次签到只需一条条件 UPDATE
+    db.add(models.EmployeeAttendanceState(employee_id=db_employee.id, work_date=date.today()))
     db.commit()
-    db.refresh(db_employee)
     return db_employee
 
 
@@ -48,31 +95,196 @@ def update_employee(db: Session, employee_id: int, employee: schemas.EmployeeUpd
     
     db_employee.updated_at = datetime.utcnow()
     db.commit()
-    db.refresh(db_employee)
+    today_state_cache.invalidate(employee_id)
     return db_employee
 
 
 # Attendance Record CRUD
-def create_attendance_record(db: Session, record: schemas.AttendanceRecordCreate) -> models.AttendanceRecord:
-    """创建考勤记录"""
-    db_record = models.AttendanceRecord(**record.model_dump(), timestamp=datetime.utcnow())
+def create_attendance_record(
+    db: Session,
+    record: schemas.AttendanceRecordCreate,
+    absorb: bool = True
+) -> Optional[models.AttendanceRecord]:
+    """创建考勤记录（先原子地切换员工状态，与当前状态冲突时返回 None）
+    
+    absorb=False 表示由调用方把记录并入已归档的月份（见 absorb_into_archives）。
+    """
+    timestamp = datetime.utcnow()
+    if not claim_attendance_transition(db, record.employee_id, record.attendance_type, timestamp):
+        db.rollback()
+        today_state_cache.invalidate(record.employee_id)
+        return None
+    
+    db_record = models.AttendanceRecord(**record.model_dump(), timestamp=timestamp)
     db.add(db_record)
+    apply_to_daily_summaries(db, [(db_record.employee_id, db_record.attendance_type, db_record.timestamp)])
     db.commit()
-    db.refresh(db_record)
+    today_state_cache.record(db_record.employee_id, db_record.attendance_type, db_record.timestamp)
+    record_attendance_events(db_record.attendance_type)
+    broadcaster.publish_attendance(db_record.employee_id, db_record.attendance_type, db_record.timestamp, db_record.id)
+    if absorb:
+        absorb_into_archives(db, [db_record.timestamp])
     return db_record
 
 
+def create_attendance_records_bulk(
+    db: Session,
+    records: List[schemas.AttendanceRecordCreate],
+    absorb: bool = True
+) -> List[Optional[dict]]:
+    """批量创建考勤记录（逐条切换员工状态后单个事务、多行 INSERT），返回与 records 一一对应的写入值，冲突的为 None
+    
+    每个事件的时间按批内顺序依次加 1 微秒，同一批中的签到、签退先后分明（配对、当日最后状态不依赖 ID 排序）。
+    """
+    now = datetime.utcnow()
+    results = []
+    for index, record in enumerate(records):
+        timestamp = now + timedelta(microseconds=index)
+        if claim_attendance_transition(db, record.employee_id, record.attendance_type, timestamp):
+            # event_id 用于在不支持 INSERT ... RETURNING 的数据库上查回记录 ID
+            results.append({**record.model_dump(), "timestamp": timestamp, "event_id": uuid.uuid4().hex})
+        else:
+            today_state_cache.invalidate(record.employee_id)
+            results.append(None)
+    
+    rows = [row for row in results if row is not None]
+    if rows:
+        insert_attendance_rows(db, rows, update_states=False, absorb=absorb)
+        _load_record_ids(db, rows)
+        for row in rows:
+            broadcaster.publish_attendance(row["employee_id"], row["attendance_type"], row["timestamp"], row.get("id"))
+    else:
+        db.rollback()
+    return results
+
+
+def insert_attendance_rows(
+    db: Session,
+    rows: List[dict],
+    update_states: bool = True,
+    absorb: bool = True
+) -> List[dict]:
+    """写入已带 timestamp 的考勤记录行（单个事务、多行 INSERT），数据库支持 INSERT ... RETURNING 时
+    把生成的记录 ID 写回各行的 "id"
+    
+    update_states=False 表示调用方已经切换过员工状态；absorb=False 表示由调用方把记录并入已归档的月份。
+    """
+    if not rows:
+        return []
+    now = datetime.utcnow()
+    for row in rows:
+        row.setdefault("created_at", now)
+    if db.get_bind().dialect.insert_executemany_returning_sort_by_parameter_order:
+        ids = db.scalars(
+            insert(models.AttendanceRecord).returning(models.AttendanceRecord.id, sort_by_parameter_order=True),
+            rows
+        ).all()
+        for row, record_id in zip(rows, ids):
+            row["id"] = record_id
+    else:
+        db.execute(insert(models.AttendanceRecord), rows)
+    apply_to_daily_summaries(db, [(row["employee_id"], row["attendance_type"], row["timestamp"]) for row in rows])
+    if update_states:
+        sync_attendance_states(db, rows)
+    db.commit()
+    for row in rows:
+        today_state_cache.record(row["employee_id"], row["attendance_type"], row["timestamp"])
+        record_attendance_events(row["attendance_type"])
+    if absorb:
+        absorb_into_archives(db, [row["timestamp"] for row in rows])
+    return rows
+
+
+def _load_record_ids(db: Session, rows: List[dict], chunk_size: int = 500):
+    """按 event_id 查回 INSERT 时没能返回的记录 ID（如 MySQL），写回各行的 id 键"""
+    missing = {row["event_id"]: row for row in rows if "id" not in row and row.get("event_id")}
+    event_ids = list(missing)
+    for offset in range(0, len(event_ids), chunk_size):
+        for record_id, event_id in db.query(models.AttendanceRecord.id, models.AttendanceRecord.event_id).filter(
+            models.AttendanceRecord.event_id.in_(event_ids[offset:offset + chunk_size])
+        ):
+            missing[event_id]["id"] = record_id
+
+
+def absorb_into_archives(db: Session, timestamps: Iterable[datetime]):
+    """写库后检查记录所在的月份是否已经归档（写后缓冲跨月才写库、重放日志、与归档并发的写入），
+    已归档时把记录并入归档文件，月度查询才能看到"""
+    for year, month in {(timestamp.year, timestamp.month) for timestamp in timestamps}:
+        if get_monthly_archive(db, year, month) is not None:
+            archive.absorb_late_records(db, year, month)
+
+
+def filter_new_attendance_rows(db: Session, rows: List[dict], chunk_size: int = 500) -> List[dict]:
+    """去掉数据库（含归档）中已存在的考勤记录行：带 event_id 的行按 event_id 去重，
+    没有 event_id 的行（旧版本日志）按员工、类型、时间均相同去重"""
+    if not rows:
+        return []
+    event_ids = [row["event_id"] for row in rows if row.get("event_id")]
+    existing_ids = set()
+    for offset in range(0, len(event_ids), chunk_size):
+        existing_ids.update(event_id for (event_id,) in db.query(models.AttendanceRecord.event_id).filter(
+            models.AttendanceRecord.event_id.in_(event_ids[offset:offset + chunk_size])
+        ))
+    # 已经并入归档文件的记录
+    for year, month in {(row["timestamp"].year, row["timestamp"].month) for row in rows if row.get("event_id")}:
+        archived = get_monthly_archive(db, year, month)
+        if archived is not None:
+            existing_ids.update(archive.read_archive(archived)["event_id"])
+    
+    legacy = [row for row in rows if not row.get("event_id")]
+    existing = set(
+        db.query(
+            models.AttendanceRecord.employee_id,
+            models.AttendanceRecord.attendance_type,
+            models.AttendanceRecord.timestamp
+        ).filter(
+            models.AttendanceRecord.employee_id.in_({row["employee_id"] for row in legacy}),
+            models.AttendanceRecord.timestamp >= min(row["timestamp"] for row in legacy),
+            models.AttendanceRecord.timestamp <= max(row["timestamp"] for row in legacy)
+        ).all()
+    ) if legacy else set()
+    return [
+        row for row in rows
+        if (row["event_id"] not in existing_ids if row.get("event_id")
+            else (row["employee_id"], row["attendance_type"], row["timestamp"]) not in existing)
+    ]
+
+
 def get_attendance_records(
     db: Session,
     employee_id: Optional[int] = None,
     skip: int = 0,
-    limit: int = 100
+    limit: int = 100,
+    before: Optional[Tuple[datetime, int]] = None
 ) -> List[models.AttendanceRecord]:
-    """获取考勤记录"""
-    query = db.query(models.AttendanceRecord)
+    """获取考勤记录（按时间倒序；传入 before=(timestamp, id) 时使用游标分页，忽略 skip；不含已归档的月份）"""
+    query = db.query(models.AttendanceRecord).order_by(
+        models.AttendanceRecord.timestamp.desc(),
+        models.AttendanceRecord.id.desc()
+    )
     if employee_id:
         query = query.filter(models.AttendanceRecord.employee_id == employee_id)
-    return query.order_by(models.AttendanceRecord.timestamp.desc()).offset(skip).limit(limit).all()
+    if before is not None:
+        timestamp, record_id = before
+        query = query.filter(
+            or_(
+                models.AttendanceRecord.timestamp < timestamp,
+                and_(
+                    models.AttendanceRecord.timestamp == timestamp,
+                    models.AttendanceRecord.id < record_id
+                )
+            )
+        )
+    else:
+        query = query.offset(skip)
+    return query.limit(limit).all()
+
+
+def get_monthly_archive(db: Session, year: int, month: int) -> Optional[models.AttendanceArchive]:
+    """获取某月的归档登记（本月及以后的月份不会归档，不查询数据库）"""
+    if not archive.is_closed_month(year, month):
+        return None
+    return archive.get_archive(db, year, month)
 
 
 def get_monthly_attendance_records(
@@ -81,11 +293,18 @@ def get_monthly_attendance_records(
     month: int,
     employee_id: Optional[int] = None
 ) -> List[models.AttendanceRecord]:
-    """获取月度考勤记录"""
-    query = db.query(models.AttendanceRecord).filter(
+    """获取月度考勤记录（同时预加载员工信息；已归档的月份读取归档文件）"""
+    archived = get_monthly_archive(db, year, month)
+    if archived is not None:
+        return archive.archived_records(db, archived, employee_id)
+    
+    start, end = month_range(year, month)
+    query = db.query(models.AttendanceRecord).options(
+        joinedload(models.AttendanceRecord.employee)
+    ).filter(
         and_(
-            extract('year', models.AttendanceRecord.timestamp) == year,
-            extract('month', models.AttendanceRecord.timestamp) == month
+            models.AttendanceRecord.timestamp >= start,
+            models.AttendanceRecord.timestamp < end
         )
     )
     if employee_id:
@@ -93,26 +312,435 @@ def get_monthly_attendance_records(
     return query.order_by(models.AttendanceRecord.timestamp.desc()).all()
 
 
+def monthly_counts_query(year: int, month: int, employee_id: Optional[int] = None):
+    """按每日汇总表统计月度签到/签退次数的查询（汇总表不归档，已归档的月份同样适用）"""
+    start, end = month_range(year, month)
+    summary = models.DailyAttendanceSummary
+    query = select(
+        func.coalesce(func.sum(summary.check_in_count), 0),
+        func.coalesce(func.sum(summary.check_out_count), 0)
+    ).where(
+        and_(
+            summary.work_date >= start.date(),
+            summary.work_date < end.date()
+        )
+    )
+    if employee_id:
+        query = query.where(summary.employee_id == employee_id)
+    return query
+
+
+def monthly_counts(row) -> Dict[models.AttendanceTypeEnum, int]:
+    check_in_count, check_out_count = row
+    return {
+        models.AttendanceTypeEnum.CHECK_IN: int(check_in_count),
+        models.AttendanceTypeEnum.CHECK_OUT: int(check_out_count),
+    }
+
+
+def get_monthly_attendance_counts(
+    db: Session,
+    year: int,
+    month: int,
+    employee_id: Optional[int] = None
+) -> Dict[models.AttendanceTypeEnum, int]:
+    """按考勤类型统计月度记录数（读取每日汇总表，不扫描原始考勤记录），返回 {考勤类型: 数量}"""
+    return monthly_counts(db.execute(monthly_counts_query(year, month, employee_id)).one())
+
+
+def iter_monthly_attendance_rows(
+    db: Session,
+    year: int,
+    month: int,
+    employee_id: Optional[int] = None,
+    batch_size: int = 1000
+) -> Iterator[Tuple]:
+    """逐行迭代月度考勤记录（含员工编号和姓名），使用服务端游标分批读取，用于导出"""
+    archived = get_monthly_archive(db, year, month)
+    if archived is not None:
+        return archive.archived_rows(db, archived, employee_id)
+    
+    start, end = month_range(year, month)
+    query = db.query(
+        models.AttendanceRecord.id,
+        models.AttendanceRecord.employee_id,
+        models.Employee.employee_id,
+        models.Employee.name,
+        models.AttendanceRecord.attendance_type,
+        models.AttendanceRecord.timestamp,
+        models.AttendanceRecord.latitude,
+        models.AttendanceRecord.longitude,
+        models.AttendanceRecord.notes,
+        models.AttendanceRecord.created_at
+    ).join(
+        models.Employee, models.Employee.id == models.AttendanceRecord.employee_id
+    ).filter(
+        and_(
+            models.AttendanceRecord.timestamp >= start,
+            models.AttendanceRecord.timestamp < end
+        )
+    )
+    if employee_id:
+        query = query.filter(models.AttendanceRecord.employee_id == employee_id)
+    query = query.order_by(models.AttendanceRecord.timestamp, models.AttendanceRecord.id)
+    return iter(query.yield_per(batch_size))
+
+
 def get_today_last_record(db: Session, employee_id: int) -> Optional[models.AttendanceRecord]:
     """获取今天最后一条考勤记录"""
-    today = date.today()
+    start, end = day_range(date.today())
     return db.query(models.AttendanceRecord).filter(
         and_(
             models.AttendanceRecord.employee_id == employee_id,
-            extract('year', models.AttendanceRecord.timestamp) == today.year,
-            extract('month', models.AttendanceRecord.timestamp) == today.month,
-            extract('day', models.AttendanceRecord.timestamp) == today.day
+            models.AttendanceRecord.timestamp >= start,
+            models.AttendanceRecord.timestamp < end
+        )
+    ).order_by(
+        models.AttendanceRecord.timestamp.desc(),
+        models.AttendanceRecord.id.desc()
+    ).first()
+
+
+def get_today_state(db: Session, employee_id: int) -> Optional[TodayState]:
+    """获取员工今天的考勤状态（优先读缓存，未命中时读员工状态行并回填），员工不存在时返回 None"""
+    state = today_state_cache.get(employee_id)
+    if state is not None:
+        return state
+    
+    row = db.query(
+        models.Employee.is_active,
+        models.EmployeeAttendanceState.work_date,
+        models.EmployeeAttendanceState.last_type,
+        models.EmployeeAttendanceState.last_timestamp
+    ).outerjoin(
+        models.EmployeeAttendanceState,
+        models.EmployeeAttendanceState.employee_id == models.Employee.id
+    ).filter(models.Employee.id == employee_id).first()
+    if row is None:
+        return None
+    
+    if row.work_date is None:
+        # 还没有状态行（状态表上线前写入的记录），按今天最后一条记录判断
+        last_record = get_today_last_record(db, employee_id)
+        last_type = last_record.attendance_type if last_record else None
+        last_timestamp = last_record.timestamp if last_record else None
+    elif row.work_date == date.today():
+        last_type, last_timestamp = row.last_type, row.last_timestamp
+    else:
+        last_type = last_timestamp = None
+    state = TodayState(is_active=bool(row.is_active), attendance_type=last_type, timestamp=last_timestamp)
+    today_state_cache.set(employee_id, state)
+    return state
+
+
+def get_today_last_types(
+    db: Session,
+    employee_ids: Iterable[int]
+) -> Dict[int, models.AttendanceTypeEnum]:
+    """批量获取员工今天最后一条考勤记录的类型，返回 {员工ID: 考勤类型}"""
+    ids = set(employee_ids)
+    if not ids:
+        return {}
+    start, end = day_range(date.today())
+    rows = db.query(
+        models.AttendanceRecord.employee_id,
+        models.AttendanceRecord.attendance_type
+    ).filter(
+        and_(
+            models.AttendanceRecord.employee_id.in_(ids),
+            models.AttendanceRecord.timestamp >= start,
+            models.AttendanceRecord.timestamp < end
+        )
+    ).order_by(models.AttendanceRecord.timestamp, models.AttendanceRecord.id).all()
+    # 按时间顺序覆盖，保留每个员工最后一条
+    return {employee_id: attendance_type for employee_id, attendance_type in rows}
+
+
+# Attendance State CRUD
+def _transition_allowed(attendance_type: models.AttendanceTypeEnum, today: date):
+    """状态行允许切换到 attendance_type 的条件：签到要求今天未处于签到状态，签退要求今天已签到"""
+    state = models.EmployeeAttendanceState
+    if attendance_type == models.AttendanceTypeEnum.CHECK_IN:
+        return or_(
+            state.work_date != today,
+            state.last_type.is_(None),
+            state.last_type != models.AttendanceTypeEnum.CHECK_IN
         )
-    ).order_by(models.AttendanceRecord.timestamp.desc()).first()
+    return and_(state.work_date == today, state.last_type == models.AttendanceTypeEnum.CHECK_IN)
+
+
+def _ensure_attendance_state(db: Session, employee_id: int) -> bool:
+    """员工没有状态行时按今天最后一条考勤记录创建，返回是否需要重试切换（已有状态行时返回 False）"""
+    state = models.EmployeeAttendanceState
+    if db.query(state.employee_id).filter(state.employee_id == employee_id).first() is not None:
+        return False
+    
+    last_record = get_today_last_record(db, employee_id)
+    try:
+        with db.begin_nested():
+            db.execute(insert(state).values(
+                employee_id=employee_id,
+                work_date=date.today(),
+                last_type=last_record.attendance_type if last_record else None,
+                last_timestamp=last_record.timestamp if last_record else None,
+                version=0
+            ))
+    except IntegrityError:
+        # 并发请求已创建状态行
+        pass
+    return True
+
+
+def claim_attendance_transition(
+    db: Session,
+    employee_id: int,
+    attendance_type: models.AttendanceTypeEnum,
+    timestamp: datetime
+) -> bool:
+    """用条件 UPDATE 原子地切换员工状态（签到/签退必须交替），成功返回 True，不提交事务
+    
+    并发请求中只有一个能命中 WHERE 条件，其余 UPDATE 影响 0 行，无需表锁或串行化。
+    """
+    state = models.EmployeeAttendanceState
+    today = date.today()
+    for _ in range(2):
+        updated = db.query(state).filter(
+            state.employee_id == employee_id,
+            _transition_allowed(attendance_type, today)
+        ).update({
+            state.work_date: today,
+            state.last_type: attendance_type,
+            state.last_timestamp: timestamp,
+            state.version: state.version + 1
+        }, synchronize_session=False)
+        if updated:
+            return True
+        if not _ensure_attendance_state(db, employee_id):
+            return False
+    return False
+
+
+def sync_attendance_states(db: Session, rows: List[dict]):
+    """按已校验过的考勤记录行推进员工状态（只前进不回退），不提交事务"""
+    latest: Dict[int, dict] = {}
+    for row in rows:
+        current = latest.get(row["employee_id"])
+        if current is None or row["timestamp"] >= current["timestamp"]:
+            latest[row["employee_id"]] = row
+    
+    state = models.EmployeeAttendanceState
+    for employee_id, row in latest.items():
+        updated = db.query(state).filter(
+            state.employee_id == employee_id,
+            or_(state.last_timestamp.is_(None), state.last_timestamp <= row["timestamp"])
+        ).update({
+            # 按事件自身的日期：跨零点才写库的事件不会被当成今天的状态
+            state.work_date: row["timestamp"].date(),
+            state.last_type: row["attendance_type"],
+            state.last_timestamp: row["timestamp"],
+            state.version: state.version + 1
+        }, synchronize_session=False)
+        if not updated:
+            # 没有状态行时由（已包含本批记录的）今天最后一条记录创建
+            _ensure_attendance_state(db, employee_id)
+
+
+# Daily Summary CRUD
+def _apply_event(
+    summary: models.DailyAttendanceSummary,
+    attendance_type: models.AttendanceTypeEnum,
+    timestamp: datetime
+):
+    """将一条考勤记录累加到每日汇总"""
+    if attendance_type == models.AttendanceTypeEnum.CHECK_IN:
+        summary.check_in_count += 1
+        if summary.first_check_in is None:
+            summary.first_check_in = timestamp
+        summary.open_check_in = timestamp
+    else:
+        summary.check_out_count += 1
+        summary.last_check_out = timestamp
+        if summary.open_check_in is not None:
+            summary.pair_count += 1
+            summary.worked_seconds += int((timestamp - summary.open_check_in).total_seconds())
+            summary.open_check_in = None
+
+
+def apply_to_daily_summaries(
+    db: Session,
+    events: List[Tuple[int, models.AttendanceTypeEnum, datetime]]
+):
+    """按时间顺序将考勤记录 (员工ID, 类型, 时间) 累加到每日汇总，不提交事务"""
+    if not events:
+        return
+    employee_ids = {employee_id for employee_id, _, _ in events}
+    work_dates = {timestamp.date() for _, _, timestamp in events}
+    summaries = {
+        (summary.employee_id, summary.work_date): summary
+        for summary in db.query(models.DailyAttendanceSummary).filter(
+            and_(
+                models.DailyAttendanceSummary.employee_id.in_(employee_ids),
+                models.DailyAttendanceSummary.work_date.in_(work_dates)
+            )
+        )
+    }
+    for employee_id, attendance_type, timestamp in events:
+        key = (employee_id, timestamp.date())
+        summary = summaries.get(key)
+        if summary is None:
+            summary = models.DailyAttendanceSummary(
+                employee_id=employee_id,
+                work_date=key[1],
+                check_in_count=0,
+                check_out_count=0,
+                pair_count=0,
+                worked_seconds=0
+            )
+            db.add(summary)
+            summaries[key] = summary
+        _apply_event(summary, attendance_type, timestamp)
+
+
+def rebuild_daily_summaries(db: Session, year: int, month: int) -> int:
+    """根据原始考勤记录（或归档文件）重建某月的每日汇总（用于历史数据回填），返回汇总行数"""
+    start, end = month_range(year, month)
+    db.query(models.DailyAttendanceSummary).filter(
+        and_(
+            models.DailyAttendanceSummary.work_date >= start.date(),
+            models.DailyAttendanceSummary.work_date < end.date()
+        )
+    ).delete(synchronize_session=False)
+    
+    summaries = {}
+    archived = get_monthly_archive(db, year, month)
+    if archived is not None:
+        rows = archive.archived_events(archived)
+    else:
+        rows = db.query(
+            models.AttendanceRecord.employee_id,
+            models.AttendanceRecord.attendance_type,
+            models.AttendanceRecord.timestamp
+        ).filter(
+            and_(
+                models.AttendanceRecord.timestamp >= start,
+                models.AttendanceRecord.timestamp < end
+            )
+        ).order_by(models.AttendanceRecord.timestamp, models.AttendanceRecord.id).yield_per(10000)
+    for employee_id, attendance_type, timestamp in rows:
+        key = (employee_id, timestamp.date())
+        summary = summaries.get(key)
+        if summary is None:
+            summary = summaries[key] = models.DailyAttendanceSummary(
+                employee_id=employee_id,
+                work_date=key[1],
+                check_in_count=0,
+                check_out_count=0,
+                pair_count=0,
+                worked_seconds=0
+            )
+        _apply_event(summary, attendance_type, timestamp)
+    
+    db.add_all(summaries.values())
+    db.commit()
+    return len(summaries)
+
+
+# 每日汇总回填完成后在缓存版本表中记录的标记
+SUMMARY_BACKFILL_MARKER = "daily_summary_backfill"
+
+
+def backfill_daily_summaries(db: Session) -> List[Tuple[int, int]]:
+    """为汇总表上线前写入的历史数据一次性重建每日汇总（应用启动时调用）
+    
+    按原始考勤记录和归档文件重建所有有数据的月份，完成后写入标记，之后直接返回；
+    中途失败时下次启动重新执行（重建是幂等的）。返回重建的 (年, 月)。
+    """
+    if get_cache_version(db, SUMMARY_BACKFILL_MARKER):
+        return []
+    
+    months = {(archived.year, archived.month) for archived in db.query(models.AttendanceArchive)}
+    first, last = db.query(
+        func.min(models.AttendanceRecord.timestamp),
+        func.max(models.AttendanceRecord.timestamp)
+    ).one()
+    if first is not None:
+        year, month = first.year, first.month
+        while (year, month) <= (last.year, last.month):
+            months.add((year, month))
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    
+    for year, month in sorted(months):
+        rebuild_daily_summaries(db, year, month)
+    bump_cache_version(db, SUMMARY_BACKFILL_MARKER)
+    return sorted(months)
+
+
+def get_daily_summaries(
+    db: Session,
+    year: int,
+    month: int,
+    employee_id: Optional[int] = None
+) -> List[models.DailyAttendanceSummary]:
+    """获取某月的每日考勤汇总"""
+    start, end = month_range(year, month)
+    query = db.query(models.DailyAttendanceSummary).filter(
+        and_(
+            models.DailyAttendanceSummary.work_date >= start.date(),
+            models.DailyAttendanceSummary.work_date < end.date()
+        )
+    )
+    if employee_id:
+        query = query.filter(models.DailyAttendanceSummary.employee_id == employee_id)
+    return query.order_by(
+        models.DailyAttendanceSummary.work_date,
+        models.DailyAttendanceSummary.employee_id
+    ).all()
+
+
+def get_employee_monthly_summaries(
+    db: Session,
+    year: int,
+    month: int,
+    employee_id: Optional[int] = None
+) -> List[schemas.EmployeeMonthlySummary]:
+    """按员工汇总某月的每日考勤汇总"""
+    start, end = month_range(year, month)
+    summary = models.DailyAttendanceSummary
+    query = db.query(
+        summary.employee_id,
+        func.count(summary.id),
+        func.sum(summary.check_in_count),
+        func.sum(summary.check_out_count),
+        func.sum(summary.pair_count),
+        func.sum(summary.worked_seconds)
+    ).filter(
+        and_(
+            summary.work_date >= start.date(),
+            summary.work_date < end.date()
+        )
+    )
+    if employee_id:
+        query = query.filter(summary.employee_id == employee_id)
+    rows = query.group_by(summary.employee_id).order_by(summary.employee_id).all()
+    return [
+        schemas.EmployeeMonthlySummary(
+            employee_id=row[0],
+            days_present=row[1],
+            check_in_count=row[2],
+            check_out_count=row[3],
+            pair_count=row[4],
+            worked_seconds=row[5]
+        )
+        for row in rows
+    ]
 
 
 # Work Schedule CRUD
 def create_work_schedule(db: Session, schedule: schemas.WorkScheduleCreate) -> models.WorkSchedule:
-    """创建工作时间"""
+    """创建工作时间（与缓存版本号的递增在同一个事务中提交）"""
     db_schedule = models.WorkSchedule(**schedule.model_dump())
     db.add(db_schedule)
-    db.commit()
-    db.refresh(db_schedule)
+    invalidate_active_schedule_cache(db)
     return db_schedule
 
 
@@ -129,6 +757,11 @@ def get_work_schedules(db: Session, active_only: bool = True) -> List[models.Wor
     return query.order_by(models.WorkSchedule.created_at.desc()).all()
 
 
+def get_work_schedules_version(db: Session) -> Tuple[int, Optional[datetime]]:
+    """工作时间表的数据版本 (行数, 最近更新时间)，用于计算列表接口的 ETag"""
+    return tuple(db.query(func.count(models.WorkSchedule.id), func.max(models.WorkSchedule.updated_at)).one())
+
+
 def get_active_work_schedule(db: Session) -> Optional[models.WorkSchedule]:
     """获取当前激活的工作时间"""
     return db.query(models.WorkSchedule).filter(
@@ -136,12 +769,36 @@ def get_active_work_schedule(db: Session) -> Optional[models.WorkSchedule]:
     ).first()
 
 
+def get_cached_active_work_schedule(db: Session) -> Optional[schemas.WorkSchedule]:
+    """获取当前激活的工作时间（进程内缓存，通过版本号检测其他进程的修改）"""
+    fresh, schedule = active_schedule_cache.get_fresh()
+    if fresh:
+        return schedule
+    
+    version = get_cache_version(db, active_schedule_cache.name)
+    valid, schedule = active_schedule_cache.validate(version)
+    if valid:
+        return schedule
+    
+    db_schedule = get_active_work_schedule(db)
+    schedule = schemas.WorkSchedule.model_validate(db_schedule) if db_schedule else None
+    active_schedule_cache.set(schedule, version)
+    return schedule
+
+
+def invalidate_active_schedule_cache(db: Session):
+    """工作时间变更后使缓存失效：递增版本号通知其他进程，与会话中尚未提交的修改在同一个事务中提交
+    （不会出现修改已提交而版本号未递增、其他进程继续使用旧缓存的情况）"""
+    bump_cache_version(db, active_schedule_cache.name)
+    active_schedule_cache.clear()
+
+
 def update_work_schedule(
     db: Session,
     schedule_id: int,
     schedule: schemas.WorkScheduleUpdate
 ) -> Optional[models.WorkSchedule]:
-    """更新工作时间"""
+    """更新工作时间（与缓存版本号的递增在同一个事务中提交）"""
     db_schedule = get_work_schedule(db, schedule_id)
     if db_schedule is None:
         return None
@@ -151,12 +808,44 @@ def update_work_schedule(
         setattr(db_schedule, field, value)
     
     db_schedule.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(db_schedule)
+    invalidate_active_schedule_cache(db)
     return db_schedule
 
 
-def deactivate_all_schedules(db: Session):
-    """停用所有工作时间"""
+def activate_work_schedule(db: Session, schedule_id: int) -> Optional[models.WorkSchedule]:
+    """激活工作时间并停用其他所有工作时间（单个事务），不存在时返回 None 且不做任何修改"""
+    db_schedule = get_work_schedule(db, schedule_id)
+    if db_schedule is None:
+        return None
+    
     db.query(models.WorkSchedule).update({"is_active": False})
+    db_schedule.is_active = True
+    db_schedule.updated_at = datetime.utcnow()
+    invalidate_active_schedule_cache(db)
+    return db_schedule
+
+
+# Cache Version CRUD
+def get_cache_version(db: Session, name: str) -> int:
+    """获取缓存版本号，不存在时为 0"""
+    version = db.query(models.CacheVersion.version).filter(models.CacheVersion.name == name).scalar()
+    return version or 0
+
+
+def _increment_cache_version(db: Session, name: str) -> int:
+    return db.query(models.CacheVersion).filter(models.CacheVersion.name == name).update(
+        {models.CacheVersion.version: models.CacheVersion.version + 1},
+        synchronize_session=False
+    )
+
+
+def bump_cache_version(db: Session, name: str):
+    """递增缓存版本号（版本行不存在时创建，并发创建时改为递增）"""
+    if not _increment_cache_version(db, name):
+        try:
+            # 保存点内插入：并发请求抢先创建时只回滚保存点，不影响触发递增的写入
+            with db.begin_nested():
+                db.execute(insert(models.CacheVersion).values(name=name, version=1))
+        except IntegrityError:
+            _increment_cache_version(db, name)
     db.commit()
@@ -0,0 +1,358 @@
+"""
+异步 CRUD
+
+供 ASYNC_DB 模式下的异步路由使用。热点读取使用 select() 原生异步查询；
+写入及包含汇总表、缓存维护的操作通过 AsyncSession.run_sync 复用 crud 中的同步实现，
+二者在同一个异步连接上执行，不占用线程池。run_sync 中的代码在事件循环线程中运行，
+读写归档文件等耗时的非数据库操作放到线程池中执行（run_in_threadpool）。
+"""
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, or_, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from datetime import datetime, date
+from typing import Dict, Iterable, List, Optional, Tuple
+import archive
+import crud
+import models
+import schemas
+from cache import TodayState, today_state_cache, active_schedule_cache
+from crud import day_range, month_range
+
+
+# Employee CRUD
+async def get_employee(db: AsyncSession, employee_id: int) -> Optional[models.Employee]:
+    """根据ID获取员工"""
+    return await db.scalar(select(models.Employee).where(models.Employee.id == employee_id))
+
+
+async def get_employee_by_employee_id(db: AsyncSession, employee_id: str) -> Optional[models.Employee]:
+    """根据员工编号获取员工"""
+    return await db.scalar(select(models.Employee).where(models.Employee.employee_id == employee_id))
+
+
+async def get_employee_by_email(db: AsyncSession, email: str) -> Optional[models.Employee]:
+    """根据邮箱获取员工"""
+    return await db.scalar(select(models.Employee).where(models.Employee.email == email))
+
+
+async def get_employees_by_ids(db: AsyncSession, employee_ids: Iterable[int]) -> Dict[int, models.Employee]:
+    """根据ID批量获取员工，返回 {id: 员工}"""
+    return await db.run_sync(crud.get_employees_by_ids, employee_ids)
+
+
+async def get_employees(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    after_id: Optional[int] = None
+) -> List[models.Employee]:
+    """获取员工列表（按 id 排序；传入 after_id 时使用游标分页，忽略 skip）"""
+    query = select(models.Employee).order_by(models.Employee.id)
+    if after_id is not None:
+        query = query.where(models.Employee.id > after_id)
+    else:
+        query = query.offset(skip)
+    return list(await db.scalars(query.limit(limit)))
+
+
+async def get_employees_version(db: AsyncSession) -> Tuple[int, Optional[datetime]]:
+    """员工表的数据版本 (行数, 最近更新时间)，用于计算列表接口的 ETag"""
+    return tuple((await db.execute(
+        select(func.count(models.Employee.id), func.max(models.Employee.updated_at))
+    )).one())
+
+
+async def create_employee(db: AsyncSession, employee: schemas.EmployeeCreate) -> models.Employee:
+    """创建员工"""
+    return await db.run_sync(crud.create_employee, employee)
+
+
+async def update_employee(
+    db: AsyncSession,
+    employee_id: int,
+    employee: schemas.EmployeeUpdate
+) -> Optional[models.Employee]:
+    """更新员工信息"""
+    return await db.run_sync(crud.update_employee, employee_id, employee)
+
+
+# Attendance Record CRUD
+async def create_attendance_record(
+    db: AsyncSession,
+    record: schemas.AttendanceRecordCreate
+) -> Optional[models.AttendanceRecord]:
+    """创建考勤记录（原子地切换员工状态，同时更新每日汇总和状态缓存），与当前状态冲突时返回 None"""
+    db_record = await db.run_sync(crud.create_attendance_record, record, absorb=False)
+    if db_record is not None:
+        await absorb_into_archives(db, [db_record.timestamp])
+    return db_record
+
+
+async def create_attendance_records_bulk(
+    db: AsyncSession,
+    records: List[schemas.AttendanceRecordCreate]
+) -> List[Optional[dict]]:
+    """批量创建考勤记录（单个事务、多行 INSERT），返回与 records 一一对应的写入值，冲突的为 None"""
+    rows = await db.run_sync(crud.create_attendance_records_bulk, records, absorb=False)
+    await absorb_into_archives(db, [row["timestamp"] for row in rows if row is not None])
+    return rows
+
+
+async def absorb_into_archives(db: AsyncSession, timestamps: Iterable[datetime]):
+    """写库后把已归档月份的记录并入归档文件（同 crud.absorb_into_archives）：
+    数据库操作通过 run_sync 执行，读写归档文件放到线程池中"""
+    for year, month in {(timestamp.year, timestamp.month) for timestamp in timestamps}:
+        if not archive.is_closed_month(year, month):
+            continue
+        while True:
+            candidate = await db.run_sync(archive.absorb_candidate, year, month)
+            if candidate is None:
+                break
+            archived, late = candidate
+            written = await run_in_threadpool(archive.write_merged_archive, archived, late, year, month)
+            await db.run_sync(archive.switch_archive, archived, late, *written)
+
+
+async def get_attendance_records(
+    db: AsyncSession,
+    employee_id: Optional[int] = None,
+    skip: int = 0,
+    limit: int = 100,
+    before: Optional[Tuple[datetime, int]] = None
+) -> List[models.AttendanceRecord]:
+    """获取考勤记录（按时间倒序；传入 before=(timestamp, id) 时使用游标分页，忽略 skip；不含已归档的月份）"""
+    query = select(models.AttendanceRecord).order_by(
+        models.AttendanceRecord.timestamp.desc(),
+        models.AttendanceRecord.id.desc()
+    )
+    if employee_id:
+        query = query.where(models.AttendanceRecord.employee_id == employee_id)
+    if before is not None:
+        timestamp, record_id = before
+        query = query.where(
+            or_(
+                models.AttendanceRecord.timestamp < timestamp,
+                and_(
+                    models.AttendanceRecord.timestamp == timestamp,
+                    models.AttendanceRecord.id < record_id
+                )
+            )
+        )
+    else:
+        query = query.offset(skip)
+    return list(await db.scalars(query.limit(limit)))
+
+
+async def get_monthly_attendance_records(
+    db: AsyncSession,
+    year: int,
+    month: int,
+    employee_id: Optional[int] = None
+) -> List[models.AttendanceRecord]:
+    """获取月度考勤记录（同时预加载员工信息；已归档的月份读取归档文件）"""
+    if archive.is_closed_month(year, month):
+        archived = await db.run_sync(archive.get_archive, year, month)
+        if archived is not None:
+            # 在线程池中读取并解码归档文件（结果按月缓存），run_sync 中只构造记录对象
+            await run_in_threadpool(archive.read_archive, archived)
+            return await db.run_sync(archive.archived_records, archived, employee_id)
+    
+    start, end = month_range(year, month)
+    query = select(models.AttendanceRecord).options(
+        joinedload(models.AttendanceRecord.employee)
+    ).where(
+        and_(
+            models.AttendanceRecord.timestamp >= start,
+            models.AttendanceRecord.timestamp < end
+        )
+    )
+    if employee_id:
+        query = query.where(models.AttendanceRecord.employee_id == employee_id)
+    return list(await db.scalars(query.order_by(models.AttendanceRecord.timestamp.desc())))
+
+
+async def get_monthly_attendance_counts(
+    db: AsyncSession,
+    year: int,
+    month: int,
+    employee_id: Optional[int] = None
+) -> Dict[models.AttendanceTypeEnum, int]:
+    """按考勤类型统计月度记录数（读取每日汇总表，不扫描原始考勤记录），返回 {考勤类型: 数量}"""
+    return crud.monthly_counts((await db.execute(crud.monthly_counts_query(year, month, employee_id))).one())
+
+
+async def stream_monthly_attendance_rows(
+    db: AsyncSession,
+    year: int,
+    month: int,
+    employee_id: Optional[int] = None,
+    batch_size: int = 500
+):
+    """按批次异步迭代月度考勤记录（含员工编号和姓名），使用服务端游标，用于导出"""
+    if archive.is_closed_month(year, month):
+        archived = await db.run_sync(archive.get_archive, year, month)
+        if archived is not None:
+            await run_in_threadpool(archive.read_archive, archived)
+            rows = await db.run_sync(lambda session: list(archive.archived_rows(session, archived, employee_id)))
+            return _archived_partitions(rows, batch_size)
+    
+    start, end = month_range(year, month)
+    query = select(
+        models.AttendanceRecord.id,
+        models.AttendanceRecord.employee_id,
+        models.Employee.employee_id,
+        models.Employee.name,
+        models.AttendanceRecord.attendance_type,
+        models.AttendanceRecord.timestamp,
+        models.AttendanceRecord.latitude,
+        models.AttendanceRecord.longitude,
+        models.AttendanceRecord.notes,
+        models.AttendanceRecord.created_at
+    ).join(
+        models.Employee, models.Employee.id == models.AttendanceRecord.employee_id
+    ).where(
+        and_(
+            models.AttendanceRecord.timestamp >= start,
+            models.AttendanceRecord.timestamp < end
+        )
+    )
+    if employee_id:
+        query = query.where(models.AttendanceRecord.employee_id == employee_id)
+    query = query.order_by(models.AttendanceRecord.timestamp, models.AttendanceRecord.id)
+    result = await db.stream(query.execution_options(yield_per=batch_size))
+    return result.partitions()
+
+
+async def _archived_partitions(rows: List[Tuple], batch_size: int):
+    """把归档记录按批次输出，与 db.stream(...).partitions() 的形式一致"""
+    for offset in range(0, len(rows), batch_size):
+        yield rows[offset:offset + batch_size]
+
+
+async def get_today_last_record(db: AsyncSession, employee_id: int) -> Optional[models.AttendanceRecord]:
+    """获取今天最后一条考勤记录"""
+    start, end = day_range(date.today())
+    return await db.scalar(
+        select(models.AttendanceRecord).where(
+            and_(
+                models.AttendanceRecord.employee_id == employee_id,
+                models.AttendanceRecord.timestamp >= start,
+                models.AttendanceRecord.timestamp < end
+            )
+        ).order_by(
+            models.AttendanceRecord.timestamp.desc(),
+            models.AttendanceRecord.id.desc()
+        ).limit(1)
+    )
+
+
+async def get_today_state(db: AsyncSession, employee_id: int) -> Optional[TodayState]:
+    """获取员工今天的考勤状态（优先读缓存，未命中时读员工状态行并回填），员工不存在时返回 None"""
+    state = today_state_cache.get(employee_id)
+    if state is not None:
+        return state
+    
+    row = (await db.execute(
+        select(
+            models.Employee.is_active,
+            models.EmployeeAttendanceState.work_date,
+            models.EmployeeAttendanceState.last_type,
+            models.EmployeeAttendanceState.last_timestamp
+        ).outerjoin(
+            models.EmployeeAttendanceState,
+            models.EmployeeAttendanceState.employee_id == models.Employee.id
+        ).where(models.Employee.id == employee_id)
+    )).first()
+    if row is None:
+        return None
+    
+    if row.work_date is None:
+        # 还没有状态行（状态表上线前写入的记录），按今天最后一条记录判断
+        last_record = await get_today_last_record(db, employee_id)
+        last_type = last_record.attendance_type if last_record else None
+        last_timestamp = last_record.timestamp if last_record else None
+    elif row.work_date == date.today():
+        last_type, last_timestamp = row.last_type, row.last_timestamp
+    else:
+        last_type = last_timestamp = None
+    state = TodayState(is_active=bool(row.is_active), attendance_type=last_type, timestamp=last_timestamp)
+    today_state_cache.set(employee_id, state)
+    return state
+
+
+async def get_today_last_types(
+    db: AsyncSession,
+    employee_ids: Iterable[int]
+) -> Dict[int, models.AttendanceTypeEnum]:
+    """批量获取员工今天最后一条考勤记录的类型，返回 {员工ID: 考勤类型}"""
+    return await db.run_sync(crud.get_today_last_types, employee_ids)
+
+
+# Daily Summary CRUD
+async def get_daily_summaries(
+    db: AsyncSession,
+    year: int,
+    month: int,
+    employee_id: Optional[int] = None
+) -> List[models.DailyAttendanceSummary]:
+    """获取某月的每日考勤汇总"""
+    return await db.run_sync(crud.get_daily_summaries, year, month, employee_id)
+
+
+async def get_employee_monthly_summaries(
+    db: AsyncSession,
+    year: int,
+    month: int,
+    employee_id: Optional[int] = None
+) -> List[schemas.EmployeeMonthlySummary]:
+    """按员工汇总某月的每日考勤汇总"""
+    return await db.run_sync(crud.get_employee_monthly_summaries, year, month, employee_id)
+
+
+# Work Schedule CRUD
+async def create_work_schedule(db: AsyncSession, schedule: schemas.WorkScheduleCreate) -> models.WorkSchedule:
+    """创建工作时间（与缓存版本号的递增在同一个事务中提交）"""
+    return await db.run_sync(crud.create_work_schedule, schedule)
+
+
+async def get_work_schedule(db: AsyncSession, schedule_id: int) -> Optional[models.WorkSchedule]:
+    """根据ID获取工作时间"""
+    return await db.scalar(select(models.WorkSchedule).where(models.WorkSchedule.id == schedule_id))
+
+
+async def get_work_schedules(db: AsyncSession, active_only: bool = True) -> List[models.WorkSchedule]:
+    """获取工作时间列表"""
+    query = select(models.WorkSchedule)
+    if active_only:
+        query = query.where(models.WorkSchedule.is_active == True)
+    return list(await db.scalars(query.order_by(models.WorkSchedule.created_at.desc())))
+
+
+async def get_work_schedules_version(db: AsyncSession) -> Tuple[int, Optional[datetime]]:
+    """工作时间表的数据版本 (行数, 最近更新时间)，用于计算列表接口的 ETag"""
+    return tuple((await db.execute(
+        select(func.count(models.WorkSchedule.id), func.max(models.WorkSchedule.updated_at))
+    )).one())
+
+
+async def get_cached_active_work_schedule(db: AsyncSession) -> Optional[schemas.WorkSchedule]:
+    """获取当前激活的工作时间（进程内缓存，通过版本号检测其他进程的修改）"""
+    fresh, schedule = active_schedule_cache.get_fresh()
+    if fresh:
+        return schedule
+    return await db.run_sync(crud.get_cached_active_work_schedule)
+
+
+async def update_work_schedule(
+    db: AsyncSession,
+    schedule_id: int,
+    schedule: schemas.WorkScheduleUpdate
+) -> Optional[models.WorkSchedule]:
+    """更新工作时间（与缓存版本号的递增在同一个事务中提交）"""
+    return await db.run_sync(crud.update_work_schedule, schedule_id, schedule)
+
+
+async def activate_work_schedule(db: AsyncSession, schedule_id: int) -> Optional[models.WorkSchedule]:
+    """激活工作时间并停用其他所有工作时间（单个事务），不存在时返回 None"""
+    return await db.run_sync(crud.activate_work_schedule, schedule_id)
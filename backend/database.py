@@ -1,13 +1,136 @@
-from sqlalchemy import create_engine
+import time
+from threading import Lock
+from sqlalchemy import create_engine, exc, inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from config import settings
+from instrumentation import instrument_engine
 
-engine = create_engine(settings.DATABASE_URL, echo=settings.DEBUG)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+class PoolWaitStats:
+    """连接池取连接的等待统计"""
+    
+    def __init__(self):
+        self._lock = Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+    
+    def record(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            self.checkouts += 1
+            self.timeouts += timed_out
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+    
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_seconds_total": round(self.wait_seconds_total, 6),
+                "wait_seconds_max": round(self.wait_seconds_max, 6),
+                "wait_seconds_avg": round(self.wait_seconds_total / self.checkouts, 6) if self.checkouts else 0.0,
+            }
+
+
+class _TimedCheckoutMixin:
+    """记录每次从连接池取连接的耗时（含排队等待）"""
+    wait_stats: PoolWaitStats
+    
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            self.wait_stats.record(time.perf_counter() - start, timed_out=True)
+            raise
+        self.wait_stats.record(time.perf_counter() - start)
+        return connection
+
+
+class TimedQueuePool(_TimedCheckoutMixin, QueuePool):
+    wait_stats = PoolWaitStats()
+
+
+class TimedAsyncQueuePool(_TimedCheckoutMixin, AsyncAdaptedQueuePool):
+    wait_stats = PoolWaitStats()
+
+
+def engine_options(url: str, poolclass) -> dict:
+    """根据配置生成 create_engine 参数（SQLite 内存数据库不使用连接池参数）"""
+    options = {"echo": settings.DB_ECHO}
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        return options
+    options.update(
+        poolclass=poolclass,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+    )
+    return options
+
+
+engine = create_engine(settings.DATABASE_URL, **engine_options(settings.DATABASE_URL, TimedQueuePool))
+# 提交后不使对象过期：默认值都在 Python 端生成、主键由 INSERT 返回，写入后无需再 SELECT 刷新
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+instrument_engine(engine)
 
 Base = declarative_base()
 
+# 同步驱动 -> 异步驱动
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "mysql": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+}
+
+
+def get_async_database_url(url: str) -> str:
+    """将同步数据库连接串转换为对应的异步驱动连接串"""
+    scheme, sep, rest = url.partition("://")
+    return ASYNC_DRIVERS.get(scheme, scheme) + sep + rest
+
+
+# 异步数据库（ASYNC_DB=True 时启用）
+async_engine = None
+AsyncSessionLocal = None
+if settings.ASYNC_DB:
+    async_url = settings.ASYNC_DATABASE_URL or get_async_database_url(settings.DATABASE_URL)
+    async_engine = create_async_engine(async_url, **engine_options(async_url, TimedAsyncQueuePool))
+    instrument_engine(async_engine.sync_engine)
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+def get_pool_stats() -> dict:
+    """连接池实时状态：连接数、借出数、溢出数及取连接等待时间"""
+    stats = {}
+    for name, pool in (("sync", engine.pool), ("async", async_engine.sync_engine.pool if async_engine else None)):
+        if pool is None:
+            continue
+        pool_stats = {"pool_class": type(pool).__name__}
+        if isinstance(pool, QueuePool):
+            pool_stats.update(
+                size=pool.size(),
+                checked_in=pool.checkedin(),
+                checked_out=pool.checkedout(),
+                overflow=max(pool.overflow(), 0),
+                max_overflow=pool._max_overflow,
+            )
+        if isinstance(pool, _TimedCheckoutMixin):
+            pool_stats.update(pool.wait_stats.snapshot())
+        stats[name] = pool_stats
+    return stats
+
 
 def get_db():
     """数据库会话依赖"""
@@ -18,6 +141,38 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    """异步数据库会话依赖"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def _add_missing_columns(connection):
+    """create_all 不修改已存在的表：为旧版本建的表补上后来新增的可空列"""
+    inspector = inspect(connection)
+    preparer = connection.dialect.identifier_preparer
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing and column.nullable:
+                connection.execute(text(
+                    f"ALTER TABLE {preparer.format_table(table)} "
+                    f"ADD COLUMN {preparer.format_column(column)} {column.type.compile(dialect=connection.dialect)}"
+                ))
+
+
+def _create_missing_indexes(connection):
+    """create_all 只为新建的表创建索引：为已存在的表补上后来新增的索引（已存在的跳过）"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
 def init_db():
-    """初始化数据库表"""
-    Base.metadata.create_all(bind=engine)
+    """初始化数据库表（并为已存在的旧表补上新增的列和索引，可重复执行）"""
+    with engine.begin() as connection:
+        Base.metadata.create_all(bind=connection)
+        _add_missing_columns(connection)
+        _create_missing_indexes(connection)
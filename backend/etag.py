@@ -0,0 +1,44 @@
+"""
+ETag / 条件请求工具
+
+列表类接口用「数据版本 + 查询参数」计算弱 ETag，并返回 Cache-Control: no-cache：
+浏览器每次都会带 If-None-Match 重新验证，数据未变化时直接返回 304，
+不再查询列表、序列化和传输响应体。
+"""
+import hashlib
+from typing import Optional
+from fastapi import Request, Response
+
+CACHE_CONTROL = "no-cache"
+
+
+def make_etag(*parts) -> str:
+    """由数据版本和查询参数计算弱 ETag"""
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """请求的 If-None-Match 是否与当前 ETag 匹配（弱比较）"""
+    header: Optional[str] = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return _opaque(etag) in {_opaque(tag) for tag in header.split(",")}
+
+
+def not_modified(etag: str) -> Response:
+    """304 响应"""
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+def set_etag(response: Response, etag: str):
+    """给正常响应加上 ETag 和缓存策略"""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
@@ -0,0 +1,87 @@
+"""
+月度考勤导出（CSV / NDJSON）
+
+记录行按块编码后交给 StreamingResponse 逐块发送，不在内存中保留整月数据。
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from itertools import islice
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator, Sequence, Tuple
+from fastapi.responses import StreamingResponse
+import models
+
+# 导出字段（与 crud.iter_monthly_attendance_rows 返回的列顺序一致）
+EXPORT_COLUMNS = [
+    "id", "employee_id", "employee_code", "employee_name", "attendance_type",
+    "timestamp", "latitude", "longitude", "notes", "created_at"
+]
+# 每次向客户端发送的行数
+EXPORT_CHUNK_ROWS = 500
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def _export_value(value):
+    """将导出字段转换为可序列化的值"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, models.AttendanceTypeEnum):
+        return value.value
+    return value
+
+
+def format_chunk(rows: Sequence[Tuple], export_format: str) -> str:
+    """将一批记录行编码为文本块"""
+    if export_format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([_export_value(value) for value in row])
+        return buffer.getvalue()
+    
+    lines = [
+        json.dumps(dict(zip(EXPORT_COLUMNS, (_export_value(value) for value in row))), ensure_ascii=False)
+        for row in rows
+    ]
+    return "".join(line + "\n" for line in lines)
+
+
+def _header(export_format: str) -> str:
+    return format_chunk([EXPORT_COLUMNS], "csv") if export_format == "csv" else ""
+
+
+def iter_export(rows: Iterable[Tuple], export_format: str) -> Iterator[str]:
+    """按块编码记录行"""
+    header = _header(export_format)
+    if header:
+        yield header
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, EXPORT_CHUNK_ROWS))
+        if not chunk:
+            break
+        yield format_chunk(chunk, export_format)
+
+
+async def aiter_export(partitions: AsyncIterable[Sequence[Tuple]], export_format: str) -> AsyncIterator[str]:
+    """按块编码异步读取的记录行（每个分区为一批记录）"""
+    header = _header(export_format)
+    if header:
+        yield header
+    async for chunk in partitions:
+        yield format_chunk(chunk, export_format)
+
+
+def export_response(chunks, export_format: str, year: int, month: int) -> StreamingResponse:
+    """构造导出文件的流式响应"""
+    filename = f"attendance_{year}_{month:02d}.{export_format}"
+    return StreamingResponse(
+        chunks,
+        media_type=MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
@@ -0,0 +1,239 @@
+"""
+大规模测试数据生成
+
+批量插入 N 名员工和最近 M 个月的成对签到/签退记录（仅工作日、不含今天），
+可配置迟到、缺勤、早退和远程办公比例，同时写入对应的每日汇总。
+记录按批次生成并通过 Core executemany（多行 INSERT）写入，内存占用与数据量无关。
+
+用法:
+    python generate_data.py --employees 5000 --months 12
+    python generate_data.py --employees 100000 --months 24 --reset --batch-size 50000
+"""
+import argparse
+import random
+import time
+from datetime import date, datetime, timedelta
+from typing import Iterator, List, Optional
+from sqlalchemy import func, select
+import models
+
+# 办公地点坐标（签到时加少量随机偏移）
+OFFICE_LATITUDE = 39.9042
+OFFICE_LONGITUDE = 116.4074
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="生成大规模考勤测试数据")
+    parser.add_argument("--employees", type=int, default=1000, help="员工数")
+    parser.add_argument("--months", type=int, default=1, help="生成最近几个月的考勤记录（截至昨天）")
+    parser.add_argument("--late-rate", type=float, default=0.08, help="迟到比例")
+    parser.add_argument("--early-leave-rate", type=float, default=0.05, help="早退比例")
+    parser.add_argument("--absence-rate", type=float, default=0.03, help="缺勤比例")
+    parser.add_argument("--remote-rate", type=float, default=0.15, help="远程办公比例")
+    parser.add_argument("--check-in-time", default="09:00", help="上班时间")
+    parser.add_argument("--check-out-time", default="18:00", help="下班时间")
+    parser.add_argument("--batch-size", type=int, default=20000, help="每批插入的记录数")
+    parser.add_argument("--prefix", default="GEN", help="员工编号前缀")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--reset", action="store_true", help="清空并重建所有表")
+    return parser.parse_args(argv)
+
+
+def work_days(months: int, end: Optional[date] = None) -> List[date]:
+    """最近 months 个自然月内、end（不含）之前的工作日"""
+    end = end or date.today()
+    year, month = end.year, end.month - (months - 1)
+    while month <= 0:
+        year, month = year - 1, month + 12
+    day = date(year, month, 1)
+    days = []
+    while day < end:
+        if day.weekday() < 5:
+            days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+def next_employee_number(connection, prefix: str) -> int:
+    """已有「前缀 + 数字」编号中的最大数字（没有时为 0），新员工从下一个编号开始"""
+    table = models.Employee.__table__
+    codes = connection.execute(
+        select(table.c.employee_id).where(table.c.employee_id.like(f"{prefix}%"))
+    ).scalars()
+    numbers = [int(code[len(prefix):]) for code in codes if code[len(prefix):].isdigit()]
+    return max(numbers, default=0)
+
+
+def insert_employees(connection, count: int, prefix: str) -> List[int]:
+    """批量插入员工，返回新员工的 ID"""
+    table = models.Employee.__table__
+    start = next_employee_number(connection, prefix)
+    now = datetime.utcnow()
+    rows = [
+        {
+            "employee_id": f"{prefix}{i:07d}",
+            "name": f"员工{i}",
+            "email": f"{prefix.lower()}{i}@example.com",
+            "role": models.RoleEnum.SUPERVISOR if i % 50 == 0 else models.RoleEnum.EMPLOYEE,
+            "is_active": True,
+            "created_at": now,
+            "updated_at": now,
+        }
+        for i in range(start + 1, start + count + 1)
+    ]
+    if not rows:
+        return []
+    # 插入前记下最大 ID，按 ID 区间取回新员工（不依赖编号格式，也避免超长 IN 列表）
+    max_id = connection.execute(select(func.max(table.c.id))).scalar() or 0
+    connection.execute(table.insert(), rows)
+    employee_ids = list(connection.execute(
+        select(table.c.id).where(table.c.id > max_id).order_by(table.c.id)
+    ).scalars())
+    # 与 crud.create_employee 一样创建员工状态行（历史记录都早于今天，状态为今天未签到）
+    connection.execute(models.EmployeeAttendanceState.__table__.insert(), [
+        {"employee_id": employee_id, "work_date": date.today(), "version": 0, "updated_at": now}
+        for employee_id in employee_ids
+    ])
+    return employee_ids
+
+
+RECORD_COLUMNS = (
+    "employee_id", "attendance_type", "timestamp", "latitude", "longitude", "notes", "created_at"
+)
+SUMMARY_COLUMNS = (
+    "employee_id", "work_date", "first_check_in", "last_check_out", "open_check_in",
+    "check_in_count", "check_out_count", "pair_count", "worked_seconds", "updated_at"
+)
+
+
+def iter_attendance(
+    employee_ids: List[int],
+    days: List[date],
+    args,
+    rng: random.Random
+) -> Iterator[tuple]:
+    """逐天逐个员工生成 (签到记录, 签退记录, 每日汇总) 元组，缺勤的天不生成"""
+    check_in_at = datetime.strptime(args.check_in_time, "%H:%M")
+    check_out_at = datetime.strptime(args.check_out_time, "%H:%M")
+    check_in_offset = timedelta(hours=check_in_at.hour, minutes=check_in_at.minute)
+    check_out_offset = timedelta(hours=check_out_at.hour, minutes=check_out_at.minute)
+    check_in_type = models.AttendanceTypeEnum.CHECK_IN
+    check_out_type = models.AttendanceTypeEnum.CHECK_OUT
+    random_ = rng.random
+    
+    for day in days:
+        midnight = datetime(day.year, day.month, day.day)
+        on_time = midnight + check_in_offset
+        off_time = midnight + check_out_offset
+        for employee_id in employee_ids:
+            if random_() < args.absence_rate:
+                continue
+            
+            if random_() < args.late_rate:
+                check_in = on_time + timedelta(seconds=int(60 + random_() * 3540))
+            else:
+                check_in = on_time - timedelta(seconds=int(random_() * 1800))
+            if random_() < args.early_leave_rate:
+                check_out = off_time - timedelta(seconds=int(60 + random_() * 7140))
+            else:
+                check_out = off_time + timedelta(seconds=int(random_() * 5400))
+            
+            if random_() < args.remote_rate:
+                latitude = longitude = None
+                notes = "远程办公"
+            else:
+                latitude = f"{OFFICE_LATITUDE + (random_() - 0.5) * 0.002:.6f}"
+                longitude = f"{OFFICE_LONGITUDE + (random_() - 0.5) * 0.002:.6f}"
+                notes = None
+            
+            yield (
+                (employee_id, check_in_type, check_in, latitude, longitude, notes, check_in),
+                (employee_id, check_out_type, check_out, latitude, longitude, notes, check_out),
+                (employee_id, day, check_in, check_out, None, 1, 1, 1,
+                 int((check_out - check_in).total_seconds()), check_out),
+            )
+
+
+def insert_rows(connection, table, columns, rows: List[tuple]):
+    """按驱动参数风格直接 executemany，绕过 SQLAlchemy 逐行构造参数字典的开销"""
+    dialect = connection.dialect
+    compiled = table.insert().compile(dialect=dialect, column_keys=list(columns))
+    if not compiled.positional or list(compiled.positiontup) != list(columns):
+        # 命名参数风格的驱动（如 psycopg2）走常规 Core executemany
+        connection.execute(table.insert(), [dict(zip(columns, row)) for row in rows])
+        return
+    
+    processors = [
+        (index, processor)
+        for index, name in enumerate(columns)
+        if (processor := table.c[name].type.dialect_impl(dialect).bind_processor(dialect)) is not None
+    ]
+    if processors:
+        rows = [list(row) for row in rows]
+        for index, processor in processors:
+            for row in rows:
+                if row[index] is not None:
+                    row[index] = processor(row[index])
+    connection.exec_driver_sql(str(compiled), [tuple(row) for row in rows])
+
+
+def generate(engine, args, end: Optional[date] = None, log=print) -> dict:
+    """生成员工和考勤数据，返回统计信息"""
+    from database import Base
+    
+    if args.reset:
+        Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    with engine.begin() as connection:
+        employee_ids = insert_employees(connection, args.employees, args.prefix)
+    log(f"✓ 创建员工 {len(employee_ids)} 名")
+    
+    days = work_days(args.months, end) if args.months > 0 else []
+    record_table = models.AttendanceRecord.__table__
+    summary_table = models.DailyAttendanceSummary.__table__
+    records, summaries = [], []
+    total_records = total_summaries = 0
+    
+    def flush():
+        nonlocal records, summaries, total_records, total_summaries
+        if not records:
+            return
+        with engine.begin() as connection:
+            insert_rows(connection, record_table, RECORD_COLUMNS, records)
+            insert_rows(connection, summary_table, SUMMARY_COLUMNS, summaries)
+        total_records += len(records)
+        total_summaries += len(summaries)
+        records, summaries = [], []
+        elapsed = time.perf_counter() - started
+        log(f"  已写入 {total_records} 条记录（{total_records / elapsed:,.0f} 条/秒）")
+    
+    for check_in, check_out, summary in iter_attendance(employee_ids, days, args, rng):
+        records.append(check_in)
+        records.append(check_out)
+        summaries.append(summary)
+        if len(records) >= args.batch_size:
+            flush()
+    flush()
+    
+    elapsed = time.perf_counter() - started
+    log(f"✓ 写入考勤记录 {total_records} 条、每日汇总 {total_summaries} 条，用时 {elapsed:.1f}s")
+    return {
+        "employee_ids": employee_ids,
+        "work_days": len(days),
+        "records": total_records,
+        "summaries": total_summaries,
+        "elapsed_s": elapsed,
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    from database import engine
+    generate(engine, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""
+签到/签退写后缓冲（INGEST_MODE=buffered）
+
+事件先追加到本地日志文件（JSON Lines，每条 fsync）并立即确认，
+后台线程定期把积压的事件用一次多行 INSERT 批量写入 attendance_records，
+从而把「每个请求一次事务提交」变成「每批一次」。
+
+- 尚未写入数据库的事件保存在内存中，签到/签退/状态查询通过 overlay() 叠加这些事件，
+  状态校验与直接写入模式保持一致。
+- 每个事件带唯一的 event_id，写库时存入 attendance_records.event_id（唯一索引）。
+  写入数据库后重写日志，只保留仍未写入的事件；进程重启时重放日志中的事件，
+  按 event_id 跳过已存在的记录（写库成功但日志未重写时崩溃的情况），保证不丢不重
+  （不依赖时间戳比较，数据库截断微秒时同样有效）。
+- 批量签到/签退（submit_batch）同样在锁内叠加缓冲中的事件后校验，通过的事件一起写入日志、一次 fsync。
+- 组提交：事件在锁内追加到日志，fsync 在锁外进行，一次 fsync 覆盖期间所有并发提交的事件，
+  请求之间不必排队等待各自的磁盘同步。
+- 一批连续写库失败 max_retries 次后改为逐条写入，仍然失败的事件（例如提交后员工被删除）
+  移入死信日志（与日志同样的 JSON Lines 格式），不再阻塞后面的事件。
+- 缓冲只在本进程内有效：多进程部署时同一员工的请求需路由到同一进程。
+"""
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import crud
+import models
+from broadcast import broadcaster
+from cache import TodayState
+from config import settings
+from metrics import attendance_ingest_dead_letters_total, attendance_ingest_pending
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    """持久化日志 + 内存积压 + 后台批量写库"""
+    
+    def __init__(
+        self,
+        log_path: str,
+        flush_interval: float = 0.5,
+        batch_size: int = 1000,
+        max_retries: int = 3,
+        dead_letter_path: Optional[str] = None
+    ):
+        self.log_path = log_path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.dead_letter_path = dead_letter_path or log_path + ".dead"
+        self.enabled = False
+        self._session_factory: Optional[Callable] = None
+        self._pending: List[dict] = []
+        # 积压开头从日志重放的事件数，写库前需跳过已存在的记录
+        self._unverified = 0
+        # 当天每个员工最后一次经缓冲提交的事件 (类型, 时间)，写库后仍保留，避免读到过期缓存
+        self._latest: Dict[int, Tuple[models.AttendanceTypeEnum, datetime]] = {}
+        self._day = date.today()
+        # 最近一次分配的事件时间
+        self._last_timestamp = datetime.min
+        # 当前批次连续写库失败的次数
+        self._failures = 0
+        # 已写入日志的事件序号和已 fsync 的序号（组提交）
+        self._written = 0
+        self._synced = 0
+        # 加锁顺序：_flush_lock -> _sync_lock -> _lock
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._log = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    def start(self, session_factory: Callable, background: bool = True):
+        """重放日志中未写库的事件并开始接收新事件"""
+        self._session_factory = session_factory
+        replayed = self._read_log()
+        self._log = open(self.log_path, "a", encoding="utf-8")
+        self._pending = replayed
+        self._unverified = len(replayed)
+        for event in replayed:
+            self._latest[event["employee_id"]] = (event["attendance_type"], event["timestamp"])
+        attendance_ingest_pending.inc(amount=len(replayed))
+        self.enabled = True
+        if replayed:
+            logger.info("重放 %d 条未写入数据库的考勤事件", len(replayed))
+        if background:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="ingest-flusher", daemon=True)
+            self._thread.start()
+    
+    def stop(self):
+        """停止后台线程并写入剩余事件（写库失败时剩余事件留在日志中，下次启动重放）"""
+        if not self.enabled:
+            return
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        while self.flush() > 0:
+            pass
+        self.enabled = False
+        self._log.close()
+        self._log = None
+    
+    def _read_log(self) -> List[dict]:
+        if not os.path.exists(self.log_path):
+            return []
+        events = []
+        with open(self.log_path, encoding="utf-8") as log:
+            for line in log:
+                try:
+                    events.append(self._decode(json.loads(line)))
+                except (ValueError, KeyError):
+                    # 崩溃时写了一半的最后一行
+                    logger.warning("忽略无法解析的日志行: %r", line)
+        return events
+    
+    @staticmethod
+    def _encode(event: dict) -> str:
+        return json.dumps({
+            **event,
+            "attendance_type": event["attendance_type"].value,
+            "timestamp": event["timestamp"].isoformat(),
+        }, ensure_ascii=False)
+    
+    @staticmethod
+    def _decode(data: dict) -> dict:
+        return {
+            "employee_id": data["employee_id"],
+            "attendance_type": models.AttendanceTypeEnum(data["attendance_type"]),
+            "latitude": data.get("latitude"),
+            "longitude": data.get("longitude"),
+            "notes": data.get("notes"),
+            "timestamp": datetime.fromisoformat(data["timestamp"]),
+            # 旧版本日志中没有 event_id，重放时按员工、类型、时间去重
+            "event_id": data.get("event_id"),
+        }
+    
+    def _check_day(self):
+        today = date.today()
+        if today != self._day:
+            self._day = today
+            self._latest.clear()
+    
+    def _overlay(self, employee_id: int, state: Optional[TodayState]) -> Optional[TodayState]:
+        latest = self._latest.get(employee_id)
+        if state is None or latest is None:
+            return state
+        attendance_type, timestamp = latest
+        if state.timestamp is not None and state.timestamp >= timestamp:
+            return state
+        return state._replace(attendance_type=attendance_type, timestamp=timestamp)
+    
+    def overlay(self, employee_id: int, state: Optional[TodayState]) -> Optional[TodayState]:
+        """把缓冲中更新的事件叠加到数据库/缓存读出的今日状态上"""
+        with self._lock:
+            self._check_day()
+            return self._overlay(employee_id, state)
+    
+    def _overlay_types(self, employee_ids: Iterable[int], last_types: Dict[int, models.AttendanceTypeEnum]):
+        for employee_id in employee_ids:
+            latest = self._latest.get(employee_id)
+            if latest is not None:
+                last_types[employee_id] = latest[0]
+    
+    def overlay_types(self, employee_ids: Iterable[int], last_types: Dict[int, models.AttendanceTypeEnum]):
+        """把缓冲中的事件叠加到 {员工 ID: 今天最后一次考勤类型} 上（原地修改）"""
+        with self._lock:
+            self._check_day()
+            self._overlay_types(employee_ids, last_types)
+    
+    def _append(self, event: dict) -> dict:
+        """给事件分配 event_id 和时间并写入日志（未 fsync），调用方需持有 _lock"""
+        # 时间严格递增：同一批（或同一微秒内）提交的签到、签退先后分明
+        timestamp = max(datetime.utcnow(), self._last_timestamp + timedelta(microseconds=1))
+        self._last_timestamp = timestamp
+        event = {**event, "event_id": uuid.uuid4().hex, "timestamp": timestamp}
+        self._log.write(self._encode(event) + "\n")
+        self._pending.append(event)
+        self._latest[event["employee_id"]] = (event["attendance_type"], event["timestamp"])
+        self._written += 1
+        return event
+    
+    def submit(
+        self,
+        state: Optional[TodayState],
+        event: dict,
+        validate: Callable[[Optional[TodayState]], None]
+    ) -> dict:
+        """校验并提交事件：写入日志并 fsync 后返回，校验失败时由 validate 抛出异常"""
+        with self._lock:
+            self._check_day()
+            validate(self._overlay(event["employee_id"], state))
+            event = self._append(event)
+            self._log.flush()
+            sequence = self._written
+        self._sync(sequence)
+        attendance_ingest_pending.inc()
+        # 事件已持久化到日志，立即推送，不等批量写库
+        broadcaster.publish_attendance(event["employee_id"], event["attendance_type"], event["timestamp"])
+        return event
+    
+    def submit_batch(
+        self,
+        employee_ids: Iterable[int],
+        last_types: Dict[int, models.AttendanceTypeEnum],
+        evaluate: Callable[[Dict[int, models.AttendanceTypeEnum]], List[dict]]
+    ) -> List[dict]:
+        """批量校验并提交事件：last_types（数据库中今天最后一次考勤类型）叠加缓冲中的事件后
+        交给 evaluate 按顺序校验，evaluate 返回通过校验的事件，一起写入日志、一次 fsync 后返回"""
+        with self._lock:
+            self._check_day()
+            self._overlay_types(employee_ids, last_types)
+            events = [self._append(event) for event in evaluate(last_types)]
+            self._log.flush()
+            sequence = self._written
+        if not events:
+            return events
+        self._sync(sequence)
+        attendance_ingest_pending.inc(amount=len(events))
+        for event in events:
+            broadcaster.publish_attendance(event["employee_id"], event["attendance_type"], event["timestamp"])
+        return events
+    
+    def _sync(self, sequence: int):
+        """等待序号不超过 sequence 的事件落盘：一次 fsync 覆盖所有已写入日志的事件"""
+        with self._sync_lock:
+            if self._synced >= sequence:
+                # 其他线程的 fsync 已经覆盖了这条事件
+                return
+            with self._lock:
+                target = self._written
+                fileno = self._log.fileno()
+            os.fsync(fileno)
+            self._synced = target
+    
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+    
+    def _write(self, events: List[dict], replay: bool):
+        """在一个事务中写入事件，失败时回滚并抛出异常"""
+        db = self._session_factory()
+        try:
+            rows = [dict(event) for event in events]
+            if replay:
+                rows = crud.filter_new_attendance_rows(db, rows)
+            crud.insert_attendance_rows(db, rows)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+    
+    def _dead_letter(self, events: List[dict]):
+        """把无法写入数据库的事件追加到死信日志"""
+        with open(self.dead_letter_path, "a", encoding="utf-8") as dead_letters:
+            for event in events:
+                dead_letters.write(self._encode(event) + "\n")
+            dead_letters.flush()
+            os.fsync(dead_letters.fileno())
+        attendance_ingest_dead_letters_total.inc(amount=len(events))
+        logger.error("%d 条考勤事件无法写入数据库，已移入死信日志 %s", len(events), self.dead_letter_path)
+    
+    def flush(self) -> int:
+        """把积压的事件批量写入数据库，返回移出积压的条数（含移入死信日志的）"""
+        with self._flush_lock:
+            with self._lock:
+                batch = self._pending[:self.batch_size]
+                replay = self._unverified > 0
+            if not batch:
+                return 0
+            
+            try:
+                self._write(batch, replay)
+            except Exception:
+                self._failures += 1
+                if self._failures < self.max_retries:
+                    logger.exception("考勤事件写入数据库失败，稍后重试")
+                    return 0
+                # 多次失败：逐条写入，找出无法写入的事件，其余事件照常写库
+                logger.exception("考勤事件连续 %d 次写入数据库失败，改为逐条写入", self._failures)
+                failed = []
+                for event in batch:
+                    try:
+                        self._write([event], replay)
+                    except Exception:
+                        failed.append(event)
+                if failed:
+                    self._dead_letter(failed)
+            self._failures = 0
+            
+            with self._sync_lock, self._lock:
+                del self._pending[:len(batch)]
+                self._unverified = max(0, self._unverified - len(batch))
+                self._rewrite_log()
+            attendance_ingest_pending.dec(amount=len(batch))
+            return len(batch)
+    
+    def _rewrite_log(self):
+        """用仍未写库的事件替换日志文件（先写临时文件再原子替换）"""
+        temp_path = self.log_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as temp:
+            for event in self._pending:
+                temp.write(self._encode(event) + "\n")
+            temp.flush()
+            os.fsync(temp.fileno())
+        self._log.close()
+        os.replace(temp_path, self.log_path)
+        self._log = open(self.log_path, "a", encoding="utf-8")
+        # 新日志已经包含所有未写库的事件并已落盘
+        self._synced = self._written
+    
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            # 积压较多时连续写入，直到清空
+            while self.flush() >= self.batch_size:
+                pass
+
+
+ingest_buffer = WriteBehindBuffer(
+    settings.INGEST_LOG_PATH,
+    flush_interval=settings.INGEST_FLUSH_INTERVAL,
+    batch_size=settings.INGEST_BATCH_SIZE,
+    max_retries=settings.INGEST_MAX_RETRIES,
+    dead_letter_path=settings.INGEST_DEAD_LETTER_PATH
+)
@@ -0,0 +1,123 @@
+"""
+请求级 SQL 统计
+
+instrument_engine 在引擎上注册游标事件，统计当前请求执行的 SQL 语句数和数据库耗时；
+DbStatsMiddleware 为每个请求建立统计上下文，通过响应头返回，并按路由汇总。
+请求上下文通过 ContextVar 传递，同步路由在线程池中执行时同样生效。
+"""
+import time
+from contextvars import ContextVar
+from threading import Lock
+from typing import Dict, Optional
+from sqlalchemy import event
+
+
+class RequestDbStats:
+    """单个请求的数据库统计"""
+    __slots__ = ("statements", "db_seconds")
+    
+    def __init__(self):
+        self.statements = 0
+        self.db_seconds = 0.0
+
+
+_current_stats: ContextVar[Optional[RequestDbStats]] = ContextVar("request_db_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_stats.get() is not None:
+        context._db_stats_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_stats.get()
+    start = getattr(context, "_db_stats_start", None)
+    if stats is not None and start is not None:
+        stats.statements += 1
+        stats.db_seconds += time.perf_counter() - start
+
+
+def instrument_engine(engine):
+    """为引擎注册 SQL 统计事件（异步引擎传入 async_engine.sync_engine）"""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class RouteDbStats:
+    """按路由汇总的数据库统计"""
+    
+    def __init__(self):
+        self._lock = Lock()
+        self._routes: Dict[str, dict] = {}
+    
+    def record(self, route: str, stats: RequestDbStats):
+        with self._lock:
+            entry = self._routes.get(route)
+            if entry is None:
+                entry = self._routes[route] = {
+                    "requests": 0,
+                    "statements": 0,
+                    "db_seconds": 0.0,
+                    "max_statements": 0,
+                }
+            entry["requests"] += 1
+            entry["statements"] += stats.statements
+            entry["db_seconds"] += stats.db_seconds
+            entry["max_statements"] = max(entry["max_statements"], stats.statements)
+    
+    def snapshot(self) -> Dict[str, dict]:
+        """返回每个路由的请求数、SQL 总数、平均/最大 SQL 数和数据库耗时"""
+        with self._lock:
+            return {
+                route: {
+                    **entry,
+                    "db_seconds": round(entry["db_seconds"], 6),
+                    "avg_statements": round(entry["statements"] / entry["requests"], 2),
+                    "avg_db_ms": round(entry["db_seconds"] * 1000 / entry["requests"], 3),
+                }
+                for route, entry in sorted(self._routes.items())
+            }
+    
+    def clear(self):
+        with self._lock:
+            self._routes.clear()
+
+
+route_db_stats = RouteDbStats()
+
+
+def route_name(scope) -> str:
+    """请求对应的路由模板，如 "GET /api/attendance/status/{employee_id}" """
+    route = scope.get("route")
+    path = getattr(route, "path", None) or "<unmatched>"
+    return f"{scope.get('method', '')} {path}"
+
+
+class DbStatsMiddleware:
+    """统计每个请求的 SQL 语句数和数据库耗时（X-DB-Statements / X-DB-Time-Ms 响应头）"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        stats = RequestDbStats()
+        token = _current_stats.set(stats)
+        
+        async def send_with_stats(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-db-statements", str(stats.statements).encode()))
+                headers.append((b"x-db-time-ms", f"{stats.db_seconds * 1000:.3f}".encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_stats)
+        finally:
+            _current_stats.reset(token)
+            route_db_stats.record(route_name(scope), stats)
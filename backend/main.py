@@ -1,51 +1,118 @@
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from database import init_db
+from sqlalchemy.exc import IntegrityError
+from compression import CompressionMiddleware
+from config import settings
+from database import SessionLocal, init_db, get_pool_stats
+from ingest import ingest_buffer
+from instrumentation import DbStatsMiddleware, route_db_stats
+from metrics import MetricsMiddleware, render_metrics
+import crud
 import api_employees
 import api_attendance
 import api_schedules
 
-app = FastAPI(
-    title="考勤管理系统 API",
-    description="一个基于 FastAPI 的考勤管理系统",
-    version="1.0.0"
-)
 
-# 配置 CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # 生产环境中应该设置具体的域名
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+def create_app(async_db: bool = settings.ASYNC_DB) -> FastAPI:
+    """创建应用（async_db=True 时注册使用 AsyncSession 的异步路由）"""
+    app = FastAPI(
+        title="考勤管理系统 API",
+        description="一个基于 FastAPI 的考勤管理系统",
+        version="1.0.0"
+    )
+    
+    # 配置 CORS
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],  # 生产环境中应该设置具体的域名
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "X-DB-Statements", "X-DB-Time-Ms", "ETag"],
+    )
+    
+    # 按 Accept-Encoding 压缩响应（br / gzip）
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.COMPRESSION_MIN_SIZE,
+        gzip_level=settings.GZIP_LEVEL,
+        brotli_quality=settings.BROTLI_QUALITY
+    )
+    
+    # 统计每个请求的 SQL 语句数和数据库耗时
+    app.add_middleware(DbStatsMiddleware)
+    # 请求数、延迟直方图、处理中请求数
+    app.add_middleware(MetricsMiddleware)
+    
+    # 注册路由
+    if async_db:
+        import api_employees_async
+        import api_attendance_async
+        import api_schedules_async
+        app.include_router(api_employees_async.router)
+        app.include_router(api_attendance_async.router)
+        app.include_router(api_schedules_async.router)
+    else:
+        app.include_router(api_employees.router)
+        app.include_router(api_attendance.router)
+        app.include_router(api_schedules.router)
+    
+    @app.on_event("startup")
+    def on_startup():
+        """应用启动时初始化数据库"""
+        init_db()
+        # 升级后首次启动：为已有的考勤记录回填每日汇总（月度统计读取汇总表）
+        db = SessionLocal()
+        try:
+            crud.backfill_daily_summaries(db)
+        except IntegrityError:
+            # 多个 worker 同时启动时由其他 worker 完成回填
+            db.rollback()
+        finally:
+            db.close()
+        if settings.INGEST_MODE == "buffered":
+            # 重放上次未写库的事件并启动后台批量写入
+            ingest_buffer.start(SessionLocal)
+    
+    @app.on_event("shutdown")
+    def on_shutdown():
+        """应用关闭时把缓冲中的事件写入数据库"""
+        ingest_buffer.stop()
+    
+    @app.get("/")
+    def read_root():
+        """根路径"""
+        return {
+            "message": "欢迎使用考勤管理系统 API",
+            "version": "1.0.0",
+            "docs": "/docs"
+        }
+    
+    @app.get("/health")
+    def health_check():
+        """健康检查"""
+        return {"status": "healthy"}
+    
+    @app.get("/health/db")
+    def db_pool_status():
+        """数据库连接池状态"""
+        return get_pool_stats()
+    
+    @app.get("/health/db/routes")
+    def db_route_stats():
+        """按路由汇总的 SQL 语句数和数据库耗时"""
+        return route_db_stats.snapshot()
+    
+    @app.get("/metrics", response_class=PlainTextResponse)
+    def metrics():
+        """Prometheus 指标"""
+        return PlainTextResponse(render_metrics(get_pool_stats()), media_type="text/plain; version=0.0.4")
+    
+    return app
 
-# 注册路由
-app.include_router(api_employees.router)
-app.include_router(api_attendance.router)
-app.include_router(api_schedules.router)
 
-
-@app.on_event("startup")
-def on_startup():
-    """应用启动时初始化数据库"""
-    init_db()
-
-
-@app.get("/")
-def read_root():
-    """根路径"""
-    return {
-        "message": "欢迎使用考勤管理系统 API",
-        "version": "1.0.0",
-        "docs": "/docs"
-    }
-
-
-@app.get("/health")
-def health_check():
-    """健康检查"""
-    return {"status": "healthy"}
+app = create_app()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,253 @@
+"""
+Prometheus 文本格式指标
+
+不依赖 prometheus_client：请求路径上每次只做一次字典查找、一次二分查找和少量加法。
+GET /metrics 输出请求数、按路由/状态码的延迟直方图、处理中请求数、
+连接池使用情况、按路由的 SQL 统计以及签到/签退吞吐量。
+"""
+import time
+from bisect import bisect_left
+from threading import Lock
+from typing import Dict, List, Sequence, Tuple
+from instrumentation import route_db_stats
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """只增计数器"""
+    
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = Lock()
+    
+    def inc(self, labels: Tuple = (), amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+    
+    def get(self, labels: Tuple = ()) -> float:
+        return self._values.get(labels, 0)
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}")
+        return lines
+    
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Gauge(Counter):
+    """可增可减的数值"""
+    
+    def dec(self, labels: Tuple = (), amount: float = 1):
+        self.inc(labels, -amount)
+    
+    def render(self) -> List[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    """固定分桶直方图"""
+    
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0)
+    
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [各分桶计数（不累计）..., +Inf 计数, 总和]
+        self._series: Dict[Tuple, list] = {}
+        self._lock = Lock()
+    
+    def observe(self, labels: Tuple, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+        bucket_names = self.label_names + ("le",)
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(bucket_names, labels + (_format_value(bound),))} {cumulative}"
+                )
+            label_text = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+    
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+http_requests_total = Counter(
+    "http_requests_total", "Total HTTP requests.", ("method", "route", "status")
+)
+http_request_duration_seconds = Histogram(
+    "http_request_duration_seconds", "HTTP request latency in seconds.", ("method", "route", "status")
+)
+http_requests_in_flight = Gauge(
+    "http_requests_in_flight", "HTTP requests currently being processed."
+)
+attendance_events_total = Counter(
+    "attendance_events_total", "Attendance records written.", ("attendance_type",)
+)
+attendance_ingest_pending = Gauge(
+    "attendance_ingest_pending", "Buffered attendance events not yet written to the database."
+)
+attendance_ingest_dead_letters_total = Counter(
+    "attendance_ingest_dead_letters_total", "Buffered attendance events moved to the dead-letter log."
+)
+attendance_stream_subscribers = Gauge(
+    "attendance_stream_subscribers", "Dashboards subscribed to the attendance event stream."
+)
+attendance_stream_resyncs_total = Counter(
+    "attendance_stream_resyncs_total", "Stream subscribers that fell behind and were told to resync."
+)
+REGISTRY = [
+    http_requests_total, http_request_duration_seconds, http_requests_in_flight,
+    attendance_events_total, attendance_ingest_pending, attendance_ingest_dead_letters_total,
+    attendance_stream_subscribers, attendance_stream_resyncs_total
+]
+
+
+def record_attendance_events(attendance_type, count: int = 1):
+    """记录写入的考勤记录数（签到/签退吞吐量）"""
+    attendance_events_total.inc((getattr(attendance_type, "value", attendance_type),), count)
+
+
+def _pool_lines(pool_stats: dict) -> List[str]:
+    gauges = {
+        "db_pool_size": ("size", "Connection pool size."),
+        "db_pool_checked_out": ("checked_out", "Connections currently checked out."),
+        "db_pool_overflow": ("overflow", "Overflow connections currently open."),
+    }
+    counters = {
+        "db_pool_checkouts_total": ("checkouts", "Connection checkouts."),
+        "db_pool_timeouts_total": ("timeouts", "Connection checkouts that timed out."),
+        "db_pool_wait_seconds_total": ("wait_seconds_total", "Time spent waiting for a connection."),
+    }
+    lines = []
+    for kind, metrics in (("gauge", gauges), ("counter", counters)):
+        for name, (key, documentation) in metrics.items():
+            samples = [(engine, stats[key]) for engine, stats in pool_stats.items() if key in stats]
+            if not samples:
+                continue
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for engine, value in samples:
+                lines.append(f'{name}{{engine="{engine}"}} {_format_value(value)}')
+    return lines
+
+
+def _route_db_lines() -> List[str]:
+    snapshot = route_db_stats.snapshot()
+    lines = [
+        "# HELP db_statements_total SQL statements executed, by route.",
+        "# TYPE db_statements_total counter",
+    ]
+    lines += [
+        f'db_statements_total{_format_labels(("route",), (route,))} {stats["statements"]}'
+        for route, stats in snapshot.items()
+    ]
+    lines += [
+        "# HELP db_seconds_total Time spent executing SQL, by route.",
+        "# TYPE db_seconds_total counter",
+    ]
+    lines += [
+        f'db_seconds_total{_format_labels(("route",), (route,))} {_format_value(stats["db_seconds"])}'
+        for route, stats in snapshot.items()
+    ]
+    return lines
+
+
+def render_metrics(pool_stats: dict) -> str:
+    """输出 Prometheus 文本格式的全部指标"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    lines.extend(_pool_lines(pool_stats))
+    lines.extend(_route_db_lines())
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """记录请求数、延迟和处理中请求数
+    
+    SSE 等事件流（text/event-stream）是长连接，在响应开始时计数并结束「处理中」，
+    不计入延迟直方图（订阅数见 attendance_stream_subscribers）。
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        status_code = 500
+        streaming = False
+        
+        def labels():
+            route = getattr(scope.get("route"), "path", None) or "<unmatched>"
+            return (scope.get("method", ""), route, str(status_code))
+        
+        async def send_with_status(message):
+            nonlocal status_code, streaming
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                content_type = dict(message.get("headers", ())).get(b"content-type", b"")
+                if content_type.lower().startswith(b"text/event-stream"):
+                    streaming = True
+                    http_requests_in_flight.dec()
+                    http_requests_total.inc(labels())
+            await send(message)
+        
+        http_requests_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            if not streaming:
+                elapsed = time.perf_counter() - start
+                http_requests_in_flight.dec()
+                http_requests_total.inc(labels())
+                http_request_duration_seconds.observe(labels(), elapsed)
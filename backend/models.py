@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Time, Boolean, ForeignKey, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, Date, DateTime, Time, Boolean, ForeignKey, Index, UniqueConstraint, Enum as SQLEnum
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
@@ -46,9 +46,71 @@ class AttendanceRecord(Base):
     longitude = Column(String(50), nullable=True)
     notes = Column(String(500), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # 写后缓冲和批量接口分配的事件 ID（重放日志时按它去重、批量写入后按它查回记录 ID），单条直接写入的记录为空
+    event_id = Column(String(32), nullable=True)
     
     # 关系
     employee = relationship("Employee", back_populates="attendance_records")
+    
+    # 索引：按员工 + 时间范围查询（当日状态、员工月度记录），以及全员按时间范围查询
+    # SQLite 使用 AUTOINCREMENT：归档删除最大 ID 的记录后不复用其 ID，避免与归档文件中的记录冲突
+    __table_args__ = (
+        Index("ix_attendance_records_employee_timestamp", "employee_id", "timestamp"),
+        Index("ix_attendance_records_timestamp", "timestamp"),
+        Index("ix_attendance_records_event_id", "event_id", unique=True),
+        {"sqlite_autoincrement": True},
+    )
+
+
+class DailyAttendanceSummary(Base):
+    """每日考勤汇总表（每个员工每天一行，随考勤记录写入增量更新）"""
+    __tablename__ = "daily_attendance_summary"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    employee_id = Column(Integer, ForeignKey("employees.id"), nullable=False)
+    work_date = Column(Date, nullable=False)
+    first_check_in = Column(DateTime, nullable=True)  # 当天第一次签到
+    last_check_out = Column(DateTime, nullable=True)  # 当天最后一次签退
+    open_check_in = Column(DateTime, nullable=True)  # 尚未配对签退的签到时间
+    check_in_count = Column(Integer, default=0, nullable=False)
+    check_out_count = Column(Integer, default=0, nullable=False)
+    pair_count = Column(Integer, default=0, nullable=False)  # 签到/签退配对次数
+    worked_seconds = Column(Integer, default=0, nullable=False)  # 配对时段累计工作秒数
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        UniqueConstraint("employee_id", "work_date", name="uq_daily_attendance_summary_employee_date"),
+        Index("ix_daily_attendance_summary_work_date", "work_date"),
+    )
+
+
+class EmployeeAttendanceState(Base):
+    """员工当前考勤状态表（每个员工一行，签到/签退通过条件 UPDATE 原子地切换状态）"""
+    __tablename__ = "employee_attendance_state"
+    
+    employee_id = Column(Integer, ForeignKey("employees.id"), primary_key=True)
+    work_date = Column(Date, nullable=False)  # last_type 所属的日期，跨天后视为未签到
+    last_type = Column(SQLEnum(AttendanceTypeEnum), nullable=True)
+    last_timestamp = Column(DateTime, nullable=True)
+    version = Column(Integer, default=0, nullable=False)  # 每次状态切换加 1
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class AttendanceArchive(Base):
+    """考勤记录归档表（已结束月份的记录移出 attendance_records，存为压缩列式文件）"""
+    __tablename__ = "attendance_archives"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    year = Column(Integer, nullable=False)
+    month = Column(Integer, nullable=False)
+    path = Column(String(500), nullable=False)  # 归档文件路径
+    record_count = Column(Integer, nullable=False)
+    checksum = Column(String(64), nullable=False)  # 归档文件的 SHA-256
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        UniqueConstraint("year", "month", name="uq_attendance_archives_year_month"),
+    )
 
 
 class WorkSchedule(Base):
@@ -62,3 +124,12 @@ class WorkSchedule(Base):
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class CacheVersion(Base):
+    """缓存版本表（多进程间通过版本号判断本地缓存是否过期）"""
+    __tablename__ = "cache_versions"
+    
+    name = Column(String(50), primary_key=True)
+    version = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,53 @@
+"""
+游标（keyset）分页工具
+
+游标对客户端是不透明的字符串，内容为 base64url 编码的 JSON。
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Tuple
+
+
+def _encode(payload: dict) -> str:
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode(cursor: str) -> dict:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(payload, dict):
+        raise ValueError("Invalid cursor")
+    return payload
+
+
+def encode_record_cursor(timestamp: datetime, record_id: int) -> str:
+    """生成考勤记录游标（按 timestamp, id 排序）"""
+    return _encode({"ts": timestamp.isoformat(), "id": record_id})
+
+
+def decode_record_cursor(cursor: str) -> Tuple[datetime, int]:
+    """解析考勤记录游标，格式错误时抛出 ValueError"""
+    payload = _decode(cursor)
+    try:
+        return datetime.fromisoformat(payload["ts"]), int(payload["id"])
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def encode_employee_cursor(employee_id: int) -> str:
+    """生成员工游标（按 id 排序）"""
+    return _encode({"id": employee_id})
+
+
+def decode_employee_cursor(cursor: str) -> int:
+    """解析员工游标，格式错误时抛出 ValueError"""
+    payload = _decode(cursor)
+    try:
+        return int(payload["id"])
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
@@ -0,0 +1,177 @@
+"""
+工时与迟到/早退报表
+
+每日汇总表（daily_attendance_summary）已经按 (员工, 日期) 记录了第一次签到、最后一次签退、
+配对次数和累计工作秒数，报表直接读取某月的汇总行（每人每天一行，而不是每条考勤记录一行），
+整列转换为 NumPy 数组后用向量运算计算迟到/早退：当天第一次签到晚于工作时间的上班时间记为迟到，
+最后一次签退早于下班时间记为早退，再按员工汇总。
+
+汇总中存储的时间和日期都是 UTC（日期为签到/签退时间戳的 UTC 日期），工作时间是 settings.TIMEZONE
+时区的本地时间：每个日期的上班/下班时间先换算成 UTC 时刻（按当天的 UTC 偏移，含夏令时）再比较
+（不支持跨零点的班次；本地工作时间与 UTC 日期跨天的时区，签到/签退可能落在相邻的汇总行）。
+每日汇总表不归档，已归档的月份同样适用；汇总表上线前的历史数据需先用
+crud.rebuild_daily_summaries 回填。
+"""
+from datetime import date, datetime, time, timezone, tzinfo
+from typing import Dict, List, Optional
+from zoneinfo import ZoneInfo
+import numpy as np
+from sqlalchemy import String, and_, select, type_coerce
+from sqlalchemy.orm import Session
+from config import settings
+import crud
+import models
+import schemas
+
+US_PER_SECOND = 1_000_000
+
+
+def _utc_us(work_date: date, value: time, tz: tzinfo) -> int:
+    """本地日期 + 本地时间对应的 UTC 时刻（自 1970-01-01 起的微秒数）"""
+    local = datetime.combine(work_date, value, tzinfo=tz)
+    return np.datetime64(local.astimezone(timezone.utc).replace(tzinfo=None), "us").astype(np.int64)
+
+
+def _utc_boundaries(work_dates: np.ndarray, value: time, tz: tzinfo) -> np.ndarray:
+    """每一行的日期在 tz 时区的 value 时刻换算成 UTC 微秒数（每个不同的日期只换算一次）"""
+    dates, inverse = np.unique(work_dates, return_inverse=True)
+    boundaries = np.array([_utc_us(day.item(), value, tz) for day in dates], dtype=np.int64)
+    return boundaries[inverse.reshape(-1)]
+
+
+def _temporal(column, dialect_name: str):
+    """SQLite 以 SQLAlchemy 自己的 ISO 格式存储日期时间，直接取出字符串交给 NumPy 批量解析，
+    跳过逐个构造 date/datetime 对象；其他数据库由驱动返回日期时间对象"""
+    return type_coerce(column, String) if dialect_name == "sqlite" else column
+
+
+def load_month_summaries(
+    db: Session,
+    year: int,
+    month: int,
+    employee_id: Optional[int] = None
+) -> Dict[str, np.ndarray]:
+    """读取某月的每日汇总列（按员工、日期排序），没有签到/签退的时间为 NaT"""
+    start, end = crud.month_range(year, month)
+    summary = models.DailyAttendanceSummary
+    connection = db.connection()
+    dialect_name = connection.dialect.name
+    query = select(
+        summary.employee_id,
+        _temporal(summary.work_date, dialect_name),
+        _temporal(summary.first_check_in, dialect_name),
+        _temporal(summary.last_check_out, dialect_name),
+        summary.check_in_count,
+        summary.check_out_count,
+        summary.pair_count,
+        summary.worked_seconds
+    ).where(
+        and_(summary.work_date >= start.date(), summary.work_date < end.date())
+    )
+    if employee_id:
+        query = query.where(summary.employee_id == employee_id)
+    rows = connection.execute(query).all()
+    columns = list(zip(*rows)) if rows else [()] * 8
+    daily = {
+        "employee_id": np.array(columns[0], dtype=np.int64),
+        "work_date": np.array(columns[1], dtype="datetime64[D]"),
+        "first_check_in": np.array(columns[2], dtype="datetime64[us]"),
+        "last_check_out": np.array(columns[3], dtype="datetime64[us]"),
+        "check_in_count": np.array(columns[4], dtype=np.int64),
+        "check_out_count": np.array(columns[5], dtype=np.int64),
+        "pair_count": np.array(columns[6], dtype=np.int64),
+        "worked_seconds": np.array(columns[7], dtype=np.int64),
+    }
+    # 在 NumPy 中排序，比数据库按 (员工, 日期) 排序更快
+    order = np.lexsort((daily["work_date"], daily["employee_id"]))
+    return {name: values[order] for name, values in daily.items()}
+
+
+def compute_daily_report(
+    daily: Dict[str, np.ndarray],
+    check_in_time: time,
+    check_out_time: time,
+    tz: Optional[tzinfo] = None
+) -> Dict[str, np.ndarray]:
+    """在每日汇总列上计算每天的迟到和早退秒数（工作时间为 tz 时区的本地时间，默认 settings.TIMEZONE）"""
+    tz = tz or ZoneInfo(settings.TIMEZONE)
+    check_in_at = _utc_boundaries(daily["work_date"], check_in_time, tz)
+    check_out_at = _utc_boundaries(daily["work_date"], check_out_time, tz)
+    has_check_in = ~np.isnat(daily["first_check_in"])
+    has_check_out = ~np.isnat(daily["last_check_out"])
+    first_check_in = daily["first_check_in"].astype(np.int64)
+    last_check_out = daily["last_check_out"].astype(np.int64)
+    
+    late_seconds = np.where(
+        has_check_in,
+        np.maximum(first_check_in - check_in_at, 0) // US_PER_SECOND,
+        0
+    )
+    early_leave_seconds = np.where(
+        has_check_out,
+        np.maximum(check_out_at - last_check_out, 0) // US_PER_SECOND,
+        0
+    )
+    return {**daily, "late_seconds": late_seconds, "early_leave_seconds": early_leave_seconds}
+
+
+def summarize_employees(daily: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """把每日报表按员工汇总（每日报表已按员工排序）"""
+    employee_ids = daily["employee_id"]
+    if len(employee_ids) == 0:
+        return {name: np.zeros(0, dtype=np.int64) for name in (
+            "employee_id", "days_present", "worked_seconds", "late_days", "late_seconds",
+            "early_leave_days", "early_leave_seconds"
+        )}
+    starts = np.flatnonzero(np.r_[True, employee_ids[1:] != employee_ids[:-1]])
+    
+    def total(values):
+        return np.add.reduceat(values, starts)
+    
+    return {
+        "employee_id": employee_ids[starts],
+        "days_present": np.diff(np.r_[starts, len(employee_ids)]),
+        "worked_seconds": total(daily["worked_seconds"]),
+        "late_days": total((daily["late_seconds"] > 0).astype(np.int64)),
+        "late_seconds": total(daily["late_seconds"]),
+        "early_leave_days": total((daily["early_leave_seconds"] > 0).astype(np.int64)),
+        "early_leave_seconds": total(daily["early_leave_seconds"]),
+    }
+
+
+def _rows(columns: Dict[str, np.ndarray]) -> List[dict]:
+    """把列转换为行（NaT 转为 None）"""
+    names = list(columns)
+    return [dict(zip(names, values)) for values in zip(*(columns[name].tolist() for name in names))]
+
+
+def build_work_report(
+    daily: Dict[str, np.ndarray],
+    year: int,
+    month: int,
+    schedule: schemas.WorkSchedule,
+    include_days: bool = True
+) -> dict:
+    """在 load_month_summaries 读出的每日汇总列上计算报表（纯计算，不访问数据库）"""
+    daily = compute_daily_report(daily, schedule.check_in_time, schedule.check_out_time)
+    return {
+        "year": year,
+        "month": month,
+        "schedule": schedule.model_dump(),
+        "employees": _rows(summarize_employees(daily)),
+        "days": _rows(daily) if include_days else [],
+    }
+
+
+def monthly_work_report(
+    db: Session,
+    year: int,
+    month: int,
+    schedule: schemas.WorkSchedule,
+    employee_id: Optional[int] = None,
+    include_days: bool = True
+) -> dict:
+    """计算某月按员工、按天的工时和迟到/早退报表"""
+    return build_work_report(
+        load_month_summaries(db, year, month, employee_id=employee_id), year, month, schedule, include_days
+    )
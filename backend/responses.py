@@ -0,0 +1,52 @@
+"""
+大响应的快速 JSON 编码
+
+路由直接返回 pydantic 模型时，FastAPI 会按 response_model 再校验一遍、转换成 dict，
+再用标准库 json 编码。月度考勤这类上万条记录的响应，大部分 CPU 都花在这几遍转换上。
+json_response() 用 pydantic-core（Rust 实现）把已校验的模型一次编码成 JSON 字节并直接返回，
+路由上的 response_model 仍然保留，用于生成接口文档。
+
+列表接口读取的是本库自己写入的行，写入前已经校验过；trusted_list_response() 按响应模型的
+字段从 ORM 行取值后直接用 orjson 编码，不再逐行做 from_attributes 校验
+（员工的 EmailStr 校验尤其慢），输出与校验后再编码的结果一致。
+"""
+from functools import lru_cache
+from typing import Iterable, Mapping, Optional, Type
+import orjson
+from fastapi import Response
+from pydantic import BaseModel, TypeAdapter
+
+
+@lru_cache(maxsize=None)
+def _adapter(model_type: type) -> TypeAdapter:
+    return TypeAdapter(model_type)
+
+
+def json_response(model: BaseModel, headers: Optional[Mapping[str, str]] = None) -> Response:
+    """把已校验的模型直接编码为 JSON 响应（不再经过 FastAPI 的二次校验和 jsonable_encoder）"""
+    return Response(
+        content=_adapter(type(model)).dump_json(model),
+        media_type="application/json",
+        headers=headers
+    )
+
+
+def orjson_response(content, headers: Optional[Mapping[str, str]] = None) -> Response:
+    """把本服务生成的数据（dict / list，不再校验）用 orjson 编码为 JSON 响应"""
+    return Response(content=orjson.dumps(content), media_type="application/json", headers=headers)
+
+
+def _row_values(row, names: tuple) -> dict:
+    # 已加载的列直接从实例 __dict__ 读取，避开 ORM 属性描述符；未加载的列仍通过 getattr 懒加载
+    values = row.__dict__
+    return {name: values[name] if name in values else getattr(row, name) for name in names}
+
+
+def trusted_list_response(
+    model_type: Type[BaseModel],
+    rows: Iterable,
+    headers: Optional[Mapping[str, str]] = None
+) -> Response:
+    """可信读取：按响应模型的字段从本库 ORM 行取值，不校验，直接用 orjson 编码为 JSON 响应"""
+    names = tuple(model_type.model_fields)
+    return orjson_response([_row_values(row, names) for row in rows], headers=headers)
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr, Field
-from datetime import datetime, time
-from typing import Optional, List
+from datetime import date, datetime, time
+from typing import Dict, Optional, List
 from models import RoleEnum, AttendanceTypeEnum
 
 
@@ -59,6 +59,87 @@ class AttendanceRecordWithEmployee(AttendanceRecord):
     employee: Employee
 
 
+class AttendanceQueued(AttendanceRecordBase):
+    """缓冲写入模式下已确认、尚未写入数据库的考勤事件"""
+    employee_id: int
+    timestamp: datetime
+    status: str = "queued"
+
+
+class AttendanceBatchRequest(BaseModel):
+    events: List[AttendanceRecordCreate] = Field(..., min_length=1, max_length=1000)
+
+
+class AttendanceBatchResult(BaseModel):
+    index: int
+    employee_id: int
+    attendance_type: AttendanceTypeEnum
+    success: bool
+    detail: Optional[str] = None
+    timestamp: Optional[datetime] = None
+
+
+class AttendanceBatchResponse(BaseModel):
+    accepted: int
+    rejected: int
+    results: List[AttendanceBatchResult]
+
+
+# Daily Summary Schemas
+class DailyAttendanceSummary(BaseModel):
+    employee_id: int
+    work_date: date
+    first_check_in: Optional[datetime] = None
+    last_check_out: Optional[datetime] = None
+    check_in_count: int
+    check_out_count: int
+    pair_count: int
+    worked_seconds: int
+    
+    class Config:
+        from_attributes = True
+
+
+class EmployeeMonthlySummary(BaseModel):
+    employee_id: int
+    days_present: int
+    check_in_count: int
+    check_out_count: int
+    pair_count: int
+    worked_seconds: int
+
+
+class MonthlySummaryResponse(BaseModel):
+    year: int
+    month: int
+    employees: List[EmployeeMonthlySummary]
+    days: List[DailyAttendanceSummary]
+
+
+class DailyWorkReport(BaseModel):
+    """某员工某天的工时和迟到/早退（迟到/早退秒数为 0 表示没有迟到/早退）"""
+    employee_id: int
+    work_date: date
+    first_check_in: Optional[datetime] = None
+    last_check_out: Optional[datetime] = None
+    check_in_count: int
+    check_out_count: int
+    pair_count: int
+    worked_seconds: int
+    late_seconds: int
+    early_leave_seconds: int
+
+
+class EmployeeWorkReport(BaseModel):
+    employee_id: int
+    days_present: int
+    worked_seconds: int
+    late_days: int
+    late_seconds: int
+    early_leave_days: int
+    early_leave_seconds: int
+
+
 # Work Schedule Schemas
 class WorkScheduleBase(BaseModel):
     name: str = Field(..., min_length=1, max_length=100)
@@ -92,8 +173,25 @@ class MessageResponse(BaseModel):
     message: str
 
 
+class WorkReportResponse(BaseModel):
+    year: int
+    month: int
+    schedule: WorkSchedule
+    employees: List[EmployeeWorkReport]
+    days: List[DailyWorkReport]
+
+
 class AttendanceStatsResponse(BaseModel):
     total_records: int
     check_in_count: int
     check_out_count: int
-    records: List[AttendanceRecordWithEmployee]
+    records: List[AttendanceRecordWithEmployee] = []
+
+
+class AttendanceStatsCompactResponse(BaseModel):
+    """紧凑格式：记录只带 employee_id，员工信息按 ID 放在 employees 中，每人只出现一次"""
+    total_records: int
+    check_in_count: int
+    check_out_count: int
+    records: List[AttendanceRecord] = []
+    employees: Dict[int, Employee] = {}
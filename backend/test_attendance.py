@@ -1,6 +1,12 @@
 import pytest
 from fastapi.testclient import TestClient
 from datetime import datetime
+import json
+import os
+import compression
+import crud
+import models
+import schemas
 
 
 class TestAttendanceAPI:
@@ -186,3 +192,1131 @@ class TestAttendanceAPI:
         )
         assert response.status_code == 400
         assert "not active" in response.json()["detail"]
+    
+    def test_get_monthly_attendance_stats_only(self, client, count_queries, employee_id):
+        """测试只返回月度统计数字"""
+        client.post("/api/attendance/check-in", params={"employee_id": employee_id})
+        client.post("/api/attendance/check-out", params={"employee_id": employee_id})
+        client.post("/api/attendance/check-in", params={"employee_id": employee_id})
+        
+        now = datetime.now()
+        with count_queries() as statements:
+            response = client.get(
+                f"/api/attendance/monthly/{now.year}/{now.month}",
+                params={"include_records": False}
+            )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["total_records"] == 3
+        assert data["check_in_count"] == 2
+        assert data["check_out_count"] == 1
+        assert data["records"] == []
+        # 统计读取每日汇总表，不扫描原始考勤记录
+        assert len(statements) == 1
+        assert "daily_attendance_summary" in statements[0]
+        assert "attendance_records" not in statements[0]
+    
+    def test_get_monthly_attendance_other_month(self, client, employee_id):
+        """测试月度统计只包含指定月份的记录"""
+        client.post("/api/attendance/check-in", params={"employee_id": employee_id})
+        
+        now = datetime.now()
+        year, month = (now.year - 1, 12) if now.month == 1 else (now.year, now.month - 1)
+        response = client.get(f"/api/attendance/monthly/{year}/{month}")
+        assert response.status_code == 200
+        assert response.json()["total_records"] == 0
+    
+    def test_get_monthly_attendance_invalid_month(self, client):
+        """测试非法月份"""
+        response = client.get("/api/attendance/monthly/2024/13")
+        assert response.status_code == 422
+    
+    def test_get_monthly_attendance_constant_queries(self, client, count_queries, employee_id):
+        """测试月度统计的查询次数不随记录数增长"""
+        for i in range(3):
+            response = client.post(
+                "/api/employees/",
+                json={
+                    "employee_id": f"EMP10{i}",
+                    "name": f"员工{i}",
+                    "email": f"emp10{i}@example.com",
+                    "role": "employee"
+                }
+            )
+            other_id = response.json()["id"]
+            client.post("/api/attendance/check-in", params={"employee_id": other_id})
+            client.post("/api/attendance/check-out", params={"employee_id": other_id})
+        
+        with count_queries() as statements:
+            now = datetime.now()
+            response = client.get(f"/api/attendance/monthly/{now.year}/{now.month}")
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data["total_records"] == 6
+        assert all(record["employee"]["id"] == record["employee_id"] for record in data["records"])
+        # 一次统计查询 + 一次记录查询
+        assert len(statements) == 2
+    
+    def test_get_monthly_attendance_compact(self, client, employee_id):
+        """测试紧凑格式：员工信息只返回一次"""
+        other_id = client.post(
+            "/api/employees/",
+            json={"employee_id": "EMP002", "name": "李四", "email": "lisi@example.com"}
+        ).json()["id"]
+        for target in (employee_id, other_id):
+            client.post("/api/attendance/check-in", params={"employee_id": target})
+            client.post("/api/attendance/check-out", params={"employee_id": target})
+        
+        now = datetime.now()
+        url = f"/api/attendance/monthly/{now.year}/{now.month}"
+        full = client.get(url).json()
+        response = client.get(url, params={"compact": True})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["total_records"] == 4
+        assert data["check_in_count"] == 2
+        assert set(data["employees"]) == {str(employee_id), str(other_id)}
+        assert data["employees"][str(other_id)]["name"] == "李四"
+        assert all("employee" not in record for record in data["records"])
+        
+        # 在客户端按 employee_id 拼接后与完整格式一致
+        joined = [
+            {**record, "employee": data["employees"][str(record["employee_id"])]}
+            for record in data["records"]
+        ]
+        assert joined == full["records"]
+    
+    def test_get_monthly_attendance_compressed(self, client, employee_id):
+        """测试月度统计按 Accept-Encoding 压缩"""
+        for _ in range(3):
+            client.post("/api/attendance/check-in", params={"employee_id": employee_id})
+            client.post("/api/attendance/check-out", params={"employee_id": employee_id})
+        
+        now = datetime.now()
+        url = f"/api/attendance/monthly/{now.year}/{now.month}"
+        response = client.get(url, headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "gzip"
+        assert "Accept-Encoding" in response.headers["vary"]
+        assert response.json()["total_records"] == 6
+        
+        plain = client.get(url, headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in plain.headers
+        assert plain.json() == response.json()
+        
+        # 小响应不压缩
+        small = client.get(url, params={"include_records": False}, headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in small.headers
+    
+    def test_export_monthly_attendance_compressed(self, client, employee_id):
+        """测试流式导出逐块压缩"""
+        for _ in range(20):
+            client.post("/api/attendance/check-in", params={"employee_id": employee_id})
+            client.post("/api/attendance/check-out", params={"employee_id": employee_id})
+        
+        now = datetime.now()
+        response = client.get(
+            f"/api/attendance/monthly/{now.year}/{now.month}/export",
+            headers={"Accept-Encoding": "gzip"}
+        )
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "gzip"
+        assert len(response.text.strip().splitlines()) == 41
+    
+    def test_choose_encoding(self):
+        """测试压缩方式协商"""
+        assert compression.choose_encoding("") is None
+        assert compression.choose_encoding("identity") is None
+        assert compression.choose_encoding("gzip, deflate") == "gzip"
+        assert compression.choose_encoding("gzip;q=0") is None
+        assert compression.choose_encoding("*") in ("br", "gzip")
+        expected = "br" if compression.brotli is not None else "gzip"
+        assert compression.choose_encoding("gzip;q=0.5, br") == expected
+    
+    def test_export_monthly_attendance_csv(self, client, employee_id):
+        """测试导出月度考勤 CSV"""
+        client.post("/api/attendance/check-in", params={"employee_id": employee_id, "notes": "正常签到"})
+        client.post("/api/attendance/check-out", params={"employee_id": employee_id})
+        
+        now = datetime.now()
+        response = client.get(f"/api/attendance/monthly/{now.year}/{now.month}/export")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        lines = response.text.strip().splitlines()
+        assert lines[0].split(",")[:4] == ["id", "employee_id", "employee_code", "employee_name"]
+        assert len(lines) == 3
+        assert "EMP001" in lines[1] and "check_in" in lines[1] and "正常签到" in lines[1]
+        assert "check_out" in lines[2]
+    
+    def test_export_monthly_attendance_ndjson(self, client, employee_id):
+        """测试导出月度考勤 NDJSON"""
+        client.post("/api/attendance/check-in", params={"employee_id": employee_id})
+        
+        now = datetime.now()
+        response = client.get(
+            f"/api/attendance/monthly/{now.year}/{now.month}/export",
+            params={"format": "ndjson", "employee_id": employee_id}
+        )
+        assert response.status_code == 200
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert len(rows) == 1
+        assert rows[0]["employee_id"] == employee_id
+        assert rows[0]["employee_name"] == "张三"
+        assert rows[0]["attendance_type"] == "check_in"
+    
+    def test_export_monthly_attendance_invalid_format(self, client):
+        """测试导出格式不支持"""
+        response = client.get("/api/attendance/monthly/2024/1/export", params={"format": "xml"})
+        assert response.status_code == 422
+    
+    def test_get_attendance_records_cursor_pagination(self, client, employee_id):
+        """测试考勤记录游标分页"""
+        for _ in range(3):
+            client.post("/api/attendance/check-in", params={"employee_id": employee_id})
+            client.post("/api/attendance/check-out", params={"employee_id": employee_id})
+        
+        first_page = client.get("/api/attendance/records", params={"limit": 4})
+        assert first_page.status_code == 200
+        assert len(first_page.json()) == 4
+        cursor = first_page.headers["X-Next-Cursor"]
+        
+        second_page = client.get("/api/attendance/records", params={"limit": 4, "cursor": cursor})
+        assert second_page.status_code == 200
+        assert len(second_page.json()) == 2
+        assert "X-Next-Cursor" not in second_page.headers
+        
+        # 与 offset 分页结果一致
+        offset_page = client.get("/api/attendance/records", params={"limit": 4, "skip": 4})
+        assert [r["id"] for r in second_page.json()] == [r["id"] for r in offset_page.json()]
+        ids = [r["id"] for r in first_page.json() + second_page.json()]
+        assert ids == sorted(ids, reverse=True)
+    
+    def test_get_attendance_records_trusted_read(self, client, db, employee_id):
+        """测试可信读取路径的输出与按 schema 校验后的结果一致"""
+        client.post("/api/attendance/check-in", params={"employee_id": employee_id, "notes": "正常签到"})
+        client.post("/api/attendance/check-out", params={"employee_id": employee_id, "latitude": "31.2", "longitude": "121.5"})
+        
+        response = client.get("/api/attendance/records")
+        assert response.status_code == 200
+        expected = [
+            schemas.AttendanceRecord.model_validate(record).model_dump(mode="json")
+            for record in crud.get_attendance_records(db)
+        ]
+        assert response.json() == expected
+    
+    def test_get_attendance_records_invalid_cursor(self, client):
+        """测试非法游标"""
+        response = client.get("/api/attendance/records", params={"cursor": "bad"})
+        assert response.status_code == 400
+    
+    def test_batch_attendance(self, client, employee_id):
+        """测试批量签到/签退"""
+        response = client.post(
+            "/api/attendance/batch",
+            json={
+                "events": [
+                    {"employee_id": employee_id, "attendance_type": "check_in", "notes": "闸机1"},
+                    {"employee_id": employee_id, "attendance_type": "check_in"},
+                    {"employee_id": 9999, "attendance_type": "check_in"},
+                    {"employee_id": employee_id, "attendance_type": "check_out"},
+                ]
+            }
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["accepted"] == 2
+        assert data["rejected"] == 2
+        results = data["results"]
+        assert [r["success"] for r in results] == [True, False, False, True]
+        assert "Already checked in" in results[1]["detail"]
+        assert "Employee not found" in results[2]["detail"]
+        assert results[0]["timestamp"] is not None
+        
+        records = client.get("/api/attendance/records", params={"employee_id": employee_id}).json()
+        assert [r["attendance_type"] for r in records] == ["check_out", "check_in"]
+        assert records[1]["notes"] == "闸机1"
+        
+        status_response = client.get(f"/api/attendance/status/{employee_id}")
+        assert status_response.json()["status"] == "checked_out"
+    
+    def test_batch_same_batch_pair(self, client, db, employee_id):
+        """测试同一批中的签到、签退时间先后分明：配对计入每日汇总，重建汇总结果一致"""
+        events = [{"employee_id": employee_id, "attendance_type": attendance_type}
+                  for attendance_type in ("check_in", "check_out", "check_in", "check_out")]
+        data = client.post("/api/attendance/batch", json={"events": events}).json()
+        assert data["accepted"] == 4
+        timestamps = [datetime.fromisoformat(result["timestamp"]) for result in data["results"]]
+        assert timestamps == sorted(set(timestamps))
+        
+        records = client.get("/api/attendance/records", params={"employee_id": employee_id}).json()
+        assert [r["attendance_type"] for r in records] == ["check_out", "check_in", "check_out", "check_in"]
+        assert client.get(f"/api/attendance/status/{employee_id}").json()["status"] == "checked_out"
+        
+        day = timestamps[0]
+        summary = client.get(f"/api/attendance/summary/{day.year}/{day.month}").json()["days"][0]
+        assert summary["pair_count"] == 2
+        assert summary["first_check_in"] < summary["last_check_out"]
+        crud.rebuild_daily_summaries(db, day.year, day.month)
+        assert client.get(f"/api/attendance/summary/{day.year}/{day.month}").json()["days"][0] == summary
+    
+    def test_batch_attendance_respects_existing_state(self, client, employee_id):
+        """测试批量上报基于已有考勤状态校验"""
+        client.post("/api/attendance/check-in", params={"employee_id": employee_id})
+        
+        response = client.post(
+            "/api/attendance/batch",
+            json={"events": [{"employee_id": employee_id, "attendance_type": "check_in"}]}
+        )
+        assert response.status_code == 200
+        assert response.json()["accepted"] == 0
+    
+    def test_batch_attendance_empty(self, client):
+        """测试空批量请求"""
+        response = client.post("/api/attendance/batch", json={"events": []})
+        assert response.status_code == 422
+    
+    def test_check_in_single_round_trip_write(self, client, count_queries, employee_id, state_cache):
+        """测试签到写入后不再 SELECT 刷新记录"""
+        client.get(f"/api/attendance/status/{employee_id}")
+        
+        with count_queries() as statements:
+            response = client.post("/api/attendance/check-in", params={"employee_id": employee_id})
+        assert response.status_code == 201
+        data = response.json()
+        assert data["id"] is not None
+        assert data["timestamp"] is not None
+        assert data["created_at"] is not None
+        
+        # 状态行条件 UPDATE + 汇总行查询 + 记录 INSERT + 汇总行 INSERT，没有提交后的刷新查询
+        assert len(statements) == 4
+        assert response.headers["X-DB-Statements"] == "4"
+        assert not any(s.lstrip().startswith("SELECT attendance_records") for s in statements)
+    
+    def test_check_in_uses_today_state_cache(self, client, count_queries, employee_id, state_cache):
+        """测试签到状态命中缓存时不查询数据库"""
+        client.get(f"/api/attendance/status/{employee_id}")
+        
+        with count_queries() as statements:
+            response = client.post("/api/attendance/check-in", params={"employee_id": employee_id})
+            assert response.status_code == 201
+            response = client.post("/api/attendance/check-in", params={"employee_id": employee_id})
+            assert response.status_code == 400
+            response = client.get(f"/api/attendance/status/{employee_id}")
+            assert response.json()["status"] == "checked_in"
+        
+        # 没有查询今日考勤记录
+        assert not any("attendance_records.timestamp >=" in s for s in statements)
+    
+    def test_today_state_cache_invalidated_on_employee_update(self, client, employee_id, state_cache):
+        """测试停用员工后缓存失效"""
+        client.get(f"/api/attendance/status/{employee_id}")
+        client.put(f"/api/employees/{employee_id}", json={"is_active": False})
+        
+        response = client.post("/api/attendance/check-in", params={"employee_id": employee_id})
+        assert response.status_code == 400
+        assert "not active" in response.json()["detail"]
+    
+    def test_concurrent_check_in_creates_one_record(self, db):
+        """测试并发签到只有一个成功（员工状态行条件 UPDATE）"""
+        import threading
+        from conftest import TestingSessionLocal
+        
+        employee = crud.create_employee(db, schemas.EmployeeCreate(
+            employee_id="EMP001", name="张三", email="zhangsan@example.com"
+        ))
+        barrier = threading.Barrier(8)
+        results = []
+        
+        def tap():
+            session = TestingSessionLocal()
+            try:
+                barrier.wait()
+                record = crud.create_attendance_record(session, schemas.AttendanceRecordCreate(
+                    employee_id=employee.id, attendance_type=models.AttendanceTypeEnum.CHECK_IN
+                ))
+                results.append(record is not None)
+            finally:
+                session.close()
+        
+        threads = [threading.Thread(target=tap) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert sorted(results) == [False] * 7 + [True]
+        assert len(crud.get_attendance_records(db, employee_id=employee.id)) == 1
+    
+    def test_check_in_conflict_with_stale_cache(self, client, employee_id, state_cache):
+        """测试缓存过期时由状态行拒绝重复签到，并使缓存失效"""
+        from cache import TodayState
+        
+        assert client.post("/api/attendance/check-in", params={"employee_id": employee_id}).status_code == 201
+        # 模拟其他进程写入后本进程缓存未更新
+        state_cache.set(employee_id, TodayState(is_active=True, attendance_type=None, timestamp=None))
+        
+        response = client.post("/api/attendance/check-in", params={"employee_id": employee_id})
+        assert response.status_code == 400
+        assert "Already checked in" in response.json()["detail"]
+        assert state_cache.get(employee_id) is None
+        assert len(client.get("/api/attendance/records").json()) == 1
+        assert client.get(f"/api/attendance/status/{employee_id}").json()["status"] == "checked_in"
+    
+    def test_state_row_created_from_existing_records(self, client, db, employee_id):
+        """测试没有状态行的员工（状态表上线前的数据）按今天的考勤记录判断"""
+        assert client.post("/api/attendance/check-in", params={"employee_id": employee_id}).status_code == 201
+        db.query(models.EmployeeAttendanceState).delete()
+        db.commit()
+        from cache import today_state_cache
+        today_state_cache.clear()
+        
+        assert client.get(f"/api/attendance/status/{employee_id}").json()["status"] == "checked_in"
+        response = client.post("/api/attendance/check-in", params={"employee_id": employee_id})
+        assert response.status_code == 400
+        response = client.post("/api/attendance/check-out", params={"employee_id": employee_id})
+        assert response.status_code == 201
+        state = db.query(models.EmployeeAttendanceState).filter_by(employee_id=employee_id).one()
+        assert state.last_type == models.AttendanceTypeEnum.CHECK_OUT
+    
+    @pytest.fixture
+    def buffered(self, monkeypatch, tmp_path):
+        """启用缓冲写入模式（不启动后台线程，由测试手动 flush）"""
+        import ingest
+        from conftest import TestingSessionLocal
+        
+        buffer = ingest.WriteBehindBuffer(str(tmp_path / "ingest.log"))
+        buffer.start(TestingSessionLocal, background=False)
+        monkeypatch.setattr(ingest, "ingest_buffer", buffer)
+        yield buffer
+        buffer.stop()
+    
+    def test_buffered_check_in_and_out(self, client, employee_id, buffered):
+        """测试缓冲写入模式：立即确认，状态校验叠加未写库的事件"""
+        response = client.post("/api/attendance/check-in", params={"employee_id": employee_id, "notes": "缓冲"})
+        assert response.status_code == 202
+        data = response.json()
+        assert data["status"] == "queued"
+        assert data["employee_id"] == employee_id
+        assert data["attendance_type"] == "check_in"
+        assert data["notes"] == "缓冲"
+        assert buffered.pending_count == 1
+        
+        # 尚未写库，但状态和重复签到校验已经看到这条事件
+        assert client.get("/api/attendance/records").json() == []
+        assert client.get(f"/api/attendance/status/{employee_id}").json()["status"] == "checked_in"
+        response = client.post("/api/attendance/check-in", params={"employee_id": employee_id})
+        assert response.status_code == 400
+        assert "Already checked in" in response.json()["detail"]
+        batch = client.post(
+            "/api/attendance/batch",
+            json={"events": [{"employee_id": employee_id, "attendance_type": "check_in"}]}
+        ).json()
+        assert batch["accepted"] == 0
+        
+        response = client.post("/api/attendance/check-out", params={"employee_id": employee_id})
+        assert response.status_code == 202
+        assert buffered.flush() == 2
+        assert buffered.pending_count == 0
+        
+        records = client.get("/api/attendance/records").json()
+        assert [record["attendance_type"] for record in records] == ["check_out", "check_in"]
+        assert records[1]["notes"] == "缓冲"
+        assert client.get(f"/api/attendance/status/{employee_id}").json()["status"] == "checked_out"
+        
+        # 员工不存在仍然直接拒绝
+        response = client.post("/api/attendance/check-in", params={"employee_id": 99999})
+        assert response.status_code == 404
+    
+    def test_buffered_log_replay(self, db, tmp_path):
+        """测试重启后重放日志：未写库的事件补写，已写库的事件不重复写入"""
+        import ingest
+        from conftest import TestingSessionLocal
+        from cache import TodayState
+        
+        employee = crud.create_employee(db, schemas.EmployeeCreate(
+            employee_id="EMP001", name="张三", email="zhangsan@example.com"
+        ))
+        state = TodayState(is_active=True, attendance_type=None, timestamp=None)
+        log_path = str(tmp_path / "ingest.log")
+        
+        buffer = ingest.WriteBehindBuffer(log_path)
+        buffer.start(TestingSessionLocal, background=False)
+        buffer.submit(
+            state, {"employee_id": employee.id, "attendance_type": models.AttendanceTypeEnum.CHECK_IN}, lambda s: None
+        )
+        buffer.submit(
+            state, {"employee_id": employee.id, "attendance_type": models.AttendanceTypeEnum.CHECK_OUT}, lambda s: None
+        )
+        with open(log_path, encoding="utf-8") as log:
+            logged = log.read()
+        assert buffer.flush() == 2
+        buffer.stop()
+        
+        # 模拟写库成功但日志未重写时崩溃，外加一条未写库的事件和一行写了一半的记录
+        restarted = ingest.WriteBehindBuffer(log_path)
+        with open(log_path, "w", encoding="utf-8") as log:
+            log.write(logged)
+            log.write(restarted._encode({
+                "employee_id": employee.id,
+                "attendance_type": models.AttendanceTypeEnum.CHECK_IN,
+                "timestamp": datetime.utcnow()
+            }) + "\n")
+            log.write('{"employee_id": ')
+        
+        restarted.start(TestingSessionLocal, background=False)
+        assert restarted.pending_count == 3
+        assert restarted.overlay(employee.id, state).attendance_type == models.AttendanceTypeEnum.CHECK_IN
+        assert restarted.flush() == 3
+        restarted.stop()
+        
+        types = [record.attendance_type for record in crud.get_attendance_records(db)]
+        assert types == [
+            models.AttendanceTypeEnum.CHECK_IN,
+            models.AttendanceTypeEnum.CHECK_OUT,
+            models.AttendanceTypeEnum.CHECK_IN
+        ]
+        with open(log_path, encoding="utf-8") as log:
+            assert log.read() == ""
+    
+    def test_buffered_replay_dedupes_by_event_id(self, db, tmp_path):
+        """测试重放日志按 event_id 去重：数据库截断了时间的微秒部分（如 MySQL DATETIME）也不会重复写入"""
+        import ingest
+        from conftest import TestingSessionLocal
+        from cache import TodayState
+        
+        employee = crud.create_employee(db, schemas.EmployeeCreate(
+            employee_id="EMP001", name="张三", email="zhangsan@example.com"
+        ))
+        state = TodayState(is_active=True, attendance_type=None, timestamp=None)
+        log_path = str(tmp_path / "ingest.log")
+        buffer = ingest.WriteBehindBuffer(log_path)
+        buffer.start(TestingSessionLocal, background=False)
+        event = buffer.submit(
+            state, {"employee_id": employee.id, "attendance_type": models.AttendanceTypeEnum.CHECK_IN}, lambda s: None
+        )
+        with open(log_path, encoding="utf-8") as log:
+            logged = log.read()
+        assert buffer.flush() == 1
+        buffer.stop()
+        
+        record = db.query(models.AttendanceRecord).one()
+        assert record.event_id == event["event_id"]
+        record.timestamp = record.timestamp.replace(microsecond=0)
+        db.commit()
+        
+        restarted = ingest.WriteBehindBuffer(log_path)
+        with open(log_path, "w", encoding="utf-8") as log:
+            log.write(logged)
+        restarted.start(TestingSessionLocal, background=False)
+        assert restarted.pending_count == 1
+        assert restarted.flush() == 1
+        restarted.stop()
+        assert db.query(models.AttendanceRecord).count() == 1
+    
+    def test_buffered_batch_sees_pending_events(self, client, employee_id, buffered):
+        """测试缓冲写入模式下批量接口按叠加了未写库事件的状态校验，合法事件进入缓冲"""
+        assert client.post("/api/attendance/check-in", params={"employee_id": employee_id}).status_code == 202
+        
+        batch = client.post("/api/attendance/batch", json={"events": [
+            {"employee_id": employee_id, "attendance_type": "check_in"},
+            {"employee_id": employee_id, "attendance_type": "check_out"},
+            {"employee_id": employee_id, "attendance_type": "check_in"},
+        ]}).json()
+        assert batch["accepted"] == 2
+        assert [result["success"] for result in batch["results"]] == [False, True, True]
+        assert batch["results"][1]["timestamp"] < batch["results"][2]["timestamp"]
+        assert buffered.pending_count == 3
+        assert client.get(f"/api/attendance/status/{employee_id}").json()["status"] == "checked_in"
+        
+        assert buffered.flush() == 3
+        records = client.get("/api/attendance/records").json()
+        assert [record["attendance_type"] for record in records] == ["check_in", "check_out", "check_in"]
+    
+    def test_buffered_stop_flushes_everything(self, db, tmp_path):
+        """测试关闭时写入全部积压（超过一批）"""
+        import ingest
+        from conftest import TestingSessionLocal
+        from cache import TodayState
+        
+        employee = crud.create_employee(db, schemas.EmployeeCreate(
+            employee_id="EMP001", name="张三", email="zhangsan@example.com"
+        ))
+        state = TodayState(is_active=True, attendance_type=None, timestamp=None)
+        buffer = ingest.WriteBehindBuffer(str(tmp_path / "ingest.log"), batch_size=1)
+        buffer.start(TestingSessionLocal, background=False)
+        for attendance_type in (models.AttendanceTypeEnum.CHECK_IN, models.AttendanceTypeEnum.CHECK_OUT) * 2:
+            buffer.submit(state, {"employee_id": employee.id, "attendance_type": attendance_type}, lambda s: None)
+        buffer.stop()
+        
+        assert len(crud.get_attendance_records(db)) == 4
+    
+    def test_buffered_group_commit(self, db, tmp_path, monkeypatch):
+        """测试并发提交共用 fsync：每条事件确认前都已落盘，但 fsync 次数少于事件数"""
+        import threading
+        import time
+        import ingest
+        from conftest import TestingSessionLocal
+        from cache import TodayState
+        
+        fsync = ingest.os.fsync
+        calls = []
+        
+        def slow_fsync(fileno):
+            calls.append(fileno)
+            time.sleep(0.05)
+            fsync(fileno)
+        
+        buffer = ingest.WriteBehindBuffer(str(tmp_path / "ingest.log"))
+        buffer.start(TestingSessionLocal, background=False)
+        monkeypatch.setattr(ingest.os, "fsync", slow_fsync)
+        state = TodayState(is_active=True, attendance_type=None, timestamp=None)
+        threads = [
+            threading.Thread(target=buffer.submit, args=(
+                state, {"employee_id": index, "attendance_type": models.AttendanceTypeEnum.CHECK_IN}, lambda s: None
+            ))
+            for index in range(1, 9)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert buffer.pending_count == 8
+        assert buffer._synced == 8
+        assert len(calls) < 8
+        with open(buffer.log_path, encoding="utf-8") as log:
+            assert len(log.readlines()) == 8
+    
+    def test_buffered_dead_letter(self, db, tmp_path, monkeypatch):
+        """测试一批多次写库失败后，无法写入的事件移入死信日志，其余事件照常写库"""
+        import ingest
+        from conftest import TestingSessionLocal
+        from cache import TodayState
+        from metrics import attendance_ingest_dead_letters_total
+        
+        employee = crud.create_employee(db, schemas.EmployeeCreate(
+            employee_id="EMP001", name="张三", email="zhangsan@example.com"
+        ))
+        insert_rows = crud.insert_attendance_rows
+        
+        def failing_insert(session, rows, **kwargs):
+            if any(row["employee_id"] == 99999 for row in rows):
+                raise ValueError("employee deleted")
+            return insert_rows(session, rows, **kwargs)
+        
+        monkeypatch.setattr(ingest.crud, "insert_attendance_rows", failing_insert)
+        state = TodayState(is_active=True, attendance_type=None, timestamp=None)
+        buffer = ingest.WriteBehindBuffer(str(tmp_path / "ingest.log"), max_retries=2)
+        buffer.start(TestingSessionLocal, background=False)
+        for employee_id in (99999, employee.id):
+            buffer.submit(
+                state, {"employee_id": employee_id, "attendance_type": models.AttendanceTypeEnum.CHECK_IN}, lambda s: None
+            )
+        dead_letters = attendance_ingest_dead_letters_total.get()
+        
+        assert buffer.flush() == 0
+        assert buffer.pending_count == 2
+        assert buffer.flush() == 2
+        assert buffer.pending_count == 0
+        assert attendance_ingest_dead_letters_total.get() == dead_letters + 1
+        buffer.stop()
+        
+        assert [record.employee_id for record in crud.get_attendance_records(db)] == [employee.id]
+        with open(buffer.dead_letter_path, encoding="utf-8") as dead_letter_log:
+            assert [json.loads(line)["employee_id"] for line in dead_letter_log] == [99999]
+    
+    def test_late_flush_keeps_event_date(self, client, db, employee_id):
+        """测试跨零点才写库的事件按事件日期更新状态，不算作今天的状态"""
+        from datetime import timedelta
+        
+        assert client.get(f"/api/attendance/status/{employee_id}").json()["status"] == "not_checked_in"
+        yesterday = datetime.utcnow() - timedelta(days=1)
+        crud.insert_attendance_rows(db, [{
+            "employee_id": employee_id,
+            "attendance_type": models.AttendanceTypeEnum.CHECK_IN,
+            "timestamp": yesterday,
+        }])
+        
+        state = db.query(models.EmployeeAttendanceState).filter_by(employee_id=employee_id).one()
+        assert state.work_date == yesterday.date()
+        assert client.get(f"/api/attendance/status/{employee_id}").json()["status"] == "not_checked_in"
+        assert client.post("/api/attendance/check-in", params={"employee_id": employee_id}).status_code == 201
+    
+    def test_backfill_daily_summaries(self, client, db, employee_id):
+        """测试已有考勤记录但汇总表为空（升级前的数据库）时回填每日汇总"""
+        for attendance_type, timestamp in (
+            (models.AttendanceTypeEnum.CHECK_IN, datetime(2025, 3, 3, 9, 0)),
+            (models.AttendanceTypeEnum.CHECK_OUT, datetime(2025, 3, 3, 18, 0)),
+            (models.AttendanceTypeEnum.CHECK_IN, datetime(2025, 5, 6, 9, 0)),
+        ):
+            db.add(models.AttendanceRecord(employee_id=employee_id, attendance_type=attendance_type, timestamp=timestamp))
+        db.commit()
+        assert client.get("/api/attendance/monthly/2025/3").json()["total_records"] == 0
+        
+        assert crud.backfill_daily_summaries(db) == [(2025, 3), (2025, 4), (2025, 5)]
+        march = client.get("/api/attendance/monthly/2025/3", params={"include_records": False}).json()
+        assert (march["total_records"], march["check_in_count"], march["check_out_count"]) == (2, 1, 1)
+        assert client.get("/api/attendance/monthly/2025/5").json()["check_in_count"] == 1
+        
+        # 只执行一次
+        assert crud.backfill_daily_summaries(db) == []
+    
+    def test_get_monthly_summary(self, client, db, employee_id):
+        """测试月度汇总读取每日汇总表"""
+        client.post("/api/attendance/check-in", params={"employee_id": employee_id})
+        client.post("/api/attendance/check-out", params={"employee_id": employee_id})
+        client.post(
+            "/api/attendance/batch",
+            json={"events": [{"employee_id": employee_id, "attendance_type": "check_in"}]}
+        )
+        
+        now = datetime.now()
+        response = client.get(f"/api/attendance/summary/{now.year}/{now.month}")
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data["days"]) == 1
+        day = data["days"][0]
+        assert day["employee_id"] == employee_id
+        assert day["check_in_count"] == 2
+        assert day["check_out_count"] == 1
+        assert day["pair_count"] == 1
+        assert day["first_check_in"] is not None
+        assert data["employees"] == [{
+            "employee_id": employee_id,
+            "days_present": 1,
+            "check_in_count": 2,
+            "check_out_count": 1,
+            "pair_count": 1,
+            "worked_seconds": day["worked_seconds"]
+        }]
+        
+        # 重建结果与增量维护一致
+        assert crud.rebuild_daily_summaries(db, now.year, now.month) == 1
+        rebuilt = client.get(f"/api/attendance/summary/{now.year}/{now.month}").json()
+        assert rebuilt["days"] == data["days"]
+    
+    def test_generate_data(self, client, db):
+        """测试批量生成的记录和每日汇总"""
+        import generate_data
+        from datetime import date
+        from conftest import engine
+        
+        options = generate_data.parse_args([
+            "--employees", "4", "--months", "1", "--absence-rate", "0", "--remote-rate", "1", "--batch-size", "7"
+        ])
+        result = generate_data.generate(engine, options, end=date(2026, 3, 16), log=lambda message: None)
+        assert len(result["employee_ids"]) == 4
+        assert result["work_days"] == 10
+        assert result["records"] == 80
+        assert result["summaries"] == 40
+        
+        response = client.get("/api/attendance/monthly/2026/3")
+        data = response.json()
+        assert data["check_in_count"] == 40
+        assert data["check_out_count"] == 40
+        assert all(record["notes"] == "远程办公" for record in data["records"])
+        
+        # 生成的汇总与从记录重建的结果一致
+        generated = client.get("/api/attendance/summary/2026/3").json()
+        assert crud.rebuild_daily_summaries(db, 2026, 3) == 40
+        rebuilt = client.get("/api/attendance/summary/2026/3").json()
+        assert rebuilt["days"] == generated["days"]
+    
+    def test_generate_data_existing_prefix(self, db):
+        """测试已有同前缀编号时，新员工从最大编号之后开始且只返回新员工"""
+        import generate_data
+        from conftest import engine
+        
+        existing = crud.create_employee(db, schemas.EmployeeCreate(
+            employee_id="GEN005", name="已有员工", email="gen005@example.com"
+        ))
+        with engine.begin() as connection:
+            employee_ids = generate_data.insert_employees(connection, 2, "GEN")
+        
+        assert len(employee_ids) == 2
+        assert existing.id not in employee_ids
+        codes = [crud.get_employee(db, employee_id).employee_id for employee_id in employee_ids]
+        assert codes == ["GEN0000006", "GEN0000007"]
+    
+    def test_archive_month(self, client, db, employee_id, monkeypatch, tmp_path):
+        """测试归档已结束月份后月度查询、导出和汇总重建读取归档文件"""
+        import archive
+        monkeypatch.setattr(archive.settings, "ARCHIVE_DIR", str(tmp_path))
+        
+        crud.insert_attendance_rows(db, [
+            {"employee_id": employee_id, "attendance_type": models.AttendanceTypeEnum.CHECK_IN,
+             "timestamp": datetime(2025, 3, day, 9, 0), "notes": "归档"}
+            for day in (3, 4)
+        ] + [
+            {"employee_id": employee_id, "attendance_type": models.AttendanceTypeEnum.CHECK_OUT,
+             "timestamp": datetime(2025, 3, 3, 18, 0), "latitude": "39.9", "longitude": "116.4"}
+        ], update_states=False)
+        crud.rebuild_daily_summaries(db, 2025, 3)
+        monthly = client.get("/api/attendance/monthly/2025/3").json()
+        filtered = client.get("/api/attendance/monthly/2025/3", params={"employee_id": employee_id}).json()
+        exported = client.get("/api/attendance/monthly/2025/3/export", params={"format": "ndjson"}).text
+        summary = client.get("/api/attendance/summary/2025/3").json()
+        
+        archived = archive.archive_month(db, 2025, 3)
+        assert archived.record_count == 3
+        assert db.query(models.AttendanceRecord).count() == 0
+        assert client.get("/api/attendance/monthly/2025/3").json() == monthly
+        assert client.get("/api/attendance/monthly/2025/3", params={"employee_id": employee_id}).json() == filtered
+        assert client.get("/api/attendance/monthly/2025/3/export", params={"format": "ndjson"}).text == exported
+        assert crud.rebuild_daily_summaries(db, 2025, 3) == 2
+        assert client.get("/api/attendance/summary/2025/3").json() == summary
+        assert monthly["total_records"] == 3
+        
+        # 本月不能归档，已归档的月份不能重复归档
+        now = datetime.now()
+        with pytest.raises(ValueError):
+            archive.archive_month(db, now.year, now.month)
+        with pytest.raises(ValueError):
+            archive.archive_month(db, 2025, 3)
+        
+        assert archive.restore_month(db, 2025, 3) == 3
+        assert db.query(models.AttendanceRecord).count() == 3
+        assert client.get("/api/attendance/monthly/2025/3").json() == monthly
+    
+    def test_archive_absorbs_late_records(self, client, db, employee_id, monkeypatch, tmp_path):
+        """测试归档后才写库的记录（如写后缓冲跨月写入）并入归档文件"""
+        import archive
+        monkeypatch.setattr(archive.settings, "ARCHIVE_DIR", str(tmp_path))
+        
+        crud.insert_attendance_rows(db, [
+            {"employee_id": employee_id, "attendance_type": models.AttendanceTypeEnum.CHECK_IN,
+             "timestamp": datetime(2025, 3, 31, 9, 0)}
+        ], update_states=False)
+        first = archive.archive_month(db, 2025, 3)
+        first_path = first.path
+        
+        crud.insert_attendance_rows(db, [
+            {"employee_id": employee_id, "attendance_type": models.AttendanceTypeEnum.CHECK_OUT,
+             "timestamp": datetime(2025, 3, 31, 23, 59, 59)}
+        ], update_states=False)
+        assert db.query(models.AttendanceRecord).count() == 0
+        archived = archive.get_archive(db, 2025, 3)
+        assert archived.record_count == 2
+        assert archived.path != first_path
+        assert os.listdir(tmp_path) == [os.path.basename(archived.path)]
+        
+        data = client.get("/api/attendance/monthly/2025/3").json()
+        assert data["check_in_count"] == 1
+        assert data["check_out_count"] == 1
+        assert [record["attendance_type"] for record in data["records"]] == ["check_out", "check_in"]
+        
+        
+        # 直接写入（单条签到）同样并入归档
+        class LateDatetime(datetime):
+            @classmethod
+            def utcnow(cls):
+                return datetime(2025, 3, 31, 23, 59, 59, 500000)
+        
+        monkeypatch.setattr(crud, "datetime", LateDatetime)
+        assert client.post("/api/attendance/check-in", params={"employee_id": employee_id}).status_code == 201
+        assert db.query(models.AttendanceRecord).count() == 0
+        assert client.get("/api/attendance/monthly/2025/3").json()["check_in_count"] == 2
+        
+        db.expire_all()
+        assert archive.restore_month(db, 2025, 3) == 3
+        assert os.listdir(tmp_path) == []
+    
+    def test_archive_keeps_rows_written_during_archiving(self, client, db, employee_id, monkeypatch, tmp_path):
+        """测试读取记录之后、删除之前提交的同月记录不会被删除丢失，而是并入归档"""
+        import archive
+        from conftest import TestingSessionLocal
+        monkeypatch.setattr(archive.settings, "ARCHIVE_DIR", str(tmp_path))
+        
+        crud.insert_attendance_rows(db, [
+            {"employee_id": employee_id, "attendance_type": models.AttendanceTypeEnum.CHECK_IN,
+             "timestamp": datetime(2025, 3, 31, 9, 0)}
+        ], update_states=False)
+        write_rows = archive._write_rows
+        
+        def write_rows_with_concurrent_insert(*args):
+            # 模拟归档写文件期间其他进程提交了同月记录（写入时该月尚未登记归档）
+            if not getattr(write_rows_with_concurrent_insert, "done", False):
+                write_rows_with_concurrent_insert.done = True
+                other = TestingSessionLocal()
+                other.add(models.AttendanceRecord(
+                    employee_id=employee_id,
+                    attendance_type=models.AttendanceTypeEnum.CHECK_OUT,
+                    timestamp=datetime(2025, 3, 31, 23, 59, 59)
+                ))
+                other.commit()
+                other.close()
+            return write_rows(*args)
+        
+        monkeypatch.setattr(archive, "_write_rows", write_rows_with_concurrent_insert)
+        archive.archive_month(db, 2025, 3)
+        
+        assert db.query(models.AttendanceRecord).count() == 0
+        assert archive.get_archive(db, 2025, 3).record_count == 2
+        records = client.get("/api/attendance/monthly/2025/3").json()["records"]
+        assert [record["attendance_type"] for record in records] == ["check_out", "check_in"]
+    
+    def test_closed_month_uses_utc_date(self):
+        """测试按 UTC 日期判断月份是否结束（考勤时间以 UTC 存储）"""
+        import archive
+        from datetime import date
+        
+        assert archive.is_closed_month(2025, 3, today=date(2025, 4, 1))
+        assert not archive.is_closed_month(2025, 4, today=date(2025, 4, 1))
+        utc_today = datetime.utcnow().date()
+        assert not archive.is_closed_month(utc_today.year, utc_today.month)
+    
+    def test_work_report(self, client, db, employee_id, monkeypatch, tmp_path):
+        """测试月度工时和迟到/早退报表（含归档月份）"""
+        import archive
+        monkeypatch.setattr(archive.settings, "ARCHIVE_DIR", str(tmp_path))
+        
+        assert client.get("/api/attendance/report/2025/3").status_code == 404
+        client.post(
+            "/api/schedules/",
+            json={"name": "标准工作时间", "check_in_time": "09:00:00", "check_out_time": "18:00:00"}
+        )
+        
+        check_in, check_out = models.AttendanceTypeEnum.CHECK_IN, models.AttendanceTypeEnum.CHECK_OUT
+        events = [
+            # 迟到 10 分 30 秒、早退 30 分钟
+            (check_in, datetime(2025, 3, 3, 9, 10, 30)),
+            (check_out, datetime(2025, 3, 3, 17, 30)),
+            # 午休签退再签到，两段都计入工时
+            (check_in, datetime(2025, 3, 4, 8, 55)),
+            (check_out, datetime(2025, 3, 4, 12, 0)),
+            (check_in, datetime(2025, 3, 4, 13, 0)),
+            (check_out, datetime(2025, 3, 4, 18, 30)),
+            # 忘记签退
+            (check_in, datetime(2025, 3, 5, 9, 0)),
+        ]
+        crud.insert_attendance_rows(db, [
+            {"employee_id": employee_id, "attendance_type": attendance_type, "timestamp": timestamp}
+            for attendance_type, timestamp in events
+        ], update_states=False)
+        
+        response = client.get("/api/attendance/report/2025/3")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["schedule"]["check_in_time"] == "09:00:00"
+        days = {day["work_date"]: day for day in data["days"]}
+        assert days["2025-03-03"]["late_seconds"] == 630
+        assert days["2025-03-03"]["early_leave_seconds"] == 1800
+        assert days["2025-03-03"]["worked_seconds"] == 29970
+        assert days["2025-03-04"]["late_seconds"] == 0
+        assert days["2025-03-04"]["early_leave_seconds"] == 0
+        assert days["2025-03-04"]["pair_count"] == 2
+        assert days["2025-03-04"]["worked_seconds"] == 11100 + 19800
+        assert days["2025-03-05"]["last_check_out"] is None
+        assert days["2025-03-05"]["worked_seconds"] == 0
+        assert data["employees"] == [{
+            "employee_id": employee_id,
+            "days_present": 3,
+            "worked_seconds": 29970 + 30900,
+            "late_days": 1,
+            "late_seconds": 630,
+            "early_leave_days": 1,
+            "early_leave_seconds": 1800,
+        }]
+        
+        # 与每日汇总表的配对结果一致
+        crud.rebuild_daily_summaries(db, 2025, 3)
+        summary = client.get("/api/attendance/summary/2025/3").json()
+        for day in summary["days"]:
+            assert days[day["work_date"]]["worked_seconds"] == day["worked_seconds"]
+            assert days[day["work_date"]]["pair_count"] == day["pair_count"]
+        
+        # 报表读取每日汇总表（不归档），归档后结果不变
+        archive.archive_month(db, 2025, 3)
+        assert client.get("/api/attendance/report/2025/3").json() == data
+        filtered = client.get("/api/attendance/report/2025/3", params={"employee_id": employee_id + 1, "include_days": False})
+        assert filtered.json()["employees"] == []
+    
+    def test_work_report_timezone(self, client, db, employee_id, monkeypatch):
+        """测试工作时间按配置的时区换算成 UTC 后计算迟到/早退（含夏令时）"""
+        from datetime import time
+        from zoneinfo import ZoneInfo
+        import numpy as np
+        import reports
+        client.post(
+            "/api/schedules/",
+            json={"name": "标准工作时间", "check_in_time": "09:00:00", "check_out_time": "18:00:00"}
+        )
+        check_in, check_out = models.AttendanceTypeEnum.CHECK_IN, models.AttendanceTypeEnum.CHECK_OUT
+        events = [
+            # 北京时间 09:05 签到（迟到 5 分钟），17:00 签退（早退 1 小时）
+            (check_in, datetime(2025, 3, 3, 1, 5)),
+            (check_out, datetime(2025, 3, 3, 9, 0)),
+        ]
+        crud.insert_attendance_rows(db, [
+            {"employee_id": employee_id, "attendance_type": attendance_type, "timestamp": timestamp}
+            for attendance_type, timestamp in events
+        ], update_states=False)
+        
+        monkeypatch.setattr(reports.settings, "TIMEZONE", "Asia/Shanghai")
+        day = client.get("/api/attendance/report/2025/3").json()["days"][0]
+        assert day["late_seconds"] == 300
+        assert day["early_leave_seconds"] == 3600
+        
+        # 按 UTC 比较时同样的数据没有迟到，早退 9 小时
+        monkeypatch.setattr(reports.settings, "TIMEZONE", "UTC")
+        day = client.get("/api/attendance/report/2025/3").json()["days"][0]
+        assert day["late_seconds"] == 0
+        assert day["early_leave_seconds"] == 9 * 3600
+        
+        # 夏令时前后 UTC 偏移不同：纽约 3 月 7 日为 UTC-5，3 月 10 日为 UTC-4
+        daily = {
+            "work_date": np.array(["2025-03-07", "2025-03-10"], dtype="datetime64[D]"),
+            "first_check_in": np.array(["2025-03-07T14:00", "2025-03-10T13:00"], dtype="datetime64[us]"),
+            "last_check_out": np.array(["2025-03-07T23:00", "2025-03-10T22:00"], dtype="datetime64[us]"),
+        }
+        report = reports.compute_daily_report(daily, time(9, 0), time(18, 0), ZoneInfo("America/New_York"))
+        assert report["late_seconds"].tolist() == [0, 0]
+        assert report["early_leave_seconds"].tolist() == [0, 0]
+    
+    def test_cpu_and_file_work_off_event_loop(self, client, db, employee_id, monkeypatch, tmp_path):
+        """测试报表计算、月度记录序列化和归档文件读写不在事件循环线程中执行"""
+        import asyncio
+        import api_attendance
+        import api_attendance_async
+        import archive
+        import reports
+        monkeypatch.setattr(archive.settings, "ARCHIVE_DIR", str(tmp_path))
+        
+        calls = []
+        
+        def off_loop(name, function):
+            def wrapper(*args, **kwargs):
+                try:
+                    asyncio.get_running_loop()
+                    calls.append((name, False))
+                except RuntimeError:
+                    calls.append((name, True))
+                return function(*args, **kwargs)
+            return wrapper
+        
+        monkeypatch.setattr(reports, "build_work_report", off_loop("report", reports.build_work_report))
+        monkeypatch.setattr(archive, "write_merged_archive", off_loop("absorb", archive.write_merged_archive))
+        for module in (api_attendance, api_attendance_async):
+            monkeypatch.setattr(module, "monthly_stats_response", off_loop("monthly", module.monthly_stats_response))
+        
+        client.post(
+            "/api/schedules/",
+            json={"name": "标准工作时间", "check_in_time": "09:00:00", "check_out_time": "18:00:00"}
+        )
+        crud.insert_attendance_rows(db, [
+            {"employee_id": employee_id, "attendance_type": models.AttendanceTypeEnum.CHECK_IN,
+             "timestamp": datetime(2025, 3, 31, 9, 0)}
+        ], update_states=False)
+        archive.archive_month(db, 2025, 3)
+        
+        class LateDatetime(datetime):
+            @classmethod
+            def utcnow(cls):
+                return datetime(2025, 3, 31, 23, 59, 59)
+        
+        monkeypatch.setattr(crud, "datetime", LateDatetime)
+        assert client.post("/api/attendance/check-in", params={"employee_id": employee_id}).status_code == 201
+        assert client.get("/api/attendance/monthly/2025/3").json()["check_in_count"] == 2
+        assert client.get("/api/attendance/report/2025/3").status_code == 200
+        assert sorted(calls) == [("absorb", True), ("monthly", True), ("report", True)]
+    
+    async def test_broadcaster_fan_out(self):
+        """测试事件广播到所有订阅者（可从其他线程发布）"""
+        import asyncio
+        import threading
+        from broadcast import EventBroadcaster
+        
+        broadcaster = EventBroadcaster(queue_size=10)
+        queues = [broadcaster.subscribe() for _ in range(3)]
+        assert broadcaster.subscriber_count == 3
+        
+        publisher = threading.Thread(target=broadcaster.publish_attendance, args=(
+            7, models.AttendanceTypeEnum.CHECK_IN, datetime(2025, 3, 3, 9, 0), 42
+        ))
+        publisher.start()
+        publisher.join()
+        messages = [await asyncio.wait_for(queue.get(), 1) for queue in queues]
+        assert len(set(messages)) == 1
+        lines = messages[0].decode().splitlines()
+        assert lines[:2] == ["id: 1", "event: attendance"]
+        assert json.loads(lines[2][len("data: "):]) == {
+            "id": 42,
+            "employee_id": 7,
+            "attendance_type": "check_in",
+            "timestamp": "2025-03-03T09:00:00+00:00",
+            "status": "checked_in",
+        }
+        
+        broadcaster.unsubscribe(queues[0])
+        assert broadcaster.subscriber_count == 2
+    
+    async def test_broadcaster_slow_subscriber_resync(self):
+        """测试订阅者积压超过上限时丢弃积压并发送 resync"""
+        import asyncio
+        from broadcast import EventBroadcaster, RESYNC
+        
+        broadcaster = EventBroadcaster(queue_size=2)
+        slow = broadcaster.subscribe()
+        for _ in range(3):
+            broadcaster.publish("attendance", {"employee_id": 1})
+        await asyncio.sleep(0)
+        assert slow.qsize() == 1
+        assert slow.get_nowait() == RESYNC
+    
+    async def test_broadcaster_stream(self):
+        """测试 SSE 生成器：先发送重连间隔，空闲时发送心跳，关闭后取消订阅"""
+        from broadcast import EventBroadcaster, HEARTBEAT, RESYNC
+        
+        broadcaster = EventBroadcaster(queue_size=10, heartbeat=0.01)
+        stream = broadcaster.stream()
+        assert (await stream.__anext__()).startswith(b"retry:")
+        assert await stream.__anext__() == HEARTBEAT
+        broadcaster.publish("attendance", {"employee_id": 1})
+        assert b"event: attendance" in await stream.__anext__()
+        await stream.aclose()
+        assert broadcaster.subscriber_count == 0
+        
+        # 断线重连时先通知客户端重新拉取
+        reconnected = broadcaster.stream(resync=True)
+        assert (await reconnected.__anext__()).startswith(b"retry:")
+        assert await reconnected.__anext__() == RESYNC
+        await reconnected.aclose()
+    
+    async def test_check_in_publishes_event(self, client, employee_id):
+        """测试签到、签退和批量写入后推送事件"""
+        import asyncio
+        from broadcast import broadcaster
+        
+        queue = broadcaster.subscribe()
+        try:
+            await asyncio.to_thread(client.post, "/api/attendance/check-in", params={"employee_id": employee_id})
+            await asyncio.to_thread(client.post, "/api/attendance/check-out", params={"employee_id": employee_id})
+            await asyncio.to_thread(
+                client.post, "/api/attendance/batch",
+                json={"events": [{"employee_id": employee_id, "attendance_type": "check_in"}]}
+            )
+            events = []
+            for _ in range(3):
+                message = (await asyncio.wait_for(queue.get(), 1)).decode()
+                events.append(json.loads(message.splitlines()[2][len("data: "):]))
+        finally:
+            broadcaster.unsubscribe(queue)
+        
+        assert [event["status"] for event in events] == ["checked_in", "checked_out", "checked_in"]
+        assert all(event["employee_id"] == employee_id for event in events)
+        # 批量写入的事件同样带记录 ID
+        records = client.get("/api/attendance/records").json()
+        assert [event["id"] for event in events] == [record["id"] for record in reversed(records)]
+    
+    def test_bulk_create_returns_ids_without_returning(self, db, employee_id, monkeypatch):
+        """测试不支持 INSERT ... RETURNING 的数据库（如 MySQL）上批量写入后按 event_id 查回记录 ID"""
+        dialect = db.get_bind().dialect
+        monkeypatch.setattr(dialect, "insert_executemany_returning_sort_by_parameter_order", False)
+        rows = crud.create_attendance_records_bulk(db, [
+            schemas.AttendanceRecordCreate(employee_id=employee_id, attendance_type=models.AttendanceTypeEnum.CHECK_IN),
+            schemas.AttendanceRecordCreate(employee_id=employee_id, attendance_type=models.AttendanceTypeEnum.CHECK_OUT),
+        ])
+        records = {record.event_id: record.id for record in db.query(models.AttendanceRecord)}
+        assert [row["id"] for row in rows] == [records[row["event_id"]] for row in rows]
+        assert None not in [row["id"] for row in rows]
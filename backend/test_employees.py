@@ -1,6 +1,8 @@
 import pytest
 from fastapi.testclient import TestClient
+import crud
 import models
+import schemas
 
 
 class TestEmployeeAPI:
@@ -145,6 +147,31 @@ class TestEmployeeAPI:
         assert data["name"] == "张三三"
         assert data["role"] == "supervisor"
     
+    def test_write_without_refresh(self, client, count_queries):
+        """测试创建、更新员工时不在提交后再次查询"""
+        with count_queries() as statements:
+            response = client.post(
+                "/api/employees/",
+                json={"employee_id": "EMP001", "name": "张三", "email": "zhangsan@example.com"}
+            )
+        assert response.status_code == 201
+        data = response.json()
+        assert data["id"] is not None
+        assert data["is_active"] is True
+        assert data["role"] == "employee"
+        assert data["created_at"] is not None
+        # 编号、邮箱查重后 INSERT（员工和状态行），之后没有刷新查询
+        assert [s.split(" (")[0] for s in statements[-2:]] == [
+            "INSERT INTO employees", "INSERT INTO employee_attendance_state"
+        ]
+        
+        with count_queries() as statements:
+            response = client.put(f"/api/employees/{data['id']}", json={"name": "张三丰"})
+        assert response.json()["name"] == "张三丰"
+        assert response.json()["updated_at"] >= data["updated_at"]
+        # 查询员工 + UPDATE
+        assert len(statements) == 2
+    
     def test_create_supervisor(self, client):
         """测试创建主管"""
         response = client.post(
@@ -159,3 +186,75 @@ class TestEmployeeAPI:
         assert response.status_code == 201
         data = response.json()
         assert data["role"] == "supervisor"
+    
+    def test_get_employees_cursor_pagination(self, client):
+        """测试员工列表游标分页"""
+        for i in range(5):
+            client.post(
+                "/api/employees/",
+                json={
+                    "employee_id": f"EMP00{i+1}",
+                    "name": f"员工{i+1}",
+                    "email": f"employee{i+1}@example.com",
+                    "role": "employee"
+                }
+            )
+        
+        seen = []
+        params = {"limit": 2}
+        while True:
+            response = client.get("/api/employees/", params=params)
+            assert response.status_code == 200
+            seen.extend(emp["employee_id"] for emp in response.json())
+            next_cursor = response.headers.get("X-Next-Cursor")
+            if not next_cursor:
+                break
+            params = {"limit": 2, "cursor": next_cursor}
+        
+        assert seen == [f"EMP00{i+1}" for i in range(5)]
+    
+    def test_get_employees_invalid_cursor(self, client):
+        """测试非法游标"""
+        response = client.get("/api/employees/", params={"cursor": "not-a-cursor"})
+        assert response.status_code == 400
+    
+    def test_get_employees_etag(self, client):
+        """测试员工列表的 ETag 条件请求"""
+        created = client.post(
+            "/api/employees/",
+            json={"employee_id": "EMP001", "name": "张三", "email": "zhangsan@example.com"}
+        ).json()
+        
+        response = client.get("/api/employees/")
+        assert response.status_code == 200
+        assert response.headers["cache-control"] == "no-cache"
+        tag = response.headers["etag"]
+        
+        response = client.get("/api/employees/", headers={"If-None-Match": tag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == tag
+        
+        # 查询参数不同，ETag 不同
+        response = client.get("/api/employees/", params={"limit": 10}, headers={"If-None-Match": tag})
+        assert response.status_code == 200
+        
+        # 数据变化后旧 ETag 失效
+        client.put(f"/api/employees/{created['id']}", json={"name": "张三三"})
+        response = client.get("/api/employees/", headers={"If-None-Match": tag})
+        assert response.status_code == 200
+        assert response.headers["etag"] != tag
+        assert response.json()[0]["name"] == "张三三"
+    
+    def test_get_employees_trusted_read(self, client, db):
+        """测试可信读取路径的输出与按 schema 校验后的结果一致"""
+        for i in range(3):
+            client.post(
+                "/api/employees/",
+                json={"employee_id": f"EMP00{i}", "name": f"员工{i}", "email": f"emp{i}@example.com", "role": "employee"}
+            )
+        
+        response = client.get("/api/employees/")
+        assert response.status_code == 200
+        expected = [schemas.Employee.model_validate(employee).model_dump(mode="json") for employee in crud.get_employees(db)]
+        assert response.json() == expected
@@ -215,3 +215,121 @@ class TestIntegration:
         records_response = client.get(f"/api/attendance/records?employee_id={employee_id}")
         assert records_response.status_code == 200
         assert len(records_response.json()) == 2
+    
+    def test_db_pool_status(self, client):
+        """测试数据库连接池状态"""
+        response = client.get("/health/db")
+        assert response.status_code == 200
+        stats = response.json()["sync"]
+        assert "pool_class" in stats
+        if "checkouts" in stats:
+            assert stats["checked_out"] >= 0
+            assert stats["wait_seconds_max"] >= 0
+    
+    def test_init_db_upgrades_existing_tables(self, monkeypatch, tmp_path):
+        """测试 init_db 为旧版本建的表补上新增的列和索引，可重复执行"""
+        from sqlalchemy import create_engine, inspect, text
+        import database
+        
+        engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+        with engine.begin() as connection:
+            connection.execute(text(
+                "CREATE TABLE attendance_records (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "employee_id INTEGER NOT NULL, attendance_type VARCHAR(9) NOT NULL, timestamp DATETIME NOT NULL, "
+                "latitude VARCHAR(50), longitude VARCHAR(50), notes VARCHAR(500), created_at DATETIME)"
+            ))
+        monkeypatch.setattr(database, "engine", engine)
+        database.init_db()
+        database.init_db()
+        
+        inspector = inspect(engine)
+        assert "event_id" in {column["name"] for column in inspector.get_columns("attendance_records")}
+        indexes = {index["name"]: index for index in inspector.get_indexes("attendance_records")}
+        assert indexes["ix_attendance_records_employee_timestamp"]["column_names"] == ["employee_id", "timestamp"]
+        assert indexes["ix_attendance_records_timestamp"]["column_names"] == ["timestamp"]
+        assert indexes["ix_attendance_records_event_id"]["unique"]
+        assert inspector.has_table("daily_attendance_summary")
+        engine.dispose()
+    
+    def test_db_stats_headers(self, client, state_cache):
+        """测试每个请求返回 SQL 语句数和数据库耗时"""
+        response = client.post(
+            "/api/employees/",
+            json={
+                "employee_id": "EMP001",
+                "name": "张三",
+                "email": "zhangsan@example.com",
+                "role": "employee"
+            }
+        )
+        employee_id = response.json()["id"]
+        assert int(response.headers["X-DB-Statements"]) >= 3
+        assert float(response.headers["X-DB-Time-Ms"]) >= 0
+        
+        for _ in range(2):
+            response = client.get(f"/api/attendance/status/{employee_id}")
+        # 第二次命中缓存
+        assert response.headers["X-DB-Statements"] == "0"
+        
+        routes = client.get("/health/db/routes").json()
+        status_stats = routes["GET /api/attendance/status/{employee_id}"]
+        assert status_stats["requests"] == 2
+        # 员工和状态行一次查询
+        assert status_stats["max_statements"] == 1
+        assert routes["POST /api/employees/"]["requests"] == 1
+    
+    def test_metrics(self, client):
+        """测试 Prometheus 指标"""
+        response = client.post(
+            "/api/employees/",
+            json={
+                "employee_id": "EMP001",
+                "name": "张三",
+                "email": "zhangsan@example.com",
+                "role": "employee"
+            }
+        )
+        employee_id = response.json()["id"]
+        client.post("/api/attendance/check-in", params={"employee_id": employee_id})
+        client.post("/api/attendance/check-in", params={"employee_id": employee_id})
+        
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        text = response.text
+        assert 'http_requests_total{method="POST",route="/api/attendance/check-in",status="201"} 1' in text
+        assert 'http_requests_total{method="POST",route="/api/attendance/check-in",status="400"} 1' in text
+        assert 'http_request_duration_seconds_bucket{method="POST",route="/api/attendance/check-in",status="201",le="+Inf"} 1' in text
+        assert 'http_request_duration_seconds_count{method="POST",route="/api/attendance/check-in",status="201"} 1' in text
+        assert "http_requests_in_flight 1" in text
+        assert 'attendance_events_total{attendance_type="check_in"} 1' in text
+        assert 'db_statements_total{route="POST /api/attendance/check-in"}' in text
+    
+    async def test_metrics_exclude_event_streams(self, db):
+        """测试 SSE 长连接不计入处理中请求数和延迟直方图"""
+        import asyncio
+        from metrics import (
+            MetricsMiddleware, http_request_duration_seconds, http_requests_in_flight, http_requests_total
+        )
+        
+        release = asyncio.Event()
+        
+        async def stream_app(scope, receive, send):
+            await send({"type": "http.response.start", "status": 200,
+                        "headers": [(b"content-type", b"text/event-stream; charset=utf-8")]})
+            await release.wait()
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        
+        async def send(message):
+            pass
+        
+        scope = {"type": "http", "method": "GET", "path": "/api/attendance/stream"}
+        task = asyncio.create_task(MetricsMiddleware(stream_app)(scope, None, send))
+        await asyncio.sleep(0)
+        assert http_requests_in_flight.get() == 0
+        assert http_requests_total.get(("GET", "<unmatched>", "200")) == 1
+        release.set()
+        await task
+        assert http_requests_in_flight.get() == 0
+        assert http_requests_total.get(("GET", "<unmatched>", "200")) == 1
+        assert "GET" not in "".join(http_request_duration_seconds.render())
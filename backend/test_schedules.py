@@ -1,6 +1,10 @@
 import pytest
 from fastapi.testclient import TestClient
 from datetime import time
+import crud
+import models
+import schemas
+from cache import active_schedule_cache
 
 
 class TestWorkScheduleAPI:
@@ -178,3 +182,172 @@ class TestWorkScheduleAPI:
         )
         assert response.status_code == 200
         assert response.json()["is_active"] is False
+    
+    def test_active_schedule_cached(self, client, count_queries):
+        """测试当前工作时间命中缓存时不查询数据库"""
+        client.post(
+            "/api/schedules/",
+            json={"name": "标准工作时间", "check_in_time": "09:00:00", "check_out_time": "18:00:00"}
+        )
+        client.get("/api/schedules/active")
+        
+        with count_queries() as statements:
+            response = client.get("/api/schedules/active")
+        assert response.status_code == 200
+        assert response.json()["name"] == "标准工作时间"
+        assert statements == []
+    
+    def test_active_schedule_cache_invalidated_on_activate(self, client):
+        """测试激活其他工作时间后缓存失效"""
+        first = client.post(
+            "/api/schedules/",
+            json={"name": "早班", "check_in_time": "08:00:00", "check_out_time": "16:00:00"}
+        ).json()
+        second = client.post(
+            "/api/schedules/",
+            json={"name": "晚班", "check_in_time": "14:00:00", "check_out_time": "22:00:00"}
+        ).json()
+        
+        client.post(f"/api/schedules/{first['id']}/activate")
+        assert client.get("/api/schedules/active").json()["name"] == "早班"
+        
+        client.post(f"/api/schedules/{second['id']}/activate")
+        assert client.get("/api/schedules/active").json()["name"] == "晚班"
+    
+    def test_activate_missing_schedule_keeps_active(self, client):
+        """测试激活不存在的工作时间返回 404，当前激活的工作时间不受影响"""
+        client.post(
+            "/api/schedules/",
+            json={"name": "标准工作时间", "check_in_time": "09:00:00", "check_out_time": "18:00:00"}
+        )
+        response = client.post("/api/schedules/99999/activate")
+        assert response.status_code == 404
+        assert client.get("/api/schedules/active").json()["name"] == "标准工作时间"
+        assert len(client.get("/api/schedules/").json()) == 1
+    
+    def test_schedule_write_and_version_bump_are_atomic(self, client, db, monkeypatch):
+        """测试工作时间的修改与缓存版本号在同一个事务中提交：递增版本号失败时修改也不生效"""
+        schedule_id = client.post(
+            "/api/schedules/",
+            json={"name": "标准工作时间", "check_in_time": "09:00:00", "check_out_time": "18:00:00"}
+        ).json()["id"]
+        version = crud.get_cache_version(db, active_schedule_cache.name)
+        
+        def failing_increment(session, name):
+            raise RuntimeError("cache_versions unavailable")
+        
+        monkeypatch.setattr(crud, "_increment_cache_version", failing_increment)
+        with pytest.raises(RuntimeError):
+            client.put(f"/api/schedules/{schedule_id}", json={"name": "夏季工作时间"})
+        with pytest.raises(RuntimeError):
+            client.post(
+                "/api/schedules/",
+                json={"name": "晚班", "check_in_time": "14:00:00", "check_out_time": "22:00:00"}
+            )
+        
+        db.expire_all()
+        assert [schedule.name for schedule in db.query(models.WorkSchedule)] == ["标准工作时间"]
+        assert crud.get_cache_version(db, active_schedule_cache.name) == version
+    
+    def test_active_schedule_cache_detects_version_change(self, client, db, monkeypatch):
+        """测试其他进程修改后（版本号变化）重新加载"""
+        create_response = client.post(
+            "/api/schedules/",
+            json={"name": "标准工作时间", "check_in_time": "09:00:00", "check_out_time": "18:00:00"}
+        )
+        schedule_id = create_response.json()["id"]
+        assert client.get("/api/schedules/active").json()["name"] == "标准工作时间"
+        
+        # 模拟其他进程直接修改数据库并递增版本号
+        db.query(models.WorkSchedule).filter(models.WorkSchedule.id == schedule_id).update({"name": "夏季工作时间"})
+        db.commit()
+        crud.bump_cache_version(db, active_schedule_cache.name)
+        
+        # ttl 内仍使用本地缓存
+        assert client.get("/api/schedules/active").json()["name"] == "标准工作时间"
+        
+        monkeypatch.setattr(active_schedule_cache, "ttl", 0)
+        assert client.get("/api/schedules/active").json()["name"] == "夏季工作时间"
+    
+    def test_bump_cache_version_concurrent_create(self, db, monkeypatch):
+        """测试并发首次递增：版本行已被其他请求创建时改为递增，不影响同一事务中的写入"""
+        crud.bump_cache_version(db, "race")
+        assert crud.get_cache_version(db, "race") == 1
+        
+        # 模拟 UPDATE 时版本行尚不存在、INSERT 前被其他请求创建
+        increment = crud._increment_cache_version
+        calls = []
+        
+        def racing_increment(session, name):
+            calls.append(name)
+            return 0 if len(calls) == 1 else increment(session, name)
+        
+        monkeypatch.setattr(crud, "_increment_cache_version", racing_increment)
+        db.add(models.WorkSchedule(name="夜班", check_in_time=time(22, 0), check_out_time=time(6, 0)))
+        crud.bump_cache_version(db, "race")
+        
+        assert len(calls) == 2
+        assert crud.get_cache_version(db, "race") == 2
+        assert db.query(models.WorkSchedule).filter_by(name="夜班").count() == 1
+    
+    def test_work_schedules_etag(self, client):
+        """测试工作时间列表的 ETag 条件请求"""
+        first = client.post(
+            "/api/schedules/",
+            json={"name": "早班", "check_in_time": "08:00:00", "check_out_time": "16:00:00"}
+        ).json()
+        response = client.get("/api/schedules/")
+        tag = response.headers["etag"]
+        
+        response = client.get("/api/schedules/", headers={"If-None-Match": tag})
+        assert response.status_code == 304
+        
+        response = client.get("/api/schedules/", params={"active_only": False}, headers={"If-None-Match": tag})
+        assert response.status_code == 200
+        
+        client.post(
+            "/api/schedules/",
+            json={"name": "晚班", "check_in_time": "14:00:00", "check_out_time": "22:00:00"}
+        )
+        client.post(f"/api/schedules/{first['id']}/activate")
+        response = client.get("/api/schedules/", headers={"If-None-Match": tag})
+        assert response.status_code == 200
+        assert response.headers["etag"] != tag
+    
+    def test_active_schedule_etag(self, client, count_queries):
+        """测试当前工作时间的 ETag 条件请求（命中缓存时不查询数据库）"""
+        first = client.post(
+            "/api/schedules/",
+            json={"name": "早班", "check_in_time": "08:00:00", "check_out_time": "16:00:00"}
+        ).json()
+        second = client.post(
+            "/api/schedules/",
+            json={"name": "晚班", "check_in_time": "14:00:00", "check_out_time": "22:00:00"}
+        ).json()
+        client.post(f"/api/schedules/{first['id']}/activate")
+        tag = client.get("/api/schedules/active").headers["etag"]
+        
+        with count_queries() as statements:
+            response = client.get("/api/schedules/active", headers={"If-None-Match": tag})
+        assert response.status_code == 304
+        assert statements == []
+        
+        client.post(f"/api/schedules/{second['id']}/activate")
+        response = client.get("/api/schedules/active", headers={"If-None-Match": tag})
+        assert response.status_code == 200
+        assert response.json()["id"] == second["id"]
+    
+    def test_work_schedules_trusted_read(self, client, db):
+        """测试可信读取路径的输出与按 schema 校验后的结果一致"""
+        client.post(
+            "/api/schedules/",
+            json={"name": "标准工作时间", "check_in_time": "09:00:00", "check_out_time": "18:00:00"}
+        )
+        
+        response = client.get("/api/schedules/", params={"active_only": False})
+        assert response.status_code == 200
+        expected = [
+            schemas.WorkSchedule.model_validate(schedule).model_dump(mode="json")
+            for schedule in crud.get_work_schedules(db, active_only=False)
+        ]
+        assert response.json() == expected
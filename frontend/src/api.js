@@ -24,11 +24,14 @@ export const attendanceAPI = {
     params: { employee_id: employeeId, ...data }
   }),
   getRecords: (params = {}) => api.get('/attendance/records', { params }),
-  getMonthly: (year, month, employeeId = null) => {
-    const params = employeeId ? { employee_id: employeeId } : {}
+  getMonthly: (year, month, employeeId = null, includeRecords = true, compact = false) => {
+    const params = { include_records: includeRecords, compact }
+    if (employeeId) params.employee_id = employeeId
     return api.get(`/attendance/monthly/${year}/${month}`, { params })
   },
-  getStatus: (employeeId) => api.get(`/attendance/status/${employeeId}`)
+  getStatus: (employeeId) => api.get(`/attendance/status/${employeeId}`),
+  // 订阅实时考勤事件（Server-Sent Events），断线后浏览器自动重连
+  subscribe: () => new EventSource(`${api.defaults.baseURL}/attendance/stream`)
 }
 
 // 工作时间相关